@@ -0,0 +1,99 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+
+def _shared_key(key):
+    """Ключ общего кэша: сам токен в кэш не попадает"""
+    return 'auth_token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+class TokenCache:
+    """Токены с пользователями: LRU в памяти процесса и общий кэш.
+
+    Запись в памяти живёт AUTH_TOKEN_CACHE_TTL секунд - это предел, за
+    который удаление токена в другом процессе доходит до этого. Общий
+    кэш (AUTH_TOKEN_SHARED_CACHE_TTL > 0) избавляет новые процессы от
+    запроса к базе и очищается при инвалидации сразу.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                token, expires = entry
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    return token
+                del self._entries[key]
+        if settings.AUTH_TOKEN_SHARED_CACHE_TTL > 0:
+            token = cache.get(_shared_key(key))
+            if token is not None:
+                self._remember(key, token)
+            return token
+        return None
+
+    def _remember(self, key, token):
+        expires = time.monotonic() + settings.AUTH_TOKEN_CACHE_TTL
+        with self._lock:
+            self._entries[key] = (token, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.AUTH_TOKEN_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def set(self, key, token):
+        if settings.AUTH_TOKEN_CACHE_TTL > 0:
+            self._remember(key, token)
+        if settings.AUTH_TOKEN_SHARED_CACHE_TTL > 0:
+            cache.set(
+                _shared_key(key), token, settings.AUTH_TOKEN_SHARED_CACHE_TTL
+            )
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+        if settings.AUTH_TOKEN_SHARED_CACHE_TTL > 0 and keys:
+            cache.delete_many([_shared_key(key) for key in keys])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса к базе на каждый запрос.
+
+    Каждый запрос получает свои копии токена и пользователя, чтобы
+    изменения request.user не попадали в кэш.
+    """
+
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key)
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, token)
+        elif not token.user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+        user = copy.copy(token.user)
+        token = copy.copy(token)
+        token.user = user
+        return user, token
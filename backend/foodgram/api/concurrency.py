@@ -0,0 +1,86 @@
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import prefetch_related_objects
+
+from api.querylog import collect_queries
+
+_executor = None
+_local = threading.local()
+
+
+def get_executor():
+    """Пул потоков для параллельных запросов к базе, общий для процесса"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.ASYNC_QUERY_WORKERS,
+            thread_name_prefix='query',
+        )
+    return _executor
+
+
+def concurrency_enabled():
+    """Параллельные запросы включены и возможны в текущем потоке.
+
+    Внутри транзакции запросы выполняются последовательно: другие
+    соединения не видят её изменений.
+    """
+    return (
+        settings.ASYNC_VIEWS
+        and not getattr(_local, 'in_worker', False)
+        and not connection.in_atomic_block
+    )
+
+
+def _logged(function):
+    with collect_queries():
+        return function()
+
+
+def _run_in_worker(context, function):
+    _local.in_worker = True
+    close_old_connections()
+    try:
+        return context.run(_logged, function)
+    finally:
+        close_old_connections()
+
+
+def run_concurrently(*functions):
+    """Результаты функций без аргументов в том же порядке.
+
+    При ASYNC_VIEWS все функции, кроме первой, выполняются в пуле потоков
+    со своими соединениями с базой, первая - в текущем потоке.
+    """
+    if len(functions) < 2 or not concurrency_enabled():
+        return [function() for function in functions]
+    futures = [
+        get_executor().submit(
+            _run_in_worker, contextvars.copy_context(), function
+        )
+        for function in functions[1:]
+    ]
+    first = functions[0]()
+    return [first, *(future.result() for future in futures)]
+
+
+def prefetch_concurrently(instances, lookups):
+    """prefetch_related для готового списка объектов.
+
+    Lookups не должны пересекаться по пути: каждый загружается отдельно.
+    """
+    if not instances or not lookups:
+        return
+    for instance in instances:
+        # Кэш создаётся заранее, потоки пишут в него разные ключи.
+        if not hasattr(instance, '_prefetched_objects_cache'):
+            instance._prefetched_objects_cache = {}
+    run_concurrently(*(
+        partial(prefetch_related_objects, instances, lookup)
+        for lookup in lookups
+    ))
@@ -1,5 +1,20 @@
-from rest_framework.filters import SearchFilter
+from rest_framework.filters import OrderingFilter
 
 
-class IngredientSearchFilter(SearchFilter):
-    search_param = "name"
+class RecipeOrderingFilter(OrderingFilter):
+    """Сортировка рецептов с id в конце для стабильного порядка страниц.
+
+    При поиске по умолчанию рецепты идут по релевантности.
+    """
+
+    def get_default_ordering(self, view):
+        ordering = super().get_default_ordering(view)
+        if ordering and view.request.query_params.get('search'):
+            ordering = ('-search_rank', *ordering)
+        return ordering
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if ordering is not None and ordering[-1].lstrip('-') != 'id':
+            ordering = (*ordering, '-id')
+        return ordering
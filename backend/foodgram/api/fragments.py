@@ -0,0 +1,139 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.exceptions import NotFound
+
+from api.fast_serializers import (RecipeFastSerializer, datetime_field,
+                                  ordering_columns)
+from api.replicas import primary_reads
+from api.serializers import RecipeSerializer
+from recipes.models import Recipe
+from recipes.versions import get_versions
+
+# Части рецепта, одинаковые для всех пользователей. Признак подписки
+# на автора хранится пустым и подставляется при каждом запросе.
+FRAGMENT_FIELDS = (
+    'id', 'tags', 'author', 'ingredients', 'image', 'image_variants',
+    'name', 'text', 'cooking_time',
+)
+
+# Поля строки рецепта, которые не кэшируются: они меняются часто.
+ROW_FIELDS = ('favorites_count', 'carts_count')
+
+# Без связанных объектов колонки дешевле прочитать из базы, чем
+# распаковывать из кэша целые фрагменты.
+RELATED_FIELDS = {'tags', 'author', 'ingredients'}
+
+
+def uses_fragments(fields):
+    return settings.RECIPE_FRAGMENT_CACHE and bool(
+        RELATED_FIELDS.intersection(fields)
+    )
+
+
+def fragment_names(recipe_id):
+    """Версии, от которых зависит общая часть рецепта.
+
+    Изменение автора меняет версии всех его рецептов (author_changed).
+    """
+    return ('tag', 'ingredient', f'recipe:{recipe_id}')
+
+
+def build_fragments(recipe_ids, request):
+    """Общие части рецептов {id: представление}, три запроса.
+
+    Читаются из основной базы: фрагмент кэшируется под текущей версией.
+    """
+    with primary_reads():
+        rows = [
+            dict(row, author_is_subscribed=None)
+            for row in RecipeFastSerializer.values(
+                Recipe.objects.filter(id__in=recipe_ids), FRAGMENT_FIELDS
+            )
+        ]
+        data = RecipeFastSerializer(
+            rows, many=True, context={'request': request},
+            selected_fields=FRAGMENT_FIELDS,
+        ).data
+    return {fragment['id']: fragment for fragment in data}
+
+
+def get_fragments(recipe_ids, request):
+    """Общие части рецептов из кэша, недостающие собираются и кэшируются.
+
+    Ссылки на картинки абсолютные, поэтому ключ зависит и от хоста.
+    """
+    host = request.build_absolute_uri('/') if request is not None else ''
+    versions = get_versions({
+        name for pk in recipe_ids for name in fragment_names(pk)
+    })
+    keys = {
+        pk: 'recipe_fragment:{}:{}'.format(pk, hashlib.sha1(repr((
+            host, [versions[name][0] for name in fragment_names(pk)]
+        )).encode('utf-8')).hexdigest())
+        for pk in recipe_ids
+    }
+    cached = cache.get_many(list(keys.values()))
+    fragments = {pk: cached[key] for pk, key in keys.items() if key in cached}
+    missing = [pk for pk in recipe_ids if pk not in fragments]
+    if missing:
+        built = build_fragments(missing, request)
+        cache.set_many(
+            {keys[pk]: fragment for pk, fragment in built.items()},
+            settings.RECIPE_FRAGMENT_TIMEOUT,
+        )
+        fragments.update(built)
+    return fragments
+
+
+class RecipeCachedSerializer(RecipeFastSerializer):
+    """RecipeFastSerializer с кэшем общей части рецептов.
+
+    Страница читается одним лёгким запросом (id, признаки пользователя,
+    счётчики), общие части берутся из кэша одним get_many, признаки
+    пользователя накладываются поверх. Без тегов, автора и ингредиентов
+    в ответе и при выключенном RECIPE_FRAGMENT_CACHE работает как
+    RecipeFastSerializer.
+    """
+
+    @staticmethod
+    def values(queryset, fields=None):
+        if fields is None:
+            fields = RecipeSerializer.default_fields()
+        if not uses_fragments(fields):
+            return RecipeFastSerializer.values(queryset, fields)
+        columns = ['id', 'pub_date', *ordering_columns(queryset)]
+        columns.extend(name for name in ROW_FIELDS if name in fields)
+        columns.extend(queryset.query.annotation_select)
+        return queryset.values(*dict.fromkeys(columns))
+
+    def overlay(self, row, fragment):
+        data = {}
+        for name in self.fields:
+            if name == 'author':
+                data[name] = dict(
+                    fragment[name], is_subscribed=row['author_is_subscribed']
+                )
+            elif name in FRAGMENT_FIELDS and name != 'id':
+                data[name] = fragment[name]
+            elif name == 'pub_date':
+                data[name] = datetime_field.to_representation(row[name])
+            else:
+                data[name] = row[name]
+        return data
+
+    @property
+    def data(self):
+        if not uses_fragments(self.fields):
+            return super().data
+        rows = list(self.instance) if self.many else [self.instance]
+        fragments = get_fragments(
+            [row['id'] for row in rows], self.context.get('request')
+        )
+        # Рецепт мог быть удалён между запросами.
+        rows = [row for row in rows if row['id'] in fragments]
+        if not rows and not self.many:
+            raise NotFound
+        data = [self.overlay(row, fragments.get(row['id'])) for row in rows]
+        return data if self.many else data[0]
@@ -0,0 +1,180 @@
+import http.client
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import CommandError
+from rest_framework.authtoken.models import Token
+
+from api.management.commands.run_benchmark import BENCHMARK_DIR
+from api.management.commands.run_benchmark import Command as BenchmarkCommand
+from api.management.commands.run_benchmark import scenarios
+from api.querylog import percentile
+
+# Текущее развёртывание из Dockerfile и профиль с воркерами uvicorn.
+PROFILES = {
+    'wsgi': ('foodgram.wsgi:application', ()),
+    'asgi': ('foodgram.asgi:application', ('-c', 'gunicorn_asgi.py')),
+}
+
+STARTUP_TIMEOUT = 30
+
+
+class Command(BenchmarkCommand):
+    help = (
+        'Сравнение gunicorn с синхронными воркерами и с воркерами uvicorn '
+        'под параллельной нагрузкой на наборе seed_benchmark'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--profiles', nargs='*', choices=PROFILES, default=list(PROFILES),
+        )
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument(
+            '--concurrency', type=int, default=64,
+            help='Число одновременных клиентов',
+        )
+        parser.add_argument(
+            '--requests', type=int, default=1000,
+            help='Запросов на сценарий',
+        )
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument(
+            '--only', nargs='*',
+            help='Запустить только перечисленные сценарии',
+        )
+        parser.add_argument(
+            '--output', default=os.path.join(BENCHMARK_DIR, 'servers.json'),
+            help='Куда записать результаты',
+        )
+
+    def start_server(self, profile, options):
+        application, arguments = PROFILES[profile]
+        process = subprocess.Popen(
+            [
+                sys.executable, '-m', 'gunicorn', application, *arguments,
+                '--bind', f"127.0.0.1:{options['port']}",
+                '--workers', str(options['workers']),
+            ],
+            cwd=settings.BASE_DIR,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            try:
+                status, _ = self.fetch(options['port'], '/api/tags/', {})
+                if status == 200:
+                    return process
+            except OSError:
+                pass
+            time.sleep(0.2)
+        self.stop_server(process)
+        raise CommandError(f'Сервер {profile} не запустился')
+
+    @staticmethod
+    def stop_server(process):
+        process.terminate()
+        try:
+            process.wait(timeout=STARTUP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    @staticmethod
+    def fetch(port, path, headers, connection=None):
+        connection = connection or http.client.HTTPConnection(
+            '127.0.0.1', port, timeout=STARTUP_TIMEOUT
+        )
+        connection.request('GET', path, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        return response.status, connection
+
+    def load(self, port, path, headers, options):
+        """Запросы к path с concurrency клиентов, у каждого свое соединение"""
+        local = threading.local()
+
+        def request(_):
+            started = time.perf_counter()
+            try:
+                status, local.connection = self.fetch(
+                    port, path, headers, getattr(local, 'connection', None)
+                )
+            except (OSError, http.client.HTTPException):
+                local.connection = None
+                status = None
+            return status, (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            results = list(pool.map(request, range(options['requests'])))
+        elapsed = time.perf_counter() - started
+        timings = [timing for _, timing in results]
+        return {
+            'rps': round(len(results) / elapsed, 1),
+            'p50': round(percentile(timings, 0.5), 3),
+            'p95': round(percentile(timings, 0.95), 3),
+            'p99': round(percentile(timings, 0.99), 3),
+            'errors': sum(status != 200 for status, _ in results),
+        }
+
+    def get_headers(self, user):
+        if user is None:
+            return {}
+        token, _ = Token.objects.get_or_create(user=user)
+        return {'Authorization': f'Token {token.key}'}
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError(
+                '--requests и --concurrency должны быть больше нуля.'
+            )
+        context = self.get_context()
+        selected = [
+            scenario for scenario in scenarios(context)
+            if not scenario.cold
+            and (not options['only'] or scenario.name in options['only'])
+        ]
+        results = {
+            'meta': {
+                'workers': options['workers'],
+                'concurrency': options['concurrency'],
+                'requests': options['requests'],
+                'dataset': self.dataset(),
+            },
+            'profiles': {},
+        }
+        for profile in options['profiles']:
+            process = self.start_server(profile, options)
+            try:
+                results['profiles'][profile] = {
+                    scenario.name: self.load(
+                        options['port'], scenario.path,
+                        self.get_headers(context['users'].get(scenario.user)),
+                        options,
+                    )
+                    for scenario in selected
+                }
+            finally:
+                self.stop_server(process)
+        self.report(results, selected)
+        self.save(options['output'], results)
+
+    def report(self, results, selected):
+        for scenario in selected:
+            for profile, measured in results['profiles'].items():
+                result = measured[scenario.name]
+                self.stdout.write(
+                    f'{scenario.name:<28} {profile:<5} '
+                    f"{result['rps']:8.1f} запр/с  "
+                    f"p50 {result['p50']:8.2f} мс  "
+                    f"p99 {result['p99']:8.2f} мс  "
+                    f"ошибок {result['errors']}"
+                )
+        self.stdout.write(json.dumps(results['meta'], ensure_ascii=False))
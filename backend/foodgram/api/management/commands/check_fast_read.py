@@ -0,0 +1,102 @@
+from django.core.management.base import CommandError
+from django.test.utils import override_settings
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+
+from api.management.commands.run_benchmark import Command as BenchmarkCommand
+from api.renderers import FastJSONRenderer
+from recipes.models import Recipe
+
+# Строки, на которых orjson и json расходятся чаще всего.
+RENDERER_SAMPLES = (
+    {'text': 'Щи да каша', 'emoji': '🍲', 'quote': '"\\/\t'},
+    [None, True, False, 0, -1, 2 ** 53, '', {'nested': [1, {'a': 'б'}]}],
+    {'lazy': gettext_lazy('Invalid token.'), 1: 'int key'},
+)
+
+
+def paths(context, recipe_ids):
+    tags = '&'.join(f'tags={slug}' for slug in context['tags'])
+    yield '/api/recipes/?limit=6'
+    yield '/api/recipes/?limit=50&page=2'
+    yield f'/api/recipes/?limit=20&{tags}'
+    yield f'/api/recipes/?limit=20&tags_mode=all&{tags}'
+    yield '/api/recipes/?limit=20&ordering=-favorites_count'
+    yield f"/api/recipes/?limit=20&search={context['word']}"
+    yield '/api/recipes/?limit=20&is_favorited=1'
+    yield '/api/recipes/?limit=20&is_in_shopping_cart=1'
+    yield '/api/recipes/?limit=20&pagination=cursor'
+    yield '/api/recipes/?limit=20&pagination=cursor&ordering=-favorites_count'
+    yield '/api/recipes/?limit=20&pagination=cursor&ordering=carts_count'
+    yield (
+        '/api/recipes/?limit=20&pagination=cursor&ordering=-favorites_count'
+        '&fields=id,name'
+    )
+    yield '/api/recipes/feed/?limit=20'
+    yield '/api/recipes/?limit=20&fields=id,name,image,tags'
+    yield '/api/recipes/?limit=20&omit=text,ingredients,is_favorited'
+    yield '/api/recipes/?limit=20&expand=favorites_count,carts_count,pub_date'
+    yield '/api/recipes/feed/?limit=20&fields=id,author&expand=pub_date'
+    for recipe_id in recipe_ids:
+        yield f'/api/recipes/{recipe_id}/'
+        yield f'/api/recipes/{recipe_id}/?omit=author,tags'
+
+
+class Command(BenchmarkCommand):
+    help = (
+        'Проверка, что быстрый путь чтения рецептов (FAST_READ_PATH) отдаёт '
+        'те же байты, что сериализаторы DRF и JSONRenderer'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes', type=int, default=50,
+            help='Сколько рецептов проверить по одному',
+        )
+
+    def check_renderer(self):
+        problems = []
+        for sample in RENDERER_SAMPLES:
+            expected = JSONRenderer().render(sample)
+            actual = FastJSONRenderer().render(sample)
+            if actual != expected:
+                problems.append(f'рендерер: {expected!r} != {actual!r}')
+        return problems
+
+    def check_paths(self, client, user, recipe_ids, context):
+        problems = []
+        for path in paths(context, recipe_ids):
+            if user is None and '/feed/' in path:
+                continue
+            with override_settings(FAST_READ_PATH=False):
+                expected = client.get(path)
+            # Повторный ответ собирается из кэша фрагментов рецептов.
+            for attempt in ('первый', 'повторный'):
+                actual = client.get(path)
+                if actual.status_code != expected.status_code:
+                    problems.append(
+                        f'{user} {path} ({attempt}): статус '
+                        f'{expected.status_code} -> {actual.status_code}'
+                    )
+                elif actual.content != expected.content:
+                    problems.append(
+                        f'{user} {path} ({attempt}): ответы отличаются'
+                    )
+        return problems
+
+    def handle(self, *args, **options):
+        context = self.get_context()
+        recipe_ids = list(Recipe.objects.order_by('?').values_list(
+            'id', flat=True
+        )[:options['recipes']])
+        problems = self.check_renderer()
+        for user in (None, *context['users'].values()):
+            problems += self.check_paths(
+                self.get_client(user), user, recipe_ids, context
+            )
+        if problems:
+            raise CommandError(
+                'Быстрый путь расходится с сериализаторами:\n'
+                + '\n'.join(problems)
+            )
+        self.stdout.write(self.style.SUCCESS('Ответы совпадают'))
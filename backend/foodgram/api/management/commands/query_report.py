@@ -0,0 +1,96 @@
+import json
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.querylog import percentile
+
+SORT_KEYS = {
+    'total': lambda stat: stat['total'],
+    'count': lambda stat: stat['count'],
+    'p95': lambda stat: stat['p95'],
+}
+
+
+def read_log(path):
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def aggregate(records, view=None):
+    """Статистика по парам (представление, отпечаток)"""
+    durations = defaultdict(list)
+    requests = defaultdict(int)
+    n_plus_one = defaultdict(int)
+    origins = {}
+    for record in records:
+        if view and view not in record['view']:
+            continue
+        for query in record['queries']:
+            key = (record['view'], query['fingerprint'])
+            durations[key].extend(query['durations'])
+            requests[key] += 1
+            n_plus_one[key] += query['n_plus_one']
+            origins.setdefault(key, query['origin'])
+    return [
+        {
+            'view': key[0],
+            'fingerprint': key[1],
+            'count': len(values),
+            'requests': requests[key],
+            'per_request': len(values) / requests[key],
+            'total': sum(values),
+            'p95': percentile(values, 0.95),
+            'n_plus_one': n_plus_one[key],
+            'origin': origins[key],
+        }
+        for key, values in durations.items()
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Самые тяжёлые SQL-запросы из журнала QueryLogMiddleware'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path', default=settings.QUERY_LOG_PATH,
+            help='Файл журнала',
+        )
+        parser.add_argument(
+            '--top', type=int, default=20,
+            help='Сколько отпечатков показать',
+        )
+        parser.add_argument(
+            '--sort', choices=SORT_KEYS, default='total',
+            help='Поле сортировки',
+        )
+        parser.add_argument(
+            '--view',
+            help='Только представления, содержащие эту строку',
+        )
+        parser.add_argument(
+            '--width', type=int, default=120,
+            help='Сколько символов запроса выводить',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            stats = aggregate(read_log(options['path']), options['view'])
+        except OSError as error:
+            raise CommandError(f'Не удалось прочитать журнал: {error}')
+        except (json.JSONDecodeError, KeyError) as error:
+            raise CommandError(f'Повреждённый журнал: {error!r}')
+        stats.sort(key=SORT_KEYS[options['sort']], reverse=True)
+        for stat in stats[:options['top']]:
+            flag = ' N+1' if stat['n_plus_one'] else ''
+            self.stdout.write(
+                f"{stat['view']}{flag}\n"
+                f"  {stat['count']} запросов "
+                f"({stat['per_request']:.1f} на HTTP-запрос), "
+                f"всего {stat['total']:.1f} мс, p95 {stat['p95']:.2f} мс\n"
+                f"  {stat['origin'] or '-'}\n"
+                f"  {stat['fingerprint'][:options['width']]}"
+            )
@@ -0,0 +1,320 @@
+import gc
+import json
+import os
+import platform
+import time
+from collections import namedtuple
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.querylog import percentile
+from recipes.models import Ingredient, IngredientInRecipe, Recipe, Tag
+from users.models import User
+
+BENCHMARK_DIR = os.path.join(settings.BASE_DIR, 'benchmarks')
+
+Scenario = namedtuple('Scenario', ('name', 'path', 'user', 'cold'))
+
+# Число запросов страницы не должно зависеть от её размера.
+SAME_QUERIES = (
+    ('recipe_list', 'recipe_list_50'),
+)
+
+
+def scenarios(context):
+    tags = '&'.join(f'tags={slug}' for slug in context['tags'])
+    return (
+        Scenario('recipe_list', '/api/recipes/?limit=6', 'reader', False),
+        Scenario('recipe_list_50', '/api/recipes/?limit=50', 'reader', False),
+        Scenario(
+            'recipe_list_anonymous', '/api/recipes/?limit=6', None, False
+        ),
+        Scenario(
+            'recipe_list_cards',
+            '/api/recipes/?limit=50&fields=id,name,image,cooking_time',
+            'reader', False,
+        ),
+        Scenario(
+            'recipe_list_filtered',
+            f'/api/recipes/?limit=6&is_favorited=1&{tags}',
+            'reader', False,
+        ),
+        Scenario(
+            'recipe_list_tags_all',
+            f'/api/recipes/?limit=6&tags_mode=all&{tags}',
+            'reader', False,
+        ),
+        Scenario(
+            'recipe_list_popular',
+            '/api/recipes/?limit=6&ordering=-favorites_count',
+            'reader', False,
+        ),
+        Scenario(
+            'recipe_search',
+            f"/api/recipes/?limit=6&search={quote(context['word'])}",
+            'reader', False,
+        ),
+        Scenario(
+            'recipe_match',
+            f"/api/recipes/match/?ingredients={context['pantry']}",
+            'reader', False,
+        ),
+        Scenario(
+            'recipe_detail', f"/api/recipes/{context['recipe']}/",
+            'reader', False,
+        ),
+        Scenario(
+            'recipe_similar', f"/api/recipes/{context['recipe']}/similar/",
+            None, False,
+        ),
+        Scenario(
+            'recipe_recommended', '/api/recipes/recommended/',
+            'reader', False,
+        ),
+        Scenario('feed', '/api/recipes/feed/?limit=6', 'reader', False),
+        Scenario(
+            'subscriptions',
+            '/api/users/subscriptions/?limit=6&recipes_limit=3',
+            'reader', False,
+        ),
+        Scenario(
+            'download_shopping_cart',
+            '/api/recipes/download_shopping_cart/',
+            'shopper', True,
+        ),
+        Scenario(
+            'shopping_list', '/api/recipes/shopping_list/', 'shopper', False,
+        ),
+        Scenario(
+            'ingredient_search_prefix',
+            f"/api/ingredients/?name={quote(context['prefix'])}", None, False,
+        ),
+        Scenario(
+            'ingredient_search_fuzzy',
+            f"/api/ingredients/?name={quote(context['typo'])}", None, False,
+        ),
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Замер задержек и числа запросов основных эндпоинтов '
+        'на наборе seed_benchmark'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument(
+            '--output', default=os.path.join(BENCHMARK_DIR, 'latest.json'),
+            help='Куда записать результаты',
+        )
+        parser.add_argument(
+            '--baseline',
+            default=os.path.join(BENCHMARK_DIR, 'baseline.json'),
+            help='Результаты, с которыми сравнивать',
+        )
+        parser.add_argument(
+            '--metric', choices=('p50', 'p95'), default='p50',
+            help='Перцентиль, по которому ищутся регрессии задержки',
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.5,
+            help='Допустимый относительный рост задержки',
+        )
+        parser.add_argument(
+            '--slack-ms', type=float, default=2.0,
+            help='Допустимый абсолютный рост задержки в миллисекундах',
+        )
+        parser.add_argument(
+            '--update-baseline', action='store_true',
+            help='Сохранить результаты как новую базовую линию',
+        )
+        parser.add_argument(
+            '--only', nargs='*',
+            help='Запустить только перечисленные сценарии',
+        )
+
+    def get_context(self):
+        """Пользователи и объекты для сценариев"""
+        reader = User.objects.annotate(
+            subscriptions=Count('subscriber')
+        ).order_by('-subscriptions', 'id').first()
+        shopper = User.objects.annotate(
+            purchases=Count('cart')
+        ).order_by('-purchases', 'id').first()
+        recipe = Recipe.objects.order_by('-favorites_count', 'id').first()
+        ingredient = Ingredient.objects.order_by('id').first()
+        if not (reader and shopper and recipe and ingredient):
+            raise CommandError('База пуста, сначала запустите seed_benchmark.')
+        name = ingredient.name
+        pantry = IngredientInRecipe.objects.values('ingredient_id').annotate(
+            uses=Count('id')
+        ).order_by('-uses', 'ingredient_id').values_list(
+            'ingredient_id', flat=True
+        )[:20]
+        return {
+            'users': {'reader': reader, 'shopper': shopper},
+            'recipe': recipe.pk,
+            'tags': list(
+                Tag.objects.order_by('id').values_list('slug', flat=True)[:2]
+            ),
+            'word': name.split()[0],
+            'pantry': ','.join(str(pk) for pk in pantry),
+            'prefix': name[:3],
+            'typo': name[:2] + name[3:8] if len(name) > 4 else name,
+        }
+
+    @staticmethod
+    def get_client(user):
+        client = APIClient()
+        if user is not None:
+            token, _ = Token.objects.get_or_create(user=user)
+            client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client
+
+    @staticmethod
+    def request(client, scenario):
+        if scenario.cold:
+            cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = client.get(scenario.path)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = (time.perf_counter() - started) * 1000
+        return response.status_code, elapsed, len(queries)
+
+    def measure(self, scenario, client, options):
+        """Прогон сценария со сборщиком мусора, отключённым на время замеров"""
+        for _ in range(options['warmup']):
+            self.request(client, scenario)
+        timings = []
+        query_counts = set()
+        statuses = set()
+        gc.collect()
+        gc.disable()
+        try:
+            for _ in range(options['iterations']):
+                status, elapsed, queries = self.request(client, scenario)
+                timings.append(elapsed)
+                query_counts.add(queries)
+                statuses.add(status)
+        finally:
+            gc.enable()
+        return {
+            'path': scenario.path,
+            'status': max(statuses),
+            'p50': round(percentile(timings, 0.5), 3),
+            'p95': round(percentile(timings, 0.95), 3),
+            'max': round(max(timings), 3),
+            'queries': max(query_counts),
+        }
+
+    @staticmethod
+    def dataset():
+        return {
+            'users': User.objects.count(),
+            'recipes': Recipe.objects.count(),
+            'ingredients': Ingredient.objects.count(),
+        }
+
+    def compare(self, results, baseline, options):
+        """Список регрессий относительно базовой линии"""
+        problems = []
+        for name, result in results['scenarios'].items():
+            if result['status'] != 200:
+                problems.append(f"{name}: статус {result['status']}")
+            base = baseline.get('scenarios', {}).get(name)
+            if base is None:
+                continue
+            if result['queries'] > base['queries']:
+                problems.append(
+                    f"{name}: запросов {base['queries']} -> "
+                    f"{result['queries']}"
+                )
+            metric = options['metric']
+            limit = base[metric] * (1 + options['tolerance'])
+            limit += options['slack_ms']
+            if result[metric] > limit:
+                problems.append(
+                    f"{name}: {metric} {base[metric]:.2f} -> "
+                    f"{result[metric]:.2f} мс"
+                )
+        for first, second in SAME_QUERIES:
+            first = results['scenarios'].get(first)
+            second = results['scenarios'].get(second)
+            if first and second and first['queries'] != second['queries']:
+                problems.append(
+                    f"{first['path']} и {second['path']}: "
+                    f"{first['queries']} и {second['queries']} запросов"
+                )
+        return problems
+
+    def load_baseline(self, path):
+        try:
+            with open(path, encoding='utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            self.stdout.write(self.style.WARNING(
+                f'Базовая линия {path} не найдена, сравнение пропущено'
+            ))
+            return {}
+
+    @staticmethod
+    def save(path, results):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+            file.write('\n')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations должен быть больше нуля.')
+        context = self.get_context()
+        results = {
+            'meta': {
+                'python': platform.python_version(),
+                'database': connection.vendor,
+                'iterations': options['iterations'],
+                'dataset': self.dataset(),
+            },
+            'scenarios': {},
+        }
+        for scenario in scenarios(context):
+            if options['only'] and scenario.name not in options['only']:
+                continue
+            client = self.get_client(context['users'].get(scenario.user))
+            result = self.measure(scenario, client, options)
+            results['scenarios'][scenario.name] = result
+            self.stdout.write(
+                f"{scenario.name:<28} p50 {result['p50']:8.2f} мс  "
+                f"p95 {result['p95']:8.2f} мс  "
+                f"запросов {result['queries']:>3}"
+            )
+        self.save(options['output'], results)
+        if options['update_baseline']:
+            self.save(options['baseline'], results)
+            self.stdout.write(self.style.SUCCESS('Базовая линия обновлена'))
+            return
+        baseline = self.load_baseline(options['baseline'])
+        if baseline.get('meta', {}).get('dataset') not in (
+            None, results['meta']['dataset']
+        ):
+            self.stdout.write(self.style.WARNING(
+                'Набор данных отличается от базовой линии'
+            ))
+        problems = self.compare(results, baseline, options)
+        if problems:
+            raise CommandError(
+                'Регрессии производительности:\n' + '\n'.join(problems)
+            )
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
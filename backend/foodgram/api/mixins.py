@@ -0,0 +1,185 @@
+import hashlib
+from functools import update_wrapper
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+from api.querylog import collect_queries
+from api.replicas import primary_reads, recently_modified
+from recipes.versions import get_versions
+
+
+class ConditionalGetMixin:
+    """Условные GET-запросы для list и retrieve.
+
+    ETag и Last-Modified считаются по счётчикам версий в кэше, поэтому
+    ответ 304 отдаётся без запросов к базе и без сериализации. Выключается
+    настройкой CONDITIONAL_GET.
+    """
+
+    def get_version_names(self):
+        """Имена версий данных ответа или None, если кэшировать нельзя"""
+        return None
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        names = self.get_version_names() if settings.CONDITIONAL_GET else None
+        if names is None:
+            return handler(request, *args, **kwargs)
+        versions = get_versions(names)
+        etag = '"{}"'.format(hashlib.sha1(repr((
+            request.get_full_path(),
+            request.accepted_renderer.format,
+            sorted(versions.items()),
+        )).encode('utf-8')).hexdigest())
+        last_modified = int(max(
+            modified for _, modified in versions.values()
+        ))
+        if self.is_not_modified(request, etag, last_modified):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        elif recently_modified(versions):
+            # Ответ получит ETag новой версии и не должен прийти с реплики.
+            with primary_reads():
+                response = handler(request, *args, **kwargs)
+        else:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    @staticmethod
+    def is_not_modified(request, etag, last_modified):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            etags = parse_etags(if_none_match)
+            return '*' in etags or etag in etags
+        if_modified_since = parse_http_date_safe(
+            request.META.get('HTTP_IF_MODIFIED_SINCE', '')
+        )
+        return (
+            if_modified_since is not None
+            and last_modified <= if_modified_since
+        )
+
+
+class FastReadMixin:
+    """Чтение через fast_serializer_class в действиях fast_actions.
+
+    Такой сериализатор получает строки fast_serializer_class.values()
+    вместо объектов моделей. Выключается настройкой FAST_READ_PATH.
+    """
+    fast_serializer_class = None
+    fast_actions = ('list', 'retrieve')
+
+    def use_fast_path(self):
+        return (
+            settings.FAST_READ_PATH
+            and self.fast_serializer_class is not None
+            and self.action in self.fast_actions
+        )
+
+    def get_serializer_class(self):
+        if self.use_fast_path():
+            return self.fast_serializer_class
+        return super().get_serializer_class()
+
+
+def _names(params, name):
+    return [
+        value.strip()
+        for param in params.getlist(name)
+        for value in param.split(',') if value.strip()
+    ]
+
+
+class SparseFieldsMixin:
+    """Выбор полей ответа параметрами fields, omit и expand.
+
+    fields оставляет только перечисленные поля, omit убирает поля,
+    expand добавляет необязательные (Meta.expandable_fields). Сериалайзер
+    должен принимать selected_fields, как DynamicFieldsMixin; по выбранным
+    полям представление урезает queryset.
+    """
+    sparse_actions = ('list', 'retrieve')
+
+    def get_selected_fields(self, serializer_class=None):
+        """Поля ответа по порядку Meta.fields или None вне sparse_actions"""
+        if self.action not in self.sparse_actions:
+            return None
+        serializer_class = serializer_class or self.serializer_class
+        known = serializer_class.Meta.fields
+        params = {
+            name: _names(self.request.query_params, name)
+            for name in ('fields', 'omit', 'expand')
+        }
+        for name, values in params.items():
+            unknown = [value for value in values if value not in known]
+            if unknown:
+                raise ValidationError(
+                    {name: f'Неизвестные поля: {", ".join(unknown)}.'}
+                )
+        selected = set(
+            params['fields'] or serializer_class.default_fields()
+        )
+        selected = (selected | set(params['expand'])) - set(params['omit'])
+        return [name for name in known if name in selected]
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action in self.sparse_actions:
+            kwargs.setdefault('selected_fields', self.get_selected_fields())
+        return super().get_serializer(*args, **kwargs)
+
+
+def _call_view(view, request, *args, **kwargs):
+    """Обработка и отрисовка ответа целиком в потоке пула"""
+    close_old_connections()
+    try:
+        with collect_queries():
+            response = view(request, *args, **kwargs)
+            if callable(getattr(response, 'render', None)):
+                response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+class AsyncViewMixin:
+    """Асинхронная точка входа для ASGI.
+
+    Синхронные представления Django под ASGI выполняет в одном общем
+    потоке, и медленный запрос задерживает все остальные. При ASYNC_VIEWS
+    каждый безопасный запрос обрабатывается в отдельном потоке пула.
+    Запись остаётся в общем потоке: транзакция запроса и on_commit
+    выполняются там же, где их ждёт Django.
+    """
+
+    @classmethod
+    def as_view(cls, *args, **kwargs):
+        view = super().as_view(*args, **kwargs)
+        if not settings.ASYNC_VIEWS:
+            return view
+
+        async def async_view(request, *args, **kwargs):
+            return await sync_to_async(
+                _call_view,
+                thread_sensitive=request.method not in SAFE_METHODS,
+            )(view, request, *args, **kwargs)
+
+        return update_wrapper(async_view, view)
@@ -1,5 +1,61 @@
-from rest_framework.pagination import PageNumberPagination
+from django.core.paginator import InvalidPage, Page
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+from api.concurrency import (concurrency_enabled, prefetch_concurrently,
+                             run_concurrently)
 
 
 class CustomPagination(PageNumberPagination):
     page_size_query_param = 'limit'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Число объектов и страница параллельными запросами.
+
+        Связанные объекты страницы затем подгружаются тоже параллельно.
+        """
+        page_size = self.get_page_size(request)
+        number = request.query_params.get(self.page_query_param, '1')
+        if not (
+            page_size and number.isdigit() and int(number) > 0
+            and concurrency_enabled()
+        ):
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        number = int(number)
+        lookups = queryset._prefetch_related_lookups
+        start = (number - 1) * page_size
+        count, rows = run_concurrently(
+            queryset.count,
+            lambda: list(
+                queryset.prefetch_related(None)[start:start + page_size]
+            ),
+        )
+        paginator = self.django_paginator_class(queryset, page_size)
+        paginator.count = count
+        try:
+            paginator.validate_number(number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=number, message=str(exc)
+            ))
+        self.page = Page(rows, number, paginator)
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        prefetch_concurrently(rows, lookups)
+        return rows
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Постраничный вывод рецептов по курсору без COUNT и OFFSET"""
+    ordering = ('-pub_date', '-id')
+    page_size_query_param = 'limit'
+
+
+class FeedCursorPagination(CursorPagination):
+    """Постраничный вывод ленты подписок по курсору"""
+    ordering = ('-feed_pub_date', '-id')
+    page_size_query_param = 'limit'
+
+    def get_ordering(self, request, queryset, view):
+        return self.ordering
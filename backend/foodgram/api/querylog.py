@@ -0,0 +1,181 @@
+import contextvars
+import json
+import logging
+import math
+import os
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.serializers import BaseSerializer
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = settings.BASE_DIR + os.sep
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*\?\s*,)*\s*\?\s*\)', re.IGNORECASE)
+_SPACES = re.compile(r'\s+')
+
+_write_lock = threading.Lock()
+
+# Сборщик текущего HTTP-запроса. Контекст копируется в потоки пула,
+# поэтому запросы из них попадают в тот же журнал.
+_collector = contextvars.ContextVar('query_collector', default=None)
+
+
+def fingerprint(sql):
+    """Текст запроса без литералов и параметров.
+
+    Запросы, отличающиеся только значениями, дают один отпечаток.
+    """
+    sql = _STRING.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+def percentile(values, share):
+    """Перцентиль по списку значений без интерполяции"""
+    values = sorted(values)
+    if not values:
+        return 0
+    return values[max(math.ceil(share * len(values)) - 1, 0)]
+
+
+def query_origin():
+    """Место в коде проекта, откуда пришёл запрос.
+
+    Предпочитается метод сериализатора, иначе первая функция проекта.
+    """
+    fallback = None
+    frame = sys._getframe(2)
+    while frame is not None:
+        code = frame.f_code
+        if code.co_filename.startswith(PROJECT_DIR):
+            instance = frame.f_locals.get('self')
+            if isinstance(instance, BaseSerializer):
+                return f'{type(instance).__name__}.{code.co_name}'
+            if fallback is None and code.co_filename != __file__:
+                path = os.path.relpath(code.co_filename, PROJECT_DIR)
+                fallback = f'{path}:{frame.f_lineno} {code.co_name}'
+        frame = frame.f_back
+    return fallback
+
+
+@contextmanager
+def collect_queries():
+    """Запросы текущего потока ко всем базам - в сборщик HTTP-запроса.
+
+    Вне журналируемого запроса ничего не делает.
+    """
+    collector = _collector.get()
+    with ExitStack() as stack:
+        if collector is not None:
+            for alias_connection in connections.all():
+                stack.enter_context(
+                    alias_connection.execute_wrapper(collector)
+                )
+        yield
+
+
+class QueryCollector:
+    """Обёртка execute, собирающая запросы одного HTTP-запроса.
+
+    Запросы могут приходить из нескольких потоков одновременно.
+    """
+
+    def __init__(self):
+        self.queries = defaultdict(list)
+        self.origins = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = (time.perf_counter() - started) * 1000
+            key = fingerprint(sql)
+            origin = None if key in self.origins else query_origin()
+            with self._lock:
+                self.queries[key].append(duration)
+                self.origins.setdefault(key, origin)
+            if duration >= settings.QUERY_LOG_SLOW_MS:
+                logger.warning(
+                    'Медленный запрос %.1f мс (%s): %s',
+                    duration, self.origins[key], key,
+                )
+
+
+class QueryLogMiddleware:
+    """Журнал SQL-запросов по представлениям.
+
+    Включается переменной QUERY_LOG_ENABLED. Для каждого запроса пишет
+    строку JSON в QUERY_LOG_PATH с отпечатками, числом и временем
+    выполнения; повторы одного отпечатка помечаются как вероятный N+1.
+    Учитываются запросы ко всем базам, в том числе из потоков пула.
+    """
+
+    def __init__(self, get_response):
+        if not settings.QUERY_LOG_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        collector = QueryCollector()
+        started = time.perf_counter()
+        token = _collector.set(collector)
+        try:
+            with collect_queries():
+                response = self.get_response(request)
+        finally:
+            _collector.reset(token)
+        duration = (time.perf_counter() - started) * 1000
+        if collector.queries:
+            self.write(request, response, duration, collector)
+        return response
+
+    @staticmethod
+    def view_name(request):
+        match = request.resolver_match
+        name = match.view_name if match else request.path
+        return f'{request.method} {name}'
+
+    def write(self, request, response, duration, collector):
+        view = self.view_name(request)
+        entries = []
+        for key, durations in collector.queries.items():
+            origin = collector.origins[key]
+            n_plus_one = len(durations) >= settings.QUERY_LOG_REPEAT_LIMIT
+            if n_plus_one:
+                logger.warning(
+                    'Вероятный N+1 в %s: %s повторов из %s: %s',
+                    view, len(durations), origin, key,
+                )
+            entries.append({
+                'fingerprint': key,
+                'durations': [round(value, 3) for value in durations],
+                'origin': origin,
+                'n_plus_one': n_plus_one,
+            })
+        record = {
+            'time': time.time(),
+            'view': view,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'duration': round(duration, 3),
+            'queries': entries,
+        }
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with _write_lock:
+            with open(settings.QUERY_LOG_PATH, 'a', encoding='utf-8') as file:
+                file.write(line)
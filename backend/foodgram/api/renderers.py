@@ -0,0 +1,136 @@
+import csv
+import io
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer на orjson с тем же результатом.
+
+    Компактный вывод без экранирования не-ASCII, как у JSONRenderer с
+    настройками по умолчанию. Числа с плавающей точкой в экспоненциальной
+    записи пишутся короче (1e-5 вместо 1e-05). Отступы, выключенный
+    FAST_READ_PATH или отсутствие orjson - обычный JSONRenderer.
+    """
+    options = orjson and (
+        orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+    )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        indent = self.get_indent(
+            accepted_media_type or '', renderer_context or {}
+        )
+        if orjson is None or not settings.FAST_READ_PATH or indent:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        # Как и JSONRenderer, экранируются разделители строк, которые
+        # ломают JSON внутри <script>.
+        return orjson.dumps(
+            data, default=JSONEncoder().default, option=self.options
+        ).replace(
+            '\u2028'.encode(), b'\\u2028'
+        ).replace(
+            '\u2029'.encode(), b'\\u2029'
+        )
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """Базовый рендерер списка покупок.
+
+    Принимает строки вида
+    {'name': ..., 'measurement_unit': ..., 'amount': ...}
+    и отдаёт файл частями через stream(). Ошибки API приходят словарём
+    и выводятся простым текстом.
+    """
+    charset = None
+
+    def stream(self, rows):
+        raise NotImplementedError
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            return '\n'.join(
+                f'{key}: {value}' for key, value in data.items()
+            ).encode('utf-8')
+        return b''.join(self.stream(data))
+
+
+class ShoppingListTextRenderer(ShoppingListRenderer):
+    """Список покупок в текстовом файле"""
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, rows):
+        for row in rows:
+            yield (
+                f'{row["name"]} ({row["measurement_unit"]}) - '
+                f'{row["amount"]}\n'
+            ).encode('utf-8')
+
+
+class ShoppingListCSVRenderer(ShoppingListRenderer):
+    """Список покупок в CSV"""
+    media_type = 'text/csv'
+    format = 'csv'
+    header = ('name', 'measurement_unit', 'amount')
+
+    def stream(self, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(self.header)
+        for row in rows:
+            writer.writerow(
+                (row['name'], row['measurement_unit'], row['amount'])
+            )
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue().encode('utf-8')
+
+
+class ShoppingListPDFRenderer(ShoppingListRenderer):
+    """Список покупок в PDF"""
+    media_type = 'application/pdf'
+    format = 'pdf'
+    font_name = 'ShoppingListFont'
+    font_size = 12
+    chunk_size = 64 * 1024
+
+    def stream(self, rows):
+        if self.font_name not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(
+                TTFont(self.font_name, settings.SHOPPING_LIST_PDF_FONT)
+            )
+        buffer = io.BytesIO()
+        pdf = canvas.Canvas(buffer, pagesize=A4)
+        width, height = A4
+        margin = 50
+        line_height = self.font_size * 1.5
+        y = height - margin
+        pdf.setFont(self.font_name, self.font_size)
+        for row in rows:
+            if y < margin:
+                pdf.showPage()
+                pdf.setFont(self.font_name, self.font_size)
+                y = height - margin
+            pdf.drawString(
+                margin, y,
+                f'{row["name"]} ({row["measurement_unit"]}) - '
+                f'{row["amount"]}'
+            )
+            y -= line_height
+        pdf.save()
+        buffer.seek(0)
+        yield from iter(lambda: buffer.read(self.chunk_size), b'')
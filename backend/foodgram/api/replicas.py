@@ -0,0 +1,125 @@
+import contextvars
+import hashlib
+import random
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+PIN_COOKIE = 'db_pin'
+
+# Токены читаются с основной базы: только что выданный токен может ещё
+# не доехать до реплики.
+PRIMARY_MODELS = {'authtoken.token'}
+
+# База для чтения в текущем запросе. Вне HTTP-запросов (команды,
+# фоновые задачи) не задана, и всё идёт в основную базу.
+_read_alias = contextvars.ContextVar('read_alias', default=None)
+
+
+def _pin_key(request):
+    header = request.META.get('HTTP_AUTHORIZATION')
+    if not header:
+        return None
+    return 'db_pin:' + hashlib.sha256(header.encode()).hexdigest()
+
+
+@contextmanager
+def primary_reads():
+    """Чтение из основной базы внутри блока.
+
+    Нужно всему, что кэшируется под версией данных: собранное с
+    отстающей реплики сразу после изменения осталось бы в кэше под новой
+    версией.
+    """
+    token = _read_alias.set(DEFAULT_DB_ALIAS)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def recently_modified(versions):
+    """Менялись ли данные за REPLICA_PIN_SECONDS: реплика могла отстать"""
+    latest = max(modified for _, modified in versions.values())
+    return time.time() - latest < settings.REPLICA_PIN_SECONDS
+
+
+class ReplicaRouter:
+    """Чтение в безопасных запросах - с реплик DATABASE_REPLICAS.
+
+    Запись, транзакции и запросы закреплённых за основной базой клиентов
+    идут в default.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        if alias is None or alias == DEFAULT_DB_ALIAS:
+            return DEFAULT_DB_ALIAS
+        if model._meta.label_lower in PRIMARY_MODELS:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """Реплики получают схему репликацией из основной базы"""
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaMiddleware:
+    """Выбор базы для чтения и закрепление клиента после записи.
+
+    Успешный небезопасный запрос закрепляет клиента за основной базой на
+    REPLICA_PIN_SECONDS: по токену в кэше и cookie для браузера, чтобы
+    следующий GET увидел только что сделанные изменения.
+    """
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    @staticmethod
+    def is_pinned(request):
+        if request.method not in SAFE_METHODS:
+            return True
+        if PIN_COOKIE in request.COOKIES:
+            return True
+        key = _pin_key(request)
+        return key is not None and cache.get(key) is not None
+
+    def __call__(self, request):
+        # Значение не сбрасывается после ответа: тело потокового ответа
+        # читается из базы уже после выхода из middleware.
+        _read_alias.set(
+            DEFAULT_DB_ALIAS if self.is_pinned(request)
+            else random.choice(settings.DATABASE_REPLICAS)
+        )
+        response = self.get_response(request)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            self.pin(request, response)
+        return response
+
+    @staticmethod
+    def pin(request, response):
+        key = _pin_key(request)
+        if key is not None:
+            cache.set(key, True, settings.REPLICA_PIN_SECONDS)
+        response.set_cookie(
+            PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS,
+            httponly=True, samesite='Lax',
+        )
@@ -1,15 +1,42 @@
 import base64
+from collections import Counter
 
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from djoser.serializers import UserSerializer
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 
+from recipes.images import variant_names
 from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
                             Shopping_cart, Tag)
+from recipes.shopping import change_recipe
 from users.models import Subscribe, User
 
 
+class DynamicFieldsMixin:
+    """Сериалайзер с выбором полей ответа.
+
+    Поля из Meta.expandable_fields выводятся только по запросу. Набор
+    полей передаётся аргументом selected_fields, по умолчанию -
+    default_fields().
+    """
+
+    def __init__(self, *args, selected_fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if selected_fields is None:
+            selected_fields = self.default_fields()
+        for name in set(self.fields) - set(selected_fields):
+            self.fields.pop(name)
+
+    @classmethod
+    def default_fields(cls):
+        expandable = getattr(cls.Meta, 'expandable_fields', ())
+        return [name for name in cls.Meta.fields if name not in expandable]
+
+
 class TagSerializer(serializers.ModelSerializer):
     """Сериалайзер для тегов"""
     class Meta:
@@ -34,7 +61,46 @@ class Base64ImageField(serializers.ImageField):
         return super().to_internal_value(data)
 
 
-class CustomUserSerializer(UserSerializer):
+def image_url(name, request=None):
+    """Ссылка на файл из хранилища, как её отдаёт ImageField"""
+    url = default_storage.url(name)
+    if request is not None:
+        url = request.build_absolute_uri(url)
+    return url
+
+
+def image_variants(name, request=None, ready=True):
+    """Ссылки на уменьшенные копии картинки по её имени в хранилище.
+
+    Пока копии не созданы (ready), все ссылки ведут на исходную картинку.
+    """
+    original = None if ready else image_url(name, request)
+    return {
+        variant: {
+            image_format: original or image_url(variant_name, request)
+            for image_format, variant_name in formats.items()
+        }
+        for variant, formats in variant_names(name).items()
+    }
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии картинки в JPEG и WebP"""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        if not recipe.image:
+            return None
+        return image_variants(
+            recipe.image.name, self.context.get('request'),
+            recipe.image_variants_ready,
+        )
+
+
+class CustomUserSerializer(DynamicFieldsMixin, UserSerializer):
     """Сериалайзер для пользователей"""
     email = serializers.EmailField(
         required=True,
@@ -49,11 +115,17 @@ class CustomUserSerializer(UserSerializer):
             "username",
             "first_name",
             "last_name",
-            "is_subscribed"
+            "is_subscribed",
+            'recipes_count',
+            'subscribers_count',
         )
+        expandable_fields = ('recipes_count', 'subscribers_count')
+        read_only_fields = expandable_fields
         model = User
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         auth = self.context.get('request').auth
         user = self.context.get('request').user
         return auth and Subscribe.objects.filter(
@@ -61,7 +133,7 @@ class CustomUserSerializer(UserSerializer):
         ).exists()
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Сериалайзер для рецептов"""
     tags = TagSerializer(
         many=True
@@ -70,35 +142,42 @@ class RecipeSerializer(serializers.ModelSerializer):
         read_only=True,
     )
     image = Base64ImageField()
-    ingredients = IngredientSerializer(many=True,)
+    image_variants = ImageVariantsField()
+    ingredients = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
     class Meta:
         fields = ('is_favorited', 'is_in_shopping_cart',
                   'id', 'tags', 'author', 'ingredients', 'image',
-                  'name', 'text', 'cooking_time',)
+                  'image_variants', 'name', 'text', 'cooking_time',
+                  'favorites_count', 'carts_count', 'pub_date',)
+        expandable_fields = ('favorites_count', 'carts_count', 'pub_date')
+        read_only_fields = expandable_fields
         model = Recipe
 
     def to_representation(self, instance):
         """Изменение ответа при получении рецепта"""
-        representation = super().to_representation(instance)
-        ingredients = instance.ingredients.all()
-        amount = instance.amounts.all()
-        amount_list = []
-        for i in range(len(amount)):
-            i = {
-                'id': ingredients[i].id,
-                'name': ingredients[i].name,
-                'measurement_unit': ingredients[i].measurement_unit,
-                'amount': amount[i].amount
+        if hasattr(instance, 'author_is_subscribed'):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        return super().to_representation(instance)
+
+    def get_ingredients(self, obj):
+        """Ингредиенты рецепта с количеством"""
+        return [
+            {
+                'id': amount.ingredient.id,
+                'name': amount.ingredient.name,
+                'measurement_unit': amount.ingredient.measurement_unit,
+                'amount': amount.amount
             }
-            amount_list.append(i)
-        representation['ingredients'] = amount_list
-        return representation
+            for amount in obj.amounts.all()
+        ]
 
     def get_is_favorited(self, obj):
         """Добавление рецепта в избранное"""
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         auth = self.context.get('request').auth
         user = self.context.get('request').user
         return auth and Favorite.objects.filter(
@@ -107,6 +186,8 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     def get_is_in_shopping_cart(self, obj):
         """Добавление рецепта в список покупок"""
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         auth = self.context.get('request').auth
         user = self.context.get('request').user
         if not auth:
@@ -120,7 +201,7 @@ class RecipeSerializer(serializers.ModelSerializer):
 class AmountSerializer(serializers.ModelSerializer):
     """Сериалайзер для количества ингредиента"""
     id = serializers.IntegerField()
-    amount = serializers.IntegerField(write_only=True)
+    amount = serializers.IntegerField(write_only=True, min_value=1)
 
     class Meta:
         model = IngredientInRecipe
@@ -144,6 +225,62 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         )
         model = Recipe
 
+    def validate_ingredients(self, value):
+        """Проверка ингредиентов одним запросом к базе"""
+        ids = [item['id'] for item in value]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError(
+                'Ингредиенты в рецепте не должны повторяться.'
+            )
+        ingredients = Ingredient.objects.in_bulk(ids)
+        missing = [pk for pk in ids if pk not in ingredients]
+        if missing:
+            raise serializers.ValidationError(
+                f'Ингредиенты не найдены: {missing}.'
+            )
+        return [
+            {'ingredient': ingredients[item['id']], 'amount': item['amount']}
+            for item in value
+        ]
+
+    @staticmethod
+    def save_ingredients(recipe, ingredients):
+        """Запись только изменившихся ингредиентов рецепта.
+
+        Возвращает прежний состав {id ингредиента: количество}.
+        """
+        amounts = {item['ingredient'].id: item['amount']
+                   for item in ingredients}
+        existing = {}
+        stale = []
+        previous = Counter()
+        for row in recipe.amounts.all():
+            ingredient_id = row.ingredient_id
+            previous[ingredient_id] += row.amount
+            if ingredient_id in amounts and ingredient_id not in existing:
+                existing[ingredient_id] = row
+            else:
+                stale.append(row.id)
+        changed = []
+        for ingredient_id, row in existing.items():
+            if row.amount != amounts[ingredient_id]:
+                row.amount = amounts[ingredient_id]
+                changed.append(row)
+        if stale:
+            IngredientInRecipe.objects.filter(id__in=stale).delete()
+        if changed:
+            IngredientInRecipe.objects.bulk_update(changed, ['amount'])
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(
+                recipe=recipe, ingredient=item['ingredient'],
+                amount=item['amount'],
+            )
+            for item in ingredients
+            if item['ingredient'].id not in existing
+        )
+        return previous
+
+    @transaction.atomic
     def create(self, validate_data):
         """Создание рецепта"""
         tags = validate_data.pop('tags')
@@ -151,68 +288,49 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         recipe = Recipe.objects.create(
             **validate_data
         )
-        for tag in tags:
-            recipe.tags.add(tag)
-        for value in ingredients:
-            ingredient_id = value.get('id')
-            ingredient = Ingredient.objects.get(pk=ingredient_id)
-            amount = value.get('amount')
-            IngredientInRecipe.objects.create(
-                ingredient=ingredient, recipe=recipe, amount=amount
-            )
+        recipe.tags.set(tags)
+        self.save_ingredients(recipe, ingredients)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validate_data):
         """Обновление рецепта"""
-        IngredientInRecipe.objects.filter(recipe=instance).delete()
-        ingredients = validate_data.pop('ingredients')
-        for value in ingredients:
-            ingredient_id = value.get('id')
-            ingredient = Ingredient.objects.get(pk=ingredient_id)
-            amount = value.get('amount')
-            IngredientInRecipe.objects.create(
-                ingredient=ingredient, recipe=instance, amount=amount
-            )
+        ingredients = validate_data.pop('ingredients', None)
+        if ingredients is not None:
+            previous = self.save_ingredients(instance, ingredients)
+            change_recipe(instance.id, previous, {
+                item['ingredient'].id: item['amount'] for item in ingredients
+            })
         return super().update(instance, validate_data)
 
     def to_representation(self, instance):
-        """Изменение ответа при создании и обновлении рецепта"""
-        data = super().to_representation(instance)
-        data['tags'] = []
-        data['ingredients'] = []
-        tags_list = instance.tags.all()
-        ingredient_recipe_qs = instance.ingredients.all()
-        for tag in tags_list:
-            tag_dict = {
-                "id": tag.pk,
-                "name": tag.name,
-                "color": tag.color,
-                "slug": tag.slug,
-            }
-            data['tags'].append(tag_dict)
-        for ingredient in ingredient_recipe_qs:
-            ingredient_dict = {
-                "id": ingredient.pk,
-                "name": ingredient.name,
-                "measurement_unit": ingredient.measurement_unit,
-                "amount": instance.amounts.get(ingredient=ingredient).amount
-            }
-            data['ingredients'].append(ingredient_dict)
-        return data
+        """Ответ при создании и обновлении рецепта в формате списка"""
+        prefetch_related_objects(
+            [instance],
+            Prefetch('tags', queryset=Tag.objects.order_by('id')),
+            Prefetch(
+                'amounts',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient'
+                ).order_by('id'),
+            ),
+        )
+        return RecipeSerializer(instance, context=self.context).data
 
 
 class RecipeSubscribeSerialaizer(serializers.ModelSerializer):
     """Сериалайзер для представления рецепта в подписках"""
+    image_variants = ImageVariantsField()
+
     class Meta:
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
         model = Recipe
 
 
 class SubscribeSerialaizer(CustomUserSerializer):
     """Сериалайзер для подписок"""
-    is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.ReadOnlyField()
 
     class Meta:
         fields = (
@@ -223,35 +341,69 @@ class SubscribeSerialaizer(CustomUserSerializer):
             "last_name",
             "is_subscribed",
             'recipes',
-            'recipes_count'
+            'recipes_count',
+            'subscribers_count',
         )
+        expandable_fields = ('subscribers_count',)
+        read_only_fields = expandable_fields
         model = User
 
     def get_recipes(self, obj):
         """Получение поля рецепты"""
-        queryset = Recipe.objects.filter(author_id=obj.id).order_by('id')
+        previews = self.context.get('recipes')
+        if previews is not None:
+            queryset = previews.get(obj.id, [])
+        else:
+            queryset = Recipe.objects.filter(author_id=obj.id).order_by('id')
         return RecipeSubscribeSerialaizer(queryset, many=True).data
 
-    def get_recipes_count(self, obj):
-        """Получение поля количество рецептов"""
-        return Recipe.objects.filter(author_id=obj.id).count()
-
-    def get_is_subscribed(self, obj):
-        """Получение поля наличия подписки"""
-        auth = self.context.get('request').auth
-        user = self.context.get('request').user
-        return auth and Subscribe.objects.filter(
-            subscriber=user, author=obj
-        ).exists()
-
 
 class ShortRecipeSerialaizer(serializers.ModelSerializer):
     """Сериалайзер рецепта с малым количеством полей"""
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
         fields = (
             'id',
             'name',
             'image',
+            'image_variants',
             'cooking_time'
         )
+
+
+class BulkIdsSerializer(serializers.Serializer):
+    """Список id для пакетных операций"""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100,
+    )
+
+    def validate_ids(self, value):
+        return list(dict.fromkeys(value))
+
+
+class ShoppingListItemSerializer(serializers.Serializer):
+    """Строка списка покупок"""
+    id = serializers.IntegerField(source='ingredient_id')
+    name = serializers.CharField()
+    measurement_unit = serializers.CharField()
+    amount = serializers.IntegerField()
+
+
+class RecipeMatchSerializer(ShortRecipeSerialaizer):
+    """Сериалайзер рецепта, подобранного по имеющимся продуктам"""
+    matched = serializers.ReadOnlyField()
+    total = serializers.ReadOnlyField()
+    coverage = serializers.SerializerMethodField()
+    missing = IngredientSerializer(many=True, read_only=True)
+
+    class Meta(ShortRecipeSerialaizer.Meta):
+        fields = ShortRecipeSerialaizer.Meta.fields + (
+            'matched', 'total', 'coverage', 'missing'
+        )
+
+    def get_coverage(self, obj):
+        return round(obj.matched / obj.total, 3) if obj.total else 0
@@ -0,0 +1,20 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import token_cache
+from users.models import User
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    """Выход через djoser и удаление токена в админке"""
+    token_cache.invalidate(instance.key)
+
+
+@receiver(post_save, sender=User)
+def token_user_changed(sender, instance, **kwargs):
+    """Деактивация и изменение профиля не должны ждать истечения кэша"""
+    token_cache.invalidate(*Token.objects.filter(
+        user=instance
+    ).values_list('key', flat=True))
@@ -0,0 +1,34 @@
+import threading
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+from django.test.utils import override_settings
+
+from api.views import RecipeViewSet
+
+
+@override_settings(ASYNC_VIEWS=True)
+class AsyncViewTests(SimpleTestCase):
+    """Поток, в котором обрабатывается запрос при ASYNC_VIEWS"""
+
+    def handled_in(self, method):
+        threads = []
+
+        def call_view(view, request, *args, **kwargs):
+            threads.append(threading.get_ident())
+            return HttpResponse()
+
+        view = RecipeViewSet.as_view({'get': 'list', 'post': 'create'})
+        request = getattr(RequestFactory(), method)('/api/recipes/')
+        with mock.patch('api.mixins._call_view', call_view):
+            async_to_sync(view)(request)
+        return threads[0]
+
+    def test_reads_in_pool(self):
+        self.assertNotEqual(self.handled_in('get'), threading.get_ident())
+
+    def test_writes_in_shared_thread(self):
+        """Запись - в потоке, где Django ведёт транзакцию запроса"""
+        self.assertEqual(self.handled_in('post'), threading.get_ident())
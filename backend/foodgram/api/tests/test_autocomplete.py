@@ -0,0 +1,44 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from recipes.autocomplete import IngredientIndex
+from recipes.models import Ingredient
+
+
+class IngredientIndexTests(TestCase):
+    """Индекс автодополнения в памяти процесса"""
+
+    def setUp(self):
+        cache.clear()
+        Ingredient.objects.bulk_create([
+            Ingredient(name='Морковь', measurement_unit='г'),
+            Ingredient(name='Молоко', measurement_unit='мл'),
+        ])
+        self.index = IngredientIndex()
+
+    def names(self, query):
+        return [item['name'] for item in self.index.search(query)]
+
+    def rename_elsewhere(self):
+        """Изменение в другом воркере: версия в этом кэше не меняется"""
+        Ingredient.objects.filter(name='Молоко').update(name='Мука')
+
+    @override_settings(SHARED_CACHE=False, LOCAL_INDEX_TTL=60)
+    def test_local_cache_expires(self):
+        with mock.patch('recipes.versions.time.time', return_value=6000):
+            self.assertEqual(self.names('мо'), ['Молоко', 'Морковь'])
+            self.rename_elsewhere()
+            self.assertEqual(self.names('мо'), ['Молоко', 'Морковь'])
+        with mock.patch('recipes.versions.time.time', return_value=6060):
+            self.assertEqual(self.names('му'), ['Мука'])
+
+    @override_settings(SHARED_CACHE=True)
+    def test_shared_cache_version(self):
+        self.assertEqual(self.names('мо'), ['Молоко', 'Морковь'])
+        self.rename_elsewhere()
+        self.assertEqual(self.names('мо'), ['Молоко', 'Морковь'])
+        cache.incr('version:ingredient')
+        self.assertEqual(self.names('му'), ['Мука'])
@@ -0,0 +1,186 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from recipes.bulk import (ABSENT, ADDED, EXISTS, NOT_FOUND, REMOVED, SELF,
+                          bulk_favorite, bulk_shopping_cart, bulk_subscribe)
+from recipes.counters import reconcile_counters
+from recipes.models import (FeedEntry, Favorite, Ingredient,
+                            IngredientInRecipe, Recipe, Shopping_cart,
+                            ShoppingListItem)
+from recipes.shopping import reconcile_shopping_lists
+from users.models import Subscribe, User
+
+
+def create_user(name):
+    return User.objects.create_user(
+        email=f'{name}@example.com', username=name, password='pass',
+        first_name=name, last_name='Рецептов',
+    )
+
+
+class BulkOperationsTests(TestCase):
+    """Пакетные связи дают то же, что сохранение по одному объекту.
+
+    bulk_user работает через recipes.bulk, single_user - через ORM
+    с сигналами; итоговые счётчики, списки покупок и ленты совпадают.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.bulk_user = create_user('bulk')
+        cls.single_user = create_user('single')
+        cls.author = create_user('author')
+        cls.other_author = create_user('other')
+        Ingredient.objects.bulk_create([
+            Ingredient(name='Мука', measurement_unit='г'),
+            Ingredient(name='Молоко', measurement_unit='мл'),
+        ])
+        flour, milk = Ingredient.objects.order_by('id')
+        cls.recipes = []
+        for number in range(4):
+            recipe = Recipe.objects.create(
+                name=f'Рецепт {number}', text='Описание', cooking_time=10,
+                author=cls.author if number < 3 else cls.other_author,
+            )
+            IngredientInRecipe.objects.bulk_create([
+                IngredientInRecipe(
+                    recipe=recipe, ingredient=flour, amount=100 * (number + 1)
+                ),
+                IngredientInRecipe(recipe=recipe, ingredient=milk, amount=10),
+            ])
+            cls.recipes.append(recipe.id)
+        cls.missing = max(cls.recipes) + 100
+
+    def statuses(self, results):
+        return [result['status'] for result in results]
+
+    def assert_consistent(self):
+        self.assertFalse(any(reconcile_counters().values()))
+        self.assertEqual(reconcile_shopping_lists(), 0)
+
+    def test_favorite(self):
+        first, second, third, fourth = self.recipes
+        results = bulk_favorite(
+            self.bulk_user.id, [first, second, second, self.missing]
+        )
+        self.assertEqual(
+            self.statuses(results), [ADDED, ADDED, ADDED, NOT_FOUND]
+        )
+        self.assertEqual(
+            self.statuses(bulk_favorite(self.bulk_user.id, [second, third])),
+            [EXISTS, ADDED],
+        )
+        self.assertEqual(
+            self.statuses(bulk_favorite(
+                self.bulk_user.id, [first, fourth], add=False
+            )),
+            [REMOVED, ABSENT],
+        )
+        self.assertEqual(
+            self.statuses(bulk_favorite(
+                self.bulk_user.id, [first], add=False
+            )),
+            [ABSENT],
+        )
+        for recipe_id in (second, third):
+            Favorite.objects.create(
+                user=self.single_user, favorite_id=recipe_id
+            )
+        self.assert_consistent()
+        counts = dict(Recipe.objects.values_list('id', 'favorites_count'))
+        self.assertEqual(
+            [counts[pk] for pk in self.recipes], [0, 2, 2, 0]
+        )
+        changed = Recipe.objects.filter(
+            interactions_changed_at__isnull=False
+        ).values_list('id', flat=True)
+        self.assertEqual(set(changed), {first, second, third})
+
+    def test_shopping_cart(self):
+        first, second, third, _ = self.recipes
+        bulk_shopping_cart(self.bulk_user.id, [first, second])
+        bulk_shopping_cart(self.bulk_user.id, [second, third, third])
+        self.assertEqual(
+            self.statuses(bulk_shopping_cart(
+                self.bulk_user.id, [first, first], add=False
+            )),
+            [REMOVED, REMOVED],
+        )
+        bulk_shopping_cart(self.bulk_user.id, [first], add=False)
+        Shopping_cart.objects.create(user=self.single_user, purchase_id=first)
+        Shopping_cart.objects.create(user=self.single_user, purchase_id=second)
+        Shopping_cart.objects.create(user=self.single_user, purchase_id=third)
+        Shopping_cart.objects.get(
+            user=self.single_user, purchase_id=first
+        ).delete()
+        self.assert_consistent()
+        bulk_list, single_list = (
+            dict(ShoppingListItem.objects.filter(user=user).values_list(
+                'ingredient__name', 'amount'
+            ))
+            for user in (self.bulk_user, self.single_user)
+        )
+        self.assertEqual(bulk_list, {'Мука': 500, 'Молоко': 20})
+        self.assertEqual(bulk_list, single_list)
+        counts = dict(Recipe.objects.values_list('id', 'carts_count'))
+        self.assertEqual([counts[pk] for pk in self.recipes], [0, 2, 2, 0])
+
+    def feed(self, user):
+        return set(FeedEntry.objects.filter(
+            subscriber=user
+        ).values_list('recipe_id', 'author_id'))
+
+    def assert_same_feed(self):
+        self.assertEqual(
+            self.feed(self.bulk_user), self.feed(self.single_user)
+        )
+
+    def test_subscribe(self):
+        authors = [self.author.id, self.other_author.id]
+        results = bulk_subscribe(
+            self.bulk_user.id, [*authors, self.bulk_user.id, 10 ** 6]
+        )
+        self.assertEqual(
+            self.statuses(results), [ADDED, ADDED, SELF, NOT_FOUND]
+        )
+        self.assertEqual(
+            self.statuses(bulk_subscribe(self.bulk_user.id, authors)),
+            [EXISTS, EXISTS],
+        )
+        for author in (self.author, self.other_author):
+            Subscribe.objects.create(
+                subscriber=self.single_user, author=author
+            )
+        self.assertEqual(len(self.feed(self.bulk_user)), 4)
+        self.assert_same_feed()
+        self.assert_consistent()
+
+        self.assertEqual(
+            self.statuses(bulk_subscribe(
+                self.bulk_user.id, [self.author.id, self.author.id], add=False
+            )),
+            [REMOVED, REMOVED],
+        )
+        Subscribe.objects.get(
+            subscriber=self.single_user, author=self.author
+        ).delete()
+        self.assertEqual(
+            self.feed(self.bulk_user),
+            {(self.recipes[3], self.other_author.id)},
+        )
+        self.assert_same_feed()
+        self.assert_consistent()
+        self.author.refresh_from_db()
+        self.other_author.refresh_from_db()
+        self.assertEqual(self.author.subscribers_count, 0)
+        self.assertEqual(self.other_author.subscribers_count, 2)
+
+
+class BulkWithoutReturningTests(BulkOperationsTests):
+    """То же для СУБД без RETURNING: проверка и запись под блокировкой"""
+
+    def setUp(self):
+        patcher = mock.patch('recipes.bulk._returning', return_value=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
@@ -0,0 +1,39 @@
+from django.core.cache import cache
+from rest_framework.test import APITestCase
+
+from api.tests.test_queries import create_recipes
+from recipes.models import Favorite, Recipe
+from users.models import User
+
+
+class RecipeETagTests(APITestCase):
+    """ETag рецепта, открытого анонимно"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='author@example.com', username='author', password='pass',
+            first_name='Автор', last_name='Рецептов',
+        )
+        create_recipes(cls.author, count=1)
+        cls.recipe = Recipe.objects.get()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_not_modified(self):
+        path = f'/api/recipes/{self.recipe.id}/'
+        etag = self.client.get(path)['ETag']
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_counters_without_etag(self):
+        """Счётчики меняются без смены версии рецепта"""
+        path = f'/api/recipes/{self.recipe.id}/?expand=favorites_count'
+        response = self.client.get(path)
+        self.assertNotIn('ETag', response)
+        self.assertEqual(response.json()['favorites_count'], 0)
+        Favorite.objects.create(user=self.author, favorite=self.recipe)
+        response = self.client.get(path, HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['favorites_count'], 1)
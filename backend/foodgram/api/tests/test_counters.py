@@ -0,0 +1,132 @@
+from django.test import TestCase
+
+from recipes.counters import reconcile_counters
+from recipes.models import Favorite, Recipe, Shopping_cart
+from users.models import Subscribe, User
+
+
+def create_user(name):
+    return User.objects.create_user(
+        email=f'{name}@example.com', username=name, password='pass',
+        first_name=name, last_name='Рецептов',
+    )
+
+
+class CounterTests(TestCase):
+    """Счётчики избранного, покупок, рецептов и подписчиков"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.reader = create_user('reader')
+        cls.other = create_user('other')
+        cls.recipes = [
+            Recipe.objects.create(
+                name=f'Рецепт {number}', text='Описание', cooking_time=10,
+                author=cls.author,
+            )
+            for number in range(2)
+        ]
+        cls.other_recipe = Recipe.objects.create(
+            name='Чужой рецепт', text='Описание', cooking_time=10,
+            author=cls.other,
+        )
+        for user in (cls.reader, cls.other):
+            Subscribe.objects.create(subscriber=user, author=cls.author)
+            for recipe in (*cls.recipes, cls.other_recipe):
+                Favorite.objects.create(user=user, favorite=recipe)
+                Shopping_cart.objects.create(user=user, purchase=recipe)
+        Subscribe.objects.create(subscriber=cls.reader, author=cls.other)
+
+    def counts(self, model, field, objects):
+        values = dict(model.objects.filter(
+            pk__in=[obj.pk for obj in objects]
+        ).values_list('pk', field))
+        return [values.get(obj.pk) for obj in objects]
+
+    def assert_reconciled(self):
+        self.assertFalse(any(reconcile_counters().values()))
+
+    def test_create(self):
+        self.assertEqual(
+            self.counts(Recipe, 'favorites_count', self.recipes), [2, 2]
+        )
+        self.assertEqual(
+            self.counts(Recipe, 'carts_count', self.recipes), [2, 2]
+        )
+        self.assertEqual(
+            self.counts(User, 'recipes_count', [self.author, self.other]),
+            [2, 1],
+        )
+        self.assertEqual(
+            self.counts(User, 'subscribers_count', [self.author, self.other]),
+            [2, 1],
+        )
+        self.assert_reconciled()
+
+    def test_delete(self):
+        Favorite.objects.filter(user=self.reader).delete()
+        Shopping_cart.objects.get(
+            user=self.reader, purchase=self.recipes[0]
+        ).delete()
+        Subscribe.objects.get(
+            subscriber=self.reader, author=self.author
+        ).delete()
+        self.assertEqual(
+            self.counts(Recipe, 'favorites_count', self.recipes), [1, 1]
+        )
+        self.assertEqual(
+            self.counts(Recipe, 'carts_count', self.recipes), [1, 2]
+        )
+        self.assertEqual(
+            self.counts(User, 'subscribers_count', [self.author]), [1]
+        )
+        self.assert_reconciled()
+
+    def test_recipe_cascade(self):
+        """Удаление рецепта уменьшает число рецептов автора"""
+        self.recipes[0].delete()
+        self.assertEqual(
+            self.counts(User, 'recipes_count', [self.author]), [1]
+        )
+        self.assert_reconciled()
+
+    def test_user_cascade(self):
+        """Удаление пользователя: его избранное, корзина и подписки"""
+        self.reader.delete()
+        self.assertEqual(
+            self.counts(Recipe, 'favorites_count', self.recipes), [1, 1]
+        )
+        self.assertEqual(
+            self.counts(Recipe, 'carts_count', self.recipes), [1, 1]
+        )
+        self.assertEqual(
+            self.counts(User, 'subscribers_count', [self.author, self.other]),
+            [1, 0],
+        )
+        self.assert_reconciled()
+
+    def test_author_cascade(self):
+        """Удаление автора: его рецепты вместе с чужим избранным"""
+        self.author.delete()
+        self.assertEqual(
+            self.counts(Recipe, 'favorites_count', [self.other_recipe]), [2]
+        )
+        self.assertEqual(
+            self.counts(User, 'recipes_count', [self.other]), [1]
+        )
+        self.assert_reconciled()
+
+    def test_reconcile_fixes_drift(self):
+        Recipe.objects.filter(pk=self.recipes[0].pk).update(
+            favorites_count=10, carts_count=0
+        )
+        User.objects.filter(pk=self.author.pk).update(subscribers_count=0)
+        fixed = reconcile_counters()
+        self.assertEqual(fixed['recipe.favorites_count'], 1)
+        self.assertEqual(fixed['recipe.carts_count'], 1)
+        self.assertEqual(fixed['user.subscribers_count'], 1)
+        self.assertEqual(
+            self.counts(Recipe, 'favorites_count', self.recipes[:1]), [2]
+        )
+        self.assert_reconciled()
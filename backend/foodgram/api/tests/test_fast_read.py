@@ -0,0 +1,114 @@
+from django.core.cache import cache
+from django.test.utils import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from api.tests.test_queries import create_recipes
+from recipes.models import Favorite, Recipe, Shopping_cart
+from users.models import Subscribe, User
+
+PATHS = (
+    '/api/recipes/?limit=6',
+    '/api/recipes/?limit=10&page=2',
+    '/api/recipes/?limit=10&tags=tag0&tags=tag1',
+    '/api/recipes/?limit=10&ordering=-favorites_count',
+    '/api/recipes/?limit=10&ordering=carts_count',
+    '/api/recipes/?limit=10&is_favorited=1',
+    '/api/recipes/?limit=10&fields=id,name,image,tags',
+    '/api/recipes/?limit=10&omit=text,ingredients,is_favorited',
+    '/api/recipes/?limit=10&expand=favorites_count,carts_count,pub_date',
+    '/api/recipes/?limit=10&pagination=cursor',
+    '/api/recipes/?limit=10&pagination=cursor&ordering=-favorites_count',
+    '/api/recipes/?limit=10&pagination=cursor&ordering=carts_count',
+    '/api/recipes/?limit=10&pagination=cursor&ordering=-favorites_count'
+    '&fields=id,name',
+    '/api/recipes/?limit=10&pagination=cursor&ordering=-carts_count'
+    '&fields=id,author&expand=pub_date',
+)
+
+
+class FastReadContractTests(APITestCase):
+    """Быстрый путь чтения отдаёт те же байты, что сериализаторы DRF"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='author@example.com', username='author', password='pass',
+            first_name='Автор', last_name='Рецептов',
+        )
+        cls.reader = User.objects.create_user(
+            email='reader@example.com', username='reader', password='pass',
+            first_name='Читатель', last_name='Рецептов',
+        )
+        Subscribe.objects.create(subscriber=cls.reader, author=cls.author)
+        create_recipes(cls.author, count=30)
+        recipes = list(Recipe.objects.order_by('id'))
+        for number, recipe in enumerate(recipes[:12]):
+            Favorite.objects.create(user=cls.reader, favorite=recipe)
+            if number % 3 == 0:
+                Favorite.objects.create(user=cls.author, favorite=recipe)
+            if number % 2 == 0:
+                Shopping_cart.objects.create(user=cls.reader, purchase=recipe)
+        cls.recipe = recipes[0]
+        cls.token = Token.objects.create(user=cls.reader)
+
+    def setUp(self):
+        cache.clear()
+
+    def get_pair(self, path):
+        """Ответы сериализаторов и быстрого пути, дважды: второй из кэша"""
+        with override_settings(FAST_READ_PATH=False):
+            expected = self.client.get(path)
+        for attempt in ('первый', 'повторный'):
+            actual = self.client.get(path)
+            with self.subTest(path=path, attempt=attempt):
+                self.assertEqual(actual.status_code, 200)
+                self.assertEqual(actual.status_code, expected.status_code)
+                self.assertEqual(actual.content, expected.content)
+        return expected
+
+    def check_paths(self):
+        for path in PATHS:
+            response = self.get_pair(path)
+            next_page = response.json().get('next')
+            if next_page and 'cursor=' in next_page:
+                self.get_pair(next_page)
+        self.get_pair(f'/api/recipes/{self.recipe.id}/')
+        self.get_pair(f'/api/recipes/{self.recipe.id}/?omit=author,tags')
+
+    def test_anonymous(self):
+        self.check_paths()
+
+    def test_authenticated(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.check_paths()
+        self.get_pair('/api/recipes/feed/?limit=10')
+        self.get_pair('/api/recipes/feed/?limit=10&fields=id,author')
+
+    def test_cursor_follows_ordering(self):
+        """Курсор по счётчику проходит все рецепты без повторов"""
+        path = (
+            '/api/recipes/?limit=7&pagination=cursor&ordering=-favorites_count'
+            '&fields=id&expand=favorites_count'
+        )
+        seen = []
+        while path:
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(
+                (recipe['id'], recipe['favorites_count'])
+                for recipe in response.json()['results']
+            )
+            path = response.json()['next']
+        self.assertEqual(len(seen), 30)
+        self.assertEqual(len({pk for pk, _ in seen}), 30)
+        counts = [count for _, count in seen]
+        self.assertEqual(counts, sorted(counts, reverse=True))
+
+    def test_fields(self):
+        recipe = self.client.get(
+            '/api/recipes/?limit=1&fields=name,id&expand=pub_date'
+        ).json()['results'][0]
+        self.assertEqual(list(recipe), ['id', 'name', 'pub_date'])
+        response = self.client.get('/api/recipes/?fields=unknown')
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,112 @@
+from django.core.cache import cache
+from django.test.utils import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from recipes.models import FeedEntry, Recipe
+from users.models import Subscribe, User
+
+
+def create_user(name):
+    return User.objects.create_user(
+        email=f'{name}@example.com', username=name, password='pass',
+        first_name=name, last_name='Рецептов',
+    )
+
+
+class FeedTests(APITestCase):
+    """Лента подписок: раздача при публикации, дозапись и очистка"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = create_user('reader')
+        cls.author = create_user('author')
+        cls.other = create_user('other')
+        cls.author_recipes = [cls.publish(cls.author) for _ in range(3)]
+        cls.other_recipes = [cls.publish(cls.other) for _ in range(2)]
+        cls.token = Token.objects.create(user=cls.reader)
+
+    @staticmethod
+    def publish(author):
+        return Recipe.objects.create(
+            name=f'Рецепт {author.username}', text='Описание',
+            cooking_time=10, author=author,
+        ).id
+
+    def setUp(self):
+        cache.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def subscribe(self, author, method='post'):
+        response = getattr(self.client, method)(
+            f'/api/users/{author.id}/subscribe/'
+        )
+        self.assertLess(response.status_code, 300)
+
+    def entries(self):
+        return set(FeedEntry.objects.filter(
+            subscriber=self.reader
+        ).values_list('recipe_id', flat=True))
+
+    def feed_ids(self):
+        response = self.client.get('/api/recipes/feed/?fields=id&limit=50')
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def newest_first(self, recipe_ids):
+        return list(Recipe.objects.filter(id__in=recipe_ids).order_by(
+            '-pub_date', '-id'
+        ).values_list('id', flat=True))
+
+    def test_subscribe_backfills(self):
+        self.subscribe(self.author)
+        self.assertEqual(self.entries(), set(self.author_recipes))
+        self.assertEqual(
+            self.feed_ids(), self.newest_first(self.author_recipes)
+        )
+
+    @override_settings(FEED_BACKFILL_SIZE=2)
+    def test_backfill_size(self):
+        self.subscribe(self.author)
+        self.assertEqual(
+            self.entries(), set(self.newest_first(self.author_recipes)[:2])
+        )
+
+    def test_publish_fans_out(self):
+        self.subscribe(self.author)
+        recipe_id = self.publish(self.author)
+        self.publish(create_user('stranger'))
+        self.assertEqual(
+            self.entries(), {*self.author_recipes, recipe_id}
+        )
+        self.assertEqual(self.feed_ids()[0], recipe_id)
+
+    def test_unsubscribe_prunes(self):
+        self.subscribe(self.author)
+        self.subscribe(self.other)
+        self.subscribe(self.author, method='delete')
+        self.assertEqual(self.entries(), set(self.other_recipes))
+        self.assertEqual(
+            self.feed_ids(), self.newest_first(self.other_recipes)
+        )
+
+    def test_recipe_deleted(self):
+        self.subscribe(self.author)
+        Recipe.objects.filter(id=self.author_recipes[0]).delete()
+        self.assertEqual(self.entries(), set(self.author_recipes[1:]))
+
+    @override_settings(FEED_FANOUT_LIMIT=1)
+    def test_pulled_author(self):
+        """Популярный автор не раздаётся, его рецепты берутся при чтении"""
+        for name in ('first', 'second'):
+            Subscribe.objects.create(
+                subscriber=create_user(name), author=self.author
+            )
+        FeedEntry.objects.all().delete()
+        self.subscribe(self.author)
+        recipe_id = self.publish(self.author)
+        self.assertFalse(FeedEntry.objects.exists())
+        self.assertEqual(
+            self.feed_ids(),
+            self.newest_first([*self.author_recipes, recipe_id]),
+        )
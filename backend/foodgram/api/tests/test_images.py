@@ -0,0 +1,82 @@
+import io
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase
+from django.test.utils import override_settings
+from PIL import Image
+
+from recipes.images import FORMATS, VARIANTS, variant_name
+from recipes.models import Recipe
+from recipes.versions import get_version
+from users.models import User
+
+
+def image_file(image_format, color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (800, 600), color).save(buffer, format=image_format)
+    return ContentFile(buffer.getvalue())
+
+
+@override_settings(IMAGE_VARIANTS_ASYNC=False)
+class ImageVariantsTests(TestCase):
+    """Уменьшенные копии картинок рецептов"""
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        override = override_settings(MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.author = User.objects.create_user(
+            email='author@example.com', username='author', password='pass',
+            first_name='Автор', last_name='Рецептов',
+        )
+
+    def create_recipe(self, name, image):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Recipe.objects.create(
+                name=name, text='Описание', cooking_time=10,
+                author=self.author, image=image,
+            )
+
+    def test_same_stem_different_images(self):
+        """temp.png и temp.jpeg получают свои копии"""
+        png = default_storage.save(
+            'recipes/images/temp.png', image_file('PNG', 'red')
+        )
+        jpeg = default_storage.save(
+            'recipes/images/temp.jpeg', image_file('JPEG', 'blue')
+        )
+        first = self.create_recipe('Красный', png)
+        second = self.create_recipe('Синий', jpeg)
+        for variant in VARIANTS:
+            for image_format in FORMATS:
+                names = {
+                    variant_name(png, variant, image_format),
+                    variant_name(jpeg, variant, image_format),
+                }
+                self.assertEqual(len(names), 2)
+                for name in names:
+                    self.assertTrue(default_storage.exists(name))
+        for recipe in (first, second):
+            recipe.refresh_from_db()
+            self.assertTrue(recipe.image_variants_ready)
+
+    def test_ready_bumps_recipe_version(self):
+        name = default_storage.save(
+            'recipes/images/temp.png', image_file('PNG', 'green')
+        )
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            recipe = Recipe.objects.create(
+                name='Зелёный', text='Описание', cooking_time=10,
+                author=self.author, image=name,
+            )
+        version = get_version(f'recipe:{recipe.pk}')
+        for callback in callbacks:
+            callback()
+        recipe.refresh_from_db()
+        self.assertTrue(recipe.image_variants_ready)
+        self.assertGreater(get_version(f'recipe:{recipe.pk}'), version)
@@ -0,0 +1,126 @@
+from django.core.cache import cache
+from django.test.utils import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from api.authentication import token_cache
+from recipes.models import Ingredient, IngredientInRecipe, Recipe, Tag
+from users.models import Subscribe, User
+
+RECIPES = 60
+
+
+def create_recipes(author, count=RECIPES):
+    """Рецепты с тремя тегами и тремя ингредиентами каждый"""
+    tags = [
+        Tag.objects.create(name=f'Тег {i}', color=f'#00000{i}', slug=f'tag{i}')
+        for i in range(3)
+    ]
+    ingredients = Ingredient.objects.bulk_create([
+        Ingredient(name=f'Ингредиент {i}', measurement_unit='г')
+        for i in range(10)
+    ])
+    ingredients = list(Ingredient.objects.order_by('id'))
+    for number in range(count):
+        recipe = Recipe.objects.create(
+            name=f'Рецепт {number}', text='Описание', cooking_time=10,
+            author=author,
+        )
+        recipe.tags.set(tags)
+        IngredientInRecipe.objects.bulk_create([
+            IngredientInRecipe(
+                recipe=recipe,
+                ingredient=ingredients[(number + shift) % len(ingredients)],
+                amount=shift + 1,
+            )
+            for shift in range(3)
+        ])
+
+
+class RecipeQueryBudgetTests(APITestCase):
+    """Число запросов к базе не зависит от размера страницы рецептов.
+
+    Кэши очищаются перед каждым запросом: считается худший случай.
+    Проверка токена - отдельный запрос.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='author@example.com', username='author', password='pass',
+            first_name='Автор', last_name='Рецептов',
+        )
+        cls.reader = User.objects.create_user(
+            email='reader@example.com', username='reader', password='pass',
+            first_name='Читатель', last_name='Рецептов',
+        )
+        Subscribe.objects.create(subscriber=cls.reader, author=cls.author)
+        create_recipes(cls.author)
+        cls.recipe = Recipe.objects.order_by('id').first()
+        cls.token = Token.objects.create(user=cls.reader)
+
+    def setUp(self):
+        self.clear_caches()
+
+    @staticmethod
+    def clear_caches():
+        cache.clear()
+        token_cache.clear()
+
+    def authenticate(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def assert_queries(self, path, expected):
+        with self.assertNumQueries(expected):
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def check_budget(self, list_queries, detail_queries):
+        for limit in (6, 50):
+            with self.subTest(limit=limit):
+                self.clear_caches()
+                response = self.assert_queries(
+                    f'/api/recipes/?limit={limit}', list_queries
+                )
+                self.assertEqual(len(response.json()['results']), limit)
+        self.clear_caches()
+        self.assert_queries(
+            f'/api/recipes/{self.recipe.id}/', detail_queries
+        )
+
+    def test_anonymous(self):
+        self.check_budget(list_queries=5, detail_queries=4)
+
+    def test_authenticated(self):
+        self.authenticate()
+        self.check_budget(list_queries=6, detail_queries=5)
+
+    @override_settings(FAST_READ_PATH=False)
+    def test_serializer_path(self):
+        """Число, страница, теги, ингредиенты; рецепт, теги, ингредиенты"""
+        self.authenticate()
+        self.check_budget(list_queries=5, detail_queries=4)
+
+
+class AnonymousFlagsTests(APITestCase):
+    """Признаки пользователя в ответах для анонимного запроса"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='author@example.com', username='author', password='pass',
+            first_name='Автор', last_name='Рецептов',
+        )
+        create_recipes(author, count=1)
+
+    def test_flags(self):
+        for fast in (True, False):
+            with self.subTest(fast=fast), override_settings(
+                FAST_READ_PATH=fast
+            ):
+                cache.clear()
+                recipe = self.client.get('/api/recipes/').json()['results'][0]
+                self.assertIsNone(recipe['is_favorited'])
+                self.assertIs(recipe['is_in_shopping_cart'], False)
+                self.assertIsNone(recipe['author']['is_subscribed'])
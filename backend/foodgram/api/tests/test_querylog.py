@@ -0,0 +1,57 @@
+import contextvars
+import json
+import os
+import tempfile
+
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+from django.test.utils import override_settings
+
+from api.concurrency import _run_in_worker, get_executor
+from api.querylog import QueryLogMiddleware
+from recipes.models import Ingredient, Tag
+
+
+class QueryLogTests(TestCase):
+    """Журнал SQL-запросов"""
+
+    def setUp(self):
+        descriptor, self.path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(descriptor)
+        self.addCleanup(os.remove, self.path)
+
+    def log_request(self, view):
+        with override_settings(
+            QUERY_LOG_ENABLED=True, QUERY_LOG_PATH=self.path
+        ):
+            middleware = QueryLogMiddleware(view)
+            middleware(RequestFactory().get('/api/tags/'))
+        with open(self.path, encoding='utf-8') as file:
+            return [json.loads(line) for line in file]
+
+    def test_pool_queries(self):
+        """Запросы из потока пула попадают в журнал запроса"""
+        def view(request):
+            list(Ingredient.objects.all())
+            get_executor().submit(
+                _run_in_worker, contextvars.copy_context(),
+                lambda: list(Tag.objects.all()),
+            ).result()
+            return HttpResponse()
+
+        records = self.log_request(view)
+        self.assertEqual(len(records), 1)
+        fingerprints = ' '.join(
+            query['fingerprint'] for query in records[0]['queries']
+        )
+        self.assertIn('recipes_ingredient', fingerprints)
+        self.assertIn('recipes_tag', fingerprints)
+
+    def test_outside_request(self):
+        """Без журналируемого запроса пул ничего не собирает"""
+        get_executor().submit(
+            _run_in_worker, contextvars.copy_context(),
+            lambda: list(Tag.objects.all()),
+        ).result()
+        records = self.log_request(lambda request: HttpResponse())
+        self.assertEqual(records, [])
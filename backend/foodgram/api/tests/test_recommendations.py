@@ -0,0 +1,89 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from recipes.models import Favorite, Recipe, RecipeNeighbour
+from recipes.recommendations import build_recommendations
+from users.models import User
+
+
+class IncrementalRecommendationsTests(TestCase):
+    """Пересчёт только изменившегося даёт ту же таблицу, что полный"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='author@example.com', username='author', password='pass',
+            first_name='Автор', last_name='Рецептов',
+        )
+        cls.users = [
+            User.objects.create_user(
+                email=f'user{number}@example.com', username=f'user{number}',
+                password='pass', first_name='Читатель', last_name='Рецептов',
+            )
+            for number in range(3)
+        ]
+        cls.recipes = {
+            name: Recipe.objects.create(
+                name=name, text='Описание', cooking_time=10, author=author,
+            ).id
+            for name in 'ABCD'
+        }
+        for user, names in zip(cls.users, ('AB', 'AC', 'CD')):
+            for name in names:
+                Favorite.objects.create(
+                    user=user, favorite_id=cls.recipes[name]
+                )
+
+    def setUp(self):
+        build_recommendations(full=True)
+        # Прошлые отметки старше прошлого расчёта с запасом.
+        Recipe.objects.update(
+            interactions_changed_at=timezone.now() - timedelta(hours=1)
+        )
+
+    def table(self):
+        return {
+            (recipe_id, neighbour_id): round(score, 9)
+            for recipe_id, neighbour_id, score in
+            RecipeNeighbour.objects.values_list(
+                'recipe_id', 'neighbour_id', 'score'
+            )
+        }
+
+    def assert_matches_full(self):
+        build_recommendations()
+        incremental = self.table()
+        build_recommendations(full=True)
+        self.assertEqual(incremental, self.table())
+
+    def neighbours(self, name):
+        return set(RecipeNeighbour.objects.filter(
+            recipe_id=self.recipes[name]
+        ).values_list('neighbour_id', flat=True))
+
+    def test_lost_similarity(self):
+        """B больше не похож на A: A убирается из списка B"""
+        Favorite.objects.get(
+            user=self.users[0], favorite_id=self.recipes['A']
+        ).delete()
+        build_recommendations()
+        self.assertNotIn(self.recipes['A'], self.neighbours('B'))
+        self.assert_matches_full()
+
+    def test_new_similarity(self):
+        """D стал похож на A, хотя у D отметки не менялись"""
+        Favorite.objects.create(
+            user=self.users[2], favorite_id=self.recipes['A']
+        )
+        build_recommendations()
+        self.assertIn(self.recipes['A'], self.neighbours('D'))
+        self.assert_matches_full()
+
+    def test_no_interactions_left(self):
+        Favorite.objects.filter(favorite_id=self.recipes['A']).delete()
+        build_recommendations()
+        self.assertEqual(self.neighbours('A'), set())
+        self.assertNotIn(self.recipes['A'], self.neighbours('C'))
+        self.assert_matches_full()
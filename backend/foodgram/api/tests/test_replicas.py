@@ -0,0 +1,115 @@
+from django.core.cache import cache
+from django.db import connections
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITransactionTestCase
+
+from api.authentication import token_cache
+from api.tests.test_queries import create_recipes
+from recipes.autocomplete import ingredient_index
+from recipes.models import Recipe
+from recipes.versions import bump_version
+from users.models import User
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_PIN_SECONDS=5)
+class ReplicaRoutingTests(APITransactionTestCase):
+    """Чтение с реплики и закрепление за основной базой.
+
+    replica - зеркало default: данные общие, а база, в которую ушёл
+    запрос, видна по соединению.
+    """
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.author = User.objects.create_user(
+            email='author@example.com', username='author', password='pass',
+            first_name='Автор', last_name='Рецептов',
+        )
+        create_recipes(self.author, count=3)
+        self.recipe = Recipe.objects.order_by('id').first()
+        self.token = Token.objects.create(user=self.author)
+        self.settle()
+
+    def settle(self):
+        """Данные изменены давно: ответы с ETag можно читать с реплики"""
+        recipe_ids = Recipe.objects.values_list('pk', flat=True)
+        names = ['tag', 'ingredient', *(f'recipe:{pk}' for pk in recipe_ids)]
+        cache.set_many({f'modified:{name}': 0 for name in names}, None)
+
+    def get(self, path, client=None):
+        """Ответ и SQL-запросы к каждой базе"""
+        client = client or self.client
+        with CaptureQueriesContext(connections['default']) as default, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response, default, replica
+
+    @staticmethod
+    def sql(queries):
+        return ' '.join(query['sql'] for query in queries)
+
+    def token_client(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        return client
+
+    def test_safe_reads_go_to_replica(self):
+        _, default, replica = self.get('/api/tags/')
+        self.assertEqual(len(default), 0)
+        self.assertIn('recipes_tag', self.sql(replica))
+
+    def test_token_read_from_primary(self):
+        _, default, replica = self.get('/api/tags/', self.token_client())
+        self.assertIn('authtoken_token', self.sql(default))
+        self.assertNotIn('authtoken_token', self.sql(replica))
+        self.assertIn('recipes_tag', self.sql(replica))
+
+    def test_write_pins_client(self):
+        client = self.token_client()
+        with CaptureQueriesContext(connections['replica']) as replica:
+            response = client.post(f'/api/recipes/{self.recipe.id}/favorite/')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(replica), 0)
+        self.assertIn('db_pin', response.cookies)
+        _, default, replica = self.get('/api/tags/', client)
+        self.assertEqual(len(replica), 0)
+        self.assertIn('recipes_tag', self.sql(default))
+        # Другой клиент с тем же токеном закреплён через кэш.
+        token_cache.clear()
+        _, default, replica = self.get('/api/tags/', self.token_client())
+        self.assertEqual(len(replica), 0)
+        self.assertIn('recipes_tag', self.sql(default))
+
+    def test_pin_expires(self):
+        client = self.token_client()
+        with override_settings(REPLICA_PIN_SECONDS=0):
+            client.post(f'/api/recipes/{self.recipe.id}/favorite/')
+        client.cookies.clear()
+        self.settle()
+        _, _, replica = self.get('/api/tags/', client)
+        self.assertIn('recipes_tag', self.sql(replica))
+
+    def test_version_keyed_caches_from_primary(self):
+        """Кэши под версией данных собираются из основной базы"""
+        ingredient_index._state = None
+        _, default, replica = self.get('/api/ingredients/?name=инг')
+        self.assertIn('recipes_ingredient', self.sql(default))
+        self.assertNotIn('recipes_ingredient', self.sql(replica))
+
+        _, default, replica = self.get('/api/recipes/?limit=3')
+        self.assertIn('recipes_ingredientinrecipe', self.sql(default))
+        self.assertNotIn('recipes_ingredientinrecipe', self.sql(replica))
+
+    def test_recently_modified_from_primary(self):
+        """Рецепт с ETag сразу после изменения читается из основной базы"""
+        path = f'/api/recipes/{self.recipe.id}/'
+        _, _, replica = self.get(path)
+        self.assertIn('recipes_recipe', self.sql(replica))
+        bump_version(f'recipe:{self.recipe.id}')
+        _, default, replica = self.get(path)
+        self.assertEqual(len(replica), 0)
+        self.assertIn('recipes_recipe', self.sql(default))
@@ -0,0 +1,153 @@
+from collections import Counter
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase
+
+from recipes.models import (Ingredient, IngredientInRecipe, Recipe,
+                            Shopping_cart, ShoppingListItem, Tag)
+from recipes.shopping import apply_deltas, reconcile_shopping_lists
+from users.models import User
+
+
+class ShoppingListTests(APITestCase):
+    """Список покупок обновляется разницами и сходится с корзиной"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='author@example.com', username='author', password='pass',
+            first_name='Автор', last_name='Рецептов',
+        )
+        cls.buyer = User.objects.create_user(
+            email='buyer@example.com', username='buyer', password='pass',
+            first_name='Покупатель', last_name='Рецептов',
+        )
+        cls.tag = Tag.objects.create(
+            name='Обед', color='#000000', slug='lunch'
+        )
+        Ingredient.objects.bulk_create([
+            Ingredient(name='Мука', measurement_unit='г'),
+            Ingredient(name='Молоко', measurement_unit='мл'),
+            Ingredient(name='Яйцо', measurement_unit='шт'),
+        ])
+        cls.flour, cls.milk, cls.egg = Ingredient.objects.order_by('id')
+        cls.pancakes = cls.create_recipe('Блины', {
+            cls.flour: 200, cls.milk: 500, cls.egg: 2,
+        })
+        cls.bread = cls.create_recipe('Хлеб', {cls.flour: 400})
+        cls.author_token = Token.objects.create(user=cls.author)
+        cls.buyer_token = Token.objects.create(user=cls.buyer)
+
+    @classmethod
+    def create_recipe(cls, name, amounts):
+        recipe = Recipe.objects.create(
+            name=name, text='Описание', cooking_time=10, author=cls.author,
+        )
+        recipe.tags.set([cls.tag])
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(
+                recipe=recipe, ingredient=ingredient, amount=amount
+            )
+            for ingredient, amount in amounts.items()
+        )
+        return recipe
+
+    def setUp(self):
+        self.buyer_client = APIClient()
+        self.buyer_client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.buyer_token.key}'
+        )
+        self.author_client = APIClient()
+        self.author_client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.author_token.key}'
+        )
+
+    def stored(self, user=None):
+        return dict(ShoppingListItem.objects.filter(
+            user=user or self.buyer
+        ).values_list('ingredient__name', 'amount'))
+
+    def actual(self, user=None):
+        """Сумма по корзине, посчитанная заново"""
+        totals = Counter()
+        for amount in IngredientInRecipe.objects.filter(
+            recipe__cart__user=user or self.buyer
+        ).select_related('ingredient'):
+            totals[amount.ingredient.name] += amount.amount
+        return dict(totals)
+
+    def assert_list(self, expected):
+        self.assertEqual(self.stored(), expected)
+        self.assertEqual(self.actual(), expected)
+        self.assertEqual(reconcile_shopping_lists(), 0)
+
+    def cart(self, method, recipe, expected_status):
+        response = getattr(self.buyer_client, method)(
+            f'/api/recipes/{recipe.id}/shopping_cart/'
+        )
+        self.assertEqual(response.status_code, expected_status)
+
+    def edit(self, recipe, amounts):
+        response = self.author_client.patch(
+            f'/api/recipes/{recipe.id}/',
+            {'ingredients': [
+                {'id': ingredient.id, 'amount': amount}
+                for ingredient, amount in amounts.items()
+            ]},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_cart_changes(self):
+        self.cart('post', self.pancakes, 201)
+        self.assert_list({'Мука': 200, 'Молоко': 500, 'Яйцо': 2})
+        self.cart('post', self.bread, 201)
+        self.assert_list({'Мука': 600, 'Молоко': 500, 'Яйцо': 2})
+        self.cart('delete', self.pancakes, 204)
+        self.assert_list({'Мука': 400})
+        self.cart('delete', self.bread, 204)
+        self.assert_list({})
+
+    def test_recipe_edit(self):
+        self.cart('post', self.pancakes, 201)
+        self.cart('post', self.bread, 201)
+        # Молоко убрано, мука уменьшена, яиц больше.
+        self.edit(self.pancakes, {self.flour: 150, self.egg: 3})
+        self.assert_list({'Мука': 550, 'Яйцо': 3})
+        self.edit(self.bread, {self.flour: 400, self.milk: 100})
+        self.assert_list({'Мука': 550, 'Молоко': 100, 'Яйцо': 3})
+        self.edit(self.pancakes, {self.flour: 150, self.egg: 3})
+        self.assert_list({'Мука': 550, 'Молоко': 100, 'Яйцо': 3})
+
+    def test_recipe_deleted(self):
+        self.cart('post', self.pancakes, 201)
+        self.cart('post', self.bread, 201)
+        response = self.author_client.delete(f'/api/recipes/{self.bread.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assert_list({'Мука': 200, 'Молоко': 500, 'Яйцо': 2})
+
+    def test_other_users_untouched(self):
+        Shopping_cart.objects.create(user=self.author, purchase=self.bread)
+        self.cart('post', self.bread, 201)
+        self.edit(self.bread, {self.flour: 300})
+        self.cart('delete', self.bread, 204)
+        self.assert_list({})
+        self.assertEqual(self.stored(self.author), {'Мука': 300})
+        self.assertEqual(self.actual(self.author), {'Мука': 300})
+
+    def test_apply_deltas_drops_zero_rows(self):
+        apply_deltas([self.buyer.id], {self.flour.id: 100, self.milk.id: 50})
+        apply_deltas([self.buyer.id], {self.flour.id: -100, self.milk.id: -80})
+        self.assertEqual(self.stored(), {})
+
+    def test_reconcile_fixes_drift(self):
+        self.cart('post', self.pancakes, 201)
+        ShoppingListItem.objects.filter(ingredient=self.flour).update(amount=1)
+        ShoppingListItem.objects.filter(ingredient=self.egg).delete()
+        ShoppingListItem.objects.create(
+            user=self.buyer, ingredient=Ingredient.objects.create(
+                name='Соль', measurement_unit='г'
+            ), amount=5,
+        )
+        self.assertEqual(reconcile_shopping_lists(), 3)
+        self.assert_list({'Мука': 200, 'Молоко': 500, 'Яйцо': 2})
@@ -1,27 +1,95 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
 from django.db import IntegrityError
-from django.http import FileResponse
+from django.db.models import BooleanField, Exists, OuterRef, Value
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as DjoserUserViewSet
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 
-from api.filter import IngredientSearchFilter
-from api.pagination import CustomPagination
+from api.concurrency import prefetch_concurrently
+from api.filter import RecipeOrderingFilter
+from api.fragments import ROW_FIELDS, RecipeCachedSerializer
+from api.mixins import (AsyncViewMixin, ConditionalGetMixin, FastReadMixin,
+                        SparseFieldsMixin)
+from api.pagination import (CustomPagination, FeedCursorPagination,
+                            RecipeCursorPagination)
 from api.permissions import IsAuthorOrReadOnly
-from api.serializers import (CustomUserSerializer, IngredientSerializer,
-                             RecipeCreateSerializer, RecipeSerializer,
+from api.renderers import (FastJSONRenderer, ShoppingListCSVRenderer,
+                           ShoppingListPDFRenderer, ShoppingListTextRenderer)
+from api.serializers import (BulkIdsSerializer, CustomUserSerializer,
+                             IngredientSerializer, RecipeCreateSerializer,
+                             RecipeMatchSerializer, RecipeSerializer,
+                             ShoppingListItemSerializer,
                              ShortRecipeSerialaizer, SubscribeSerialaizer,
                              TagSerializer)
-from foodgram.settings import MEDIA_ROOT
-from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+from recipes.autocomplete import ingredient_index
+from recipes.bulk import bulk_favorite, bulk_shopping_cart, bulk_subscribe
+from recipes.feed import feed_queryset
+from recipes.models import (USER_FLAGS, Favorite, Ingredient, Recipe,
                             Shopping_cart, Tag)
+from recipes.pantry import pantry_index
+from recipes.recommendations import recommended_recipes, similar_recipes
+from recipes.search import search_recipes
+from recipes.shopping import list_version, shopping_list
+from recipes.tagmask import TAGS_MODES, filter_by_tags
 from users.models import Subscribe, User
 
+MATCH_LIMIT = 20
+MATCH_MAX_LIMIT = 100
+SIMILAR_LIMIT = 10
+SIMILAR_MAX_LIMIT = 50
+
+
+def parse_limit(request, default=None):
+    """Параметр limit запроса: целое неотрицательное число"""
+    limit = request.query_params.get('limit')
+    if limit is None:
+        return default
+    if not limit.isdigit():
+        raise ValidationError(
+            {'limit': 'Ожидается целое неотрицательное число.'}
+        )
+    return int(limit)
+
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+def parse_ids(request, name):
+    """Целые числа из повторяющегося параметра или списка через запятую"""
+    values = [
+        value.strip()
+        for param in request.query_params.getlist(name)
+        for value in param.split(',') if value.strip()
+    ]
+    if not all(value.isdigit() for value in values):
+        raise ValidationError(
+            {name: 'Ожидаются целые неотрицательные числа.'}
+        )
+    return [int(value) for value in values]
+
+
+def bulk_response(request, operation):
+    """Пакетная операция над id из тела запроса или параметра ids"""
+    data = request.data
+    if 'ids' not in data:
+        data = {'ids': parse_ids(request, 'ids')}
+    serializer = BulkIdsSerializer(data=data)
+    serializer.is_valid(raise_exception=True)
+    return Response({'results': operation(
+        request.user.id, serializer.validated_data['ids'],
+        add=request.method == 'POST',
+    )})
+
+
+class TagViewSet(AsyncViewMixin, ConditionalGetMixin,
+                 viewsets.ReadOnlyModelViewSet):
     """Вьюсет для обработки тэгов"""
     queryset = Tag.objects.order_by('id').order_by('id')
     serializer_class = TagSerializer
@@ -29,52 +97,153 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_fields = ('name', )
     pagination_class = None
 
+    def get_version_names(self):
+        return ('tag',)
+
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(AsyncViewMixin, ConditionalGetMixin,
+                        viewsets.ReadOnlyModelViewSet):
     """Вьюсет для обработки ингредиентов"""
     queryset = Ingredient.objects.order_by('id')
     serializer_class = IngredientSerializer
-    filter_backends = [IngredientSearchFilter]
-    search_fields = ("^name",) 
     pagination_class = None
 
+    def get_version_names(self):
+        return ('ingredient',)
 
-class RecipeViewSet(viewsets.ModelViewSet):
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            self.autocomplete, request, *args, **kwargs
+        )
+
+    def autocomplete(self, request, *args, **kwargs):
+        """Автодополнение по индексу в памяти без запросов к базе"""
+        return Response(ingredient_index.search(
+            request.query_params.get('name', ''), parse_limit(request)
+        ))
+
+
+class RecipeViewSet(AsyncViewMixin, ConditionalGetMixin, FastReadMixin,
+                    SparseFieldsMixin, viewsets.ModelViewSet):
     """Вьюсет для обработки рецептов"""
     queryset = Recipe.objects.order_by('-pub_date')
     serializer_class = RecipeSerializer
+    fast_serializer_class = RecipeCachedSerializer
+    fast_actions = ('list', 'retrieve', 'feed')
+    sparse_actions = ('list', 'retrieve', 'feed')
+    renderer_classes = (FastJSONRenderer, BrowsableAPIRenderer)
     permission_classes = (IsAuthorOrReadOnly,)
     pagination_class = CustomPagination
+    filter_backends = (RecipeOrderingFilter,)
+    ordering_fields = ('pub_date', 'favorites_count', 'carts_count')
+    ordering = ('-pub_date', '-id')
+
+    def get_version_names(self):
+        """Версии для рецепта, открытого анонимно, и списка покупок.
+
+        Счётчики избранного и покупок меняются без смены версии рецепта,
+        поэтому ответ с ними ETag не получает.
+        """
+        if self.action == 'shopping_list':
+            return ('ingredient', list_version(self.request.user.pk))
+        if self.action != 'retrieve' or self.request.user.is_authenticated:
+            return None
+        if set(ROW_FIELDS) & set(self.get_selected_fields()):
+            return None
+        return ('tag', 'ingredient', f'recipe:{self.kwargs["pk"]}')
+
+    @property
+    def paginator(self):
+        """Пагинация по курсору при ?pagination=cursor"""
+        if not hasattr(self, '_paginator'):
+            if self.request.query_params.get('pagination') == 'cursor':
+                self._paginator = RecipeCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
     def get_queryset(self):
         """Получение списка объектов"""
-        queryset = Recipe.objects.all().order_by('-pub_date')
         user = self.request.user
+        queryset = Recipe.objects.with_user_flags(
+            user, self.get_user_flags()
+        ).order_by('-pub_date', '-id')
         is_favorited = self.request.query_params.get('is_favorited')
         author_id = self.request.query_params.get('author')
         is_in_shopping_cart = self.request.query_params.get(
             'is_in_shopping_cart'
         )
         tags = self.request.query_params.getlist('tags')
+        search = self.request.query_params.get('search', '').strip()
+        if search:
+            queryset = search_recipes(queryset, search)
         if is_favorited is not None:
-            queryset = Recipe.objects.filter(
-                favorite__user=user
-            ).order_by('id')
+            queryset = queryset.filter(is_favorited=True)
         if author_id is not None:
-            queryset = queryset.filter(author=author_id).order_by('-pub_date')
+            queryset = queryset.filter(author=author_id)
         if is_in_shopping_cart is not None:
-            queryset = queryset.filter(cart__user=user).order_by('-pub_date')
-        if len(tags) > 0:
-            queryset = queryset.filter(
-                tags__slug__in=tags
-            ).distinct()
+            queryset = queryset.filter(is_in_shopping_cart=True)
+        if tags:
+            queryset = filter_by_tags(queryset, tags, self.get_tags_mode())
+        return queryset
+
+    def filter_queryset(self, queryset):
+        """Сортировка и затем урезание queryset под поля ответа"""
+        queryset = super().filter_queryset(queryset)
+        if self.action in ('list', 'retrieve'):
+            queryset = self.for_reading(queryset)
         return queryset
 
+    def get_user_flags(self):
+        """Признаки пользователя, нужные полям ответа и фильтрам"""
+        fields = self.get_selected_fields()
+        if fields is None:
+            return USER_FLAGS
+        needed = {'author_is_subscribed'} if 'author' in fields else set()
+        for flag in ('is_favorited', 'is_in_shopping_cart'):
+            if flag in fields or flag in self.request.query_params:
+                needed.add(flag)
+        return [flag for flag in USER_FLAGS if flag in needed]
+
+    def for_reading(self, queryset):
+        """Связанные объекты для RecipeSerializer или строки values().
+
+        Загружается только то, что нужно выбранным полям ответа.
+        """
+        fields = self.get_selected_fields()
+        if self.use_fast_path():
+            return self.fast_serializer_class.values(queryset, fields)
+        if fields is not None:
+            deferred = [] if 'text' in fields else ['text']
+            if not {'image', 'image_variants'} & set(fields):
+                deferred.append('image')
+            queryset = queryset.defer(*deferred)
+        return queryset.with_related(fields)
+
+    def get_object(self):
+        """Рецепт одним запросом, связанные объекты - параллельно"""
+        queryset = self.filter_queryset(self.get_queryset())
+        recipe = get_object_or_404(
+            queryset.prefetch_related(None), pk=self.kwargs['pk']
+        )
+        prefetch_concurrently([recipe], queryset._prefetch_related_lookups)
+        self.check_object_permissions(self.request, recipe)
+        return recipe
+
+    def get_tags_mode(self):
+        """Режим фильтра по тегам: any - любой из тегов, all - все"""
+        mode = self.request.query_params.get('tags_mode', 'any')
+        if mode not in TAGS_MODES:
+            raise ValidationError(
+                {'tags_mode': f'Допустимые значения: {", ".join(TAGS_MODES)}.'}
+            )
+        return mode
+
     def get_serializer_class(self):
         """Выбор сериалайзера"""
         if self.action in ('create', 'partial_update'):
             return RecipeCreateSerializer
-        return RecipeSerializer
+        return super().get_serializer_class()
 
     def perform_create(self, serializer):
         """Обработка запроса создания рецепта"""
@@ -92,33 +261,131 @@ class RecipeViewSet(viewsets.ModelViewSet):
         detail=False,
         methods=["GET", ],
         permission_classes=(IsAuthenticated,),
+        renderer_classes=(
+            ShoppingListTextRenderer,
+            ShoppingListCSVRenderer,
+            ShoppingListPDFRenderer,
+        ),
     )
     def download_shopping_cart(self, request, *args, **kwargs):
         """Скачивание файла покупок"""
-        queryset = Recipe.objects.all()
-        user = request.user
-        queryset = queryset.filter(cart__user=user).order_by('-pub_date')
-        shoppingcart = {}
-        for recipe in queryset:
-            ingredients = Ingredient.objects.all().filter(recipes=recipe)
-            for ingredient in ingredients:
-                amount = IngredientInRecipe.objects.get(
-                    recipe=recipe,
-                    ingredient=ingredient
-                ).amount
-                if shoppingcart.get(ingredient) is not None:
-                    shoppingcart[ingredient] += amount
-                else:
-                    shoppingcart[ingredient] = amount
-        username = user.username
-        filename = f'{username}.txt'
-        with open(f'{MEDIA_ROOT}/{filename}', 'w', encoding="utf-8") as file:
-            for i in shoppingcart.keys():
-                s = f'{i.name} ({i.measurement_unit}) - {shoppingcart[i]}\n'
-                file.write(s)
-        return FileResponse(
-            open(f'{MEDIA_ROOT}/{filename}', 'rb'),
-            filename=filename
+        rows = list(shopping_list(request.user))
+        renderer = request.accepted_renderer
+        digest = hashlib.sha256(repr(rows).encode('utf-8')).hexdigest()
+        cache_key = f'shopping_list:{renderer.format}:{digest}'
+        content = cache.get(cache_key)
+        if content is None:
+            chunks = self._stream_to_cache(renderer.stream(rows), cache_key)
+        else:
+            chunks = iter((content,))
+        response = StreamingHttpResponse(
+            chunks, content_type=renderer.media_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="{request.user.username}.'
+            f'{renderer.format}"'
+        )
+        return response
+
+    @action(
+        detail=False,
+        methods=["GET", ],
+        permission_classes=(IsAuthenticated,),
+    )
+    def shopping_list(self, request, *args, **kwargs):
+        """Список покупок с суммами ингредиентов по корзине"""
+        return self.conditional_response(self._shopping_list, request)
+
+    def _shopping_list(self, request):
+        return Response(ShoppingListItemSerializer(
+            shopping_list(request.user), many=True
+        ).data)
+
+    @action(
+        detail=False,
+        methods=["GET", ],
+        permission_classes=(IsAuthenticated,),
+    )
+    def feed(self, request, *args, **kwargs):
+        """Лента рецептов авторов из подписок"""
+        queryset = feed_queryset(request.user).with_user_flags(
+            request.user, self.get_user_flags()
+        )
+        tags = request.query_params.getlist('tags')
+        if tags:
+            queryset = filter_by_tags(queryset, tags, self.get_tags_mode())
+        paginator = FeedCursorPagination()
+        page = paginator.paginate_queryset(
+            self.for_reading(queryset), request, view=self
+        )
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=["GET", ])
+    def match(self, request, *args, **kwargs):
+        """Рецепты, которые можно приготовить из имеющихся продуктов"""
+        pantry = parse_ids(request, 'ingredients')
+        if len(pantry) > settings.PANTRY_MAX_INGREDIENTS:
+            raise ValidationError({'ingredients': (
+                f'Не больше {settings.PANTRY_MAX_INGREDIENTS} ингредиентов.'
+            )})
+        limit = min(parse_limit(request, MATCH_LIMIT), MATCH_MAX_LIMIT)
+        matches = pantry_index.match(pantry, limit)
+        recipes = Recipe.objects.in_bulk(
+            [recipe_id for recipe_id, *_ in matches]
+        )
+        ingredients = Ingredient.objects.in_bulk(
+            {pk for *_, missing in matches for pk in missing}
+        )
+        results = []
+        for recipe_id, matched, total, missing in matches:
+            recipe = recipes.get(recipe_id)
+            if recipe is None:
+                continue
+            recipe.matched = matched
+            recipe.total = total
+            recipe.missing = [ingredients[pk] for pk in missing]
+            results.append(recipe)
+        return Response(RecipeMatchSerializer(
+            results, many=True, context=self.get_serializer_context()
+        ).data)
+
+    def _short_recipes(self, recipe_ids):
+        """Краткие рецепты в порядке recipe_ids"""
+        recipes = Recipe.objects.in_bulk(recipe_ids)
+        return Response(ShortRecipeSerialaizer(
+            [recipes[pk] for pk in recipe_ids if pk in recipes],
+            many=True, context=self.get_serializer_context(),
+        ).data)
+
+    @action(detail=True, methods=["GET", ])
+    def similar(self, request, *args, **kwargs):
+        """Рецепты, которые часто добавляют вместе с этим"""
+        recipe_id = get_object_or_404(
+            Recipe.objects.values_list('id', flat=True), id=kwargs['pk']
+        )
+        limit = min(parse_limit(request, SIMILAR_LIMIT), SIMILAR_MAX_LIMIT)
+        return self._short_recipes(similar_recipes(recipe_id, limit))
+
+    @action(
+        detail=False,
+        methods=["GET", ],
+        permission_classes=(IsAuthenticated,),
+    )
+    def recommended(self, request, *args, **kwargs):
+        """Рецепты, похожие на избранное и список покупок пользователя"""
+        limit = min(parse_limit(request, SIMILAR_LIMIT), SIMILAR_MAX_LIMIT)
+        return self._short_recipes(recommended_recipes(request.user, limit))
+
+    @staticmethod
+    def _stream_to_cache(chunks, cache_key):
+        """Отдача файла частями с сохранением в кэш после отправки"""
+        parts = []
+        for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+        cache.set(
+            cache_key, b''.join(parts), settings.SHOPPING_LIST_CACHE_TIMEOUT
         )
 
     @action(
@@ -131,7 +398,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """Добавление/удаление избранного рецепта """
         recipe_id = kwargs.get("pk")
         recipe = get_object_or_404(Recipe, id=recipe_id)
-        user = get_object_or_404(User, id=self.request.user.id)
+        user = request.user
         if request.method == 'POST':
             if Favorite.objects.filter(user=user, favorite=recipe).exists():
                 return Response(
@@ -158,6 +425,28 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return Response(
                 status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False,
+        methods=["POST", "DELETE"],
+        permission_classes=(IsAuthenticated,),
+        url_path='favorite',
+        url_name='favorite-bulk',
+    )
+    def favorite_bulk(self, request, *args, **kwargs):
+        """Добавление/удаление нескольких рецептов в избранном"""
+        return bulk_response(request, bulk_favorite)
+
+    @action(
+        detail=False,
+        methods=["POST", "DELETE"],
+        permission_classes=(IsAuthenticated,),
+        url_path='shopping_cart',
+        url_name='shopping-cart-bulk',
+    )
+    def shopping_cart_bulk(self, request, *args, **kwargs):
+        """Добавление/удаление нескольких рецептов в списке покупок"""
+        return bulk_response(request, bulk_shopping_cart)
+
     @action(
         detail=True,
         methods=["POST", "DELETE"],
@@ -168,7 +457,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """Добавление/удаление в список покупок"""
         recipe_id = kwargs.get("pk")
         recipe = get_object_or_404(Recipe, id=recipe_id)
-        user = get_object_or_404(User, id=self.request.user.id)
+        user = request.user
         if request.method == 'POST':
             if Shopping_cart.objects.filter(
                 user=user, purchase=recipe
@@ -199,11 +488,25 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_204_NO_CONTENT)
 
 
-class UserViewSet(DjoserUserViewSet):
+class UserViewSet(AsyncViewMixin, SparseFieldsMixin, DjoserUserViewSet):
     """Вьюсет для обработки рецептов"""
     queryset = User.objects.all().order_by('id')
     serializer_class = CustomUserSerializer
     pagination_class = CustomPagination
+    sparse_actions = ('list', 'retrieve', 'me', 'subscriptions')
+
+    def get_queryset(self):
+        """Получение списка пользователей с признаком подписки"""
+        queryset = super().get_queryset()
+        user = self.request.user
+        fields = self.get_selected_fields()
+        if not user.is_authenticated or (
+            fields is not None and 'is_subscribed' not in fields
+        ):
+            return queryset
+        return queryset.annotate(is_subscribed=Exists(
+            Subscribe.objects.filter(subscriber=user, author=OuterRef('pk'))
+        ))
 
     @action(
         detail=False,
@@ -216,9 +519,26 @@ class UserViewSet(DjoserUserViewSet):
         serializer = CustomUserSerializer(
             user,
             context={'request': request},
+            selected_fields=self.get_selected_fields(),
         )
         return Response(serializer.data)
 
+    def get_subscription_context(self, authors):
+        """Контекст сериалайзера подписок с превью рецептов авторов"""
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if recipes_limit is not None:
+            if not recipes_limit.isdigit():
+                raise ValidationError(
+                    {'recipes_limit': 'Ожидается целое неотрицательное число.'}
+                )
+            recipes_limit = int(recipes_limit)
+        return {
+            'request': self.request,
+            'recipes': Recipe.objects.previews_by_author(
+                [author.id for author in authors], recipes_limit
+            ),
+        }
+
     @action(
         detail=False,
         methods=["GET", ],
@@ -229,15 +549,34 @@ class UserViewSet(DjoserUserViewSet):
         user = self.request.user
         queryset = User.objects.filter(
             content_author__subscriber=user
+        ).annotate(
+            is_subscribed=Value(True, output_field=BooleanField()),
         ).order_by('id')
-        self.paginate_queryset(queryset)
+        page = self.paginate_queryset(queryset)
+        fields = self.get_selected_fields(SubscribeSerialaizer)
+        if 'recipes' in fields:
+            context = self.get_subscription_context(page)
+        else:
+            context = {'request': request}
         serializer = SubscribeSerialaizer(
-            queryset,
-            context={'request': request},
-            many=True)
+            page,
+            context=context,
+            many=True,
+            selected_fields=fields)
         data = serializer.data
         return self.get_paginated_response(data)
 
+    @action(
+        detail=False,
+        methods=["POST", "DELETE"],
+        permission_classes=(IsAuthenticated,),
+        url_path='subscribe',
+        url_name='subscribe-bulk',
+    )
+    def subscribe_bulk(self, request, *args, **kwargs):
+        """Подписка/отписка на нескольких авторов"""
+        return bulk_response(request, bulk_subscribe)
+
     @action(
         detail=True,
         methods=["POST", "DELETE"],
@@ -247,7 +586,7 @@ class UserViewSet(DjoserUserViewSet):
         """Подписка/отписка на автора """
         author_id = kwargs.get("id")
         author = get_object_or_404(User, id=author_id)
-        subscriber = get_object_or_404(User, id=self.request.user.id)
+        subscriber = request.user
         if request.method == 'POST':
             if author.id == subscriber.id:
                 return Response(
@@ -264,7 +603,7 @@ class UserViewSet(DjoserUserViewSet):
             subscribes = User.objects.filter(username=author.username)
             serializer = SubscribeSerialaizer(
                 subscribes,
-                context={'request': request},
+                context=self.get_subscription_context(subscribes),
                 many=True
             )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -26,6 +26,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.querylog.QueryLogMiddleware',
+    'api.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -62,10 +64,33 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', default='user'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='password'),
         'HOST': os.getenv('DB_HOST', default='db'),
-        'PORT': os.getenv('DB_PORT', default='5432')
+        'PORT': os.getenv('DB_PORT', default='5432'),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default=0)),
     }
 }
 
+
+def replica_database(location):
+    """Настройки реплики: файл для SQLite, иначе host[:port]"""
+    replica = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+    if replica['ENGINE'].endswith('sqlite3'):
+        replica['NAME'] = location
+    else:
+        replica['HOST'], _, port = location.partition(':')
+        replica['PORT'] = port or replica['PORT']
+    return replica
+
+
+DATABASE_REPLICAS = []
+
+for number, location in enumerate(filter(None, os.getenv('DB_REPLICAS', default='').split(',')), start=1):
+    DATABASES[f'replica{number}'] = replica_database(location.strip())
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', default=5))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -86,7 +111,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     "PAGE_SIZE": 6,
@@ -109,6 +134,35 @@ DJOSER = {
 
 AUTH_USER_MODEL = "users.User"
 
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache')
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    }
+}
+
+# Кэш в памяти процесса не видят другие воркеры: они не узнают о новых
+# версиях данных. Фрагменты рецептов и ETag по умолчанию включены только
+# с общим кэшем (Redis, Memcached, база).
+SHARED_CACHE = CACHE_BACKEND not in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+CONDITIONAL_GET = os.getenv('CONDITIONAL_GET', default=str(SHARED_CACHE)) == 'True'
+
+LOCAL_INDEX_TTL = int(os.getenv('LOCAL_INDEX_TTL', default=60))
+
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', default=10000))
+
+FEED_BACKFILL_SIZE = int(os.getenv('FEED_BACKFILL_SIZE', default=200))
+
+SHOPPING_LIST_CACHE_TIMEOUT = int(os.getenv('SHOPPING_LIST_CACHE_TIMEOUT', default=60 * 60))
+
+SHOPPING_LIST_PDF_FONT = os.getenv('SHOPPING_LIST_PDF_FONT', default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+
 EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
 
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
@@ -130,3 +184,37 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'data/backend_static')
 
 MEDIA_URL = '/backend_media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'data/backend_media')
+
+IMAGE_VARIANTS_ASYNC = os.getenv('IMAGE_VARIANTS_ASYNC', default='True') == 'True'
+
+IMAGE_VARIANTS_WORKERS = int(os.getenv('IMAGE_VARIANTS_WORKERS', default=2))
+
+PANTRY_REFRESH_SECONDS = float(os.getenv('PANTRY_REFRESH_SECONDS', default=5))
+
+PANTRY_REBUILD_SECONDS = float(os.getenv('PANTRY_REBUILD_SECONDS', default=10 * 60))
+
+PANTRY_MAX_INGREDIENTS = int(os.getenv('PANTRY_MAX_INGREDIENTS', default=100))
+
+QUERY_LOG_ENABLED = os.getenv('QUERY_LOG_ENABLED', default='False') == 'True'
+
+QUERY_LOG_PATH = os.getenv('QUERY_LOG_PATH', default=os.path.join(BASE_DIR, 'data/query_log.jsonl'))
+
+QUERY_LOG_SLOW_MS = float(os.getenv('QUERY_LOG_SLOW_MS', default=100))
+
+QUERY_LOG_REPEAT_LIMIT = int(os.getenv('QUERY_LOG_REPEAT_LIMIT', default=5))
+
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', default='False') == 'True'
+
+ASYNC_QUERY_WORKERS = int(os.getenv('ASYNC_QUERY_WORKERS', default=8))
+
+FAST_READ_PATH = os.getenv('FAST_READ_PATH', default='True') == 'True'
+
+RECIPE_FRAGMENT_CACHE = os.getenv('RECIPE_FRAGMENT_CACHE', default=str(SHARED_CACHE)) == 'True'
+
+RECIPE_FRAGMENT_TIMEOUT = int(os.getenv('RECIPE_FRAGMENT_TIMEOUT', default=24 * 60 * 60))
+
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', default=10000))
+
+AUTH_TOKEN_CACHE_TTL = float(os.getenv('AUTH_TOKEN_CACHE_TTL', default=10))
+
+AUTH_TOKEN_SHARED_CACHE_TTL = int(os.getenv('AUTH_TOKEN_SHARED_CACHE_TTL', default=0))
@@ -0,0 +1,43 @@
+"""Профиль для seed_benchmark и run_benchmark: SQLite и кэш в памяти."""
+import os
+
+from foodgram.settings import *  # noqa: F401,F403
+from foodgram.settings import BASE_DIR
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.getenv(
+            'BENCHMARK_DB',
+            default=os.path.join(BASE_DIR, 'data/benchmark.sqlite3'),
+        ),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default=0)),
+    }
+}
+
+# Замеры идут на одной базе, DB_REPLICAS не учитывается. Алиас replica
+# нужен тестам роутера: в них это зеркало default со своим соединением.
+DATABASES['replica'] = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+
+DATABASE_REPLICAS = []
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark',
+    }
+}
+
+# Замеры и тесты идут в одном процессе, кэш в памяти для них общий.
+CONDITIONAL_GET = True
+
+RECIPE_FRAGMENT_CACHE = True
+
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+IMAGE_VARIANTS_ASYNC = False
+
+QUERY_LOG_ENABLED = False
+
+# Проверка изменений рецептов посреди замера меняла бы число запросов.
+PANTRY_REFRESH_SECONDS = 60 * 60
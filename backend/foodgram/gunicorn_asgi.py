@@ -0,0 +1,20 @@
+"""Профиль gunicorn с воркерами uvicorn для foodgram.asgi.
+
+gunicorn foodgram.asgi:application -c gunicorn_asgi.py
+"""
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', default='0:8000')
+
+workers = int(os.getenv(
+    'GUNICORN_WORKERS', default=multiprocessing.cpu_count()
+))
+
+worker_class = 'uvicorn.workers.UvicornWorker'
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', default=30))
+
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', default=30))
+
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', default=5))
@@ -2,6 +2,7 @@ from django.contrib import admin
 
 from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
                             Shopping_cart, Tag)
+from recipes.search import search_recipes
 
 
 class IngredientsInLine(admin.TabularInline):
@@ -30,13 +31,21 @@ class RecipeAdmin(admin.ModelAdmin):
         'name', 'author', 'favorite_count'
     )
     list_filter = ('name', 'author', 'tags')
+    search_fields = ('name',)
     inlines = (IngredientsInLine, )
 
+    def get_search_results(self, request, queryset, search_term):
+        """Полнотекстовый поиск вместо icontains по полям"""
+        if not search_term.strip():
+            return queryset, False
+        return search_recipes(queryset, search_term), False
+
     @admin.display(
         description='Количество добавлений в избранное',
+        ordering='favorites_count',
     )
     def favorite_count(self, obj):
-        return Favorite.objects.filter(favorite=obj).count()
+        return obj.favorites_count
 
 
 @admin.register(Favorite)
@@ -0,0 +1,173 @@
+import threading
+from bisect import bisect_left
+from collections import Counter, OrderedDict, defaultdict
+
+from django.db import DEFAULT_DB_ALIAS
+
+from recipes.models import Ingredient
+from recipes.versions import local_version
+
+MAX_CHAR = chr(0x10FFFF)
+FUZZY_CANDIDATES = 64
+RESULTS_CACHE_SIZE = 1024
+
+
+def trigrams(text, padded=False):
+    """Множество триграмм строки.
+
+    Дополненная пробелами в начале строка даёт ещё триграммы начала
+    слова: по ним находятся опечатки в коротких запросах.
+    """
+    if padded:
+        text = '  ' + text
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def prefix_distance(query, name, max_distance):
+    """Расстояние Левенштейна от запроса до ближайшего префикса имени.
+
+    Возвращает None, если оно больше max_distance.
+    """
+    previous = list(range(len(query) + 1))
+    best = previous[-1]
+    for i, char in enumerate(name[:len(query) + max_distance], 1):
+        current = [i]
+        for j, query_char in enumerate(query, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char != query_char),
+            ))
+        if min(current) > max_distance:
+            break
+        best = min(best, current[-1])
+        previous = current
+    return best if best <= max_distance else None
+
+
+class _IndexState:
+    """Снимок индекса, который заменяется целиком при перестроении"""
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.items = [
+            {'id': pk, 'name': name, 'measurement_unit': unit}
+            for pk, name, unit in rows
+        ]
+        self.sorted_items = sorted(
+            self.items, key=lambda item: (item['name'].lower(), item['id'])
+        )
+        self.names = [item['name'].lower() for item in self.sorted_items]
+        self.trigrams = defaultdict(set)
+        for position, name in enumerate(self.names):
+            for trigram in trigrams(name, padded=True):
+                self.trigrams[trigram].add(position)
+        self.results = OrderedDict()
+
+
+class IngredientIndex:
+    """Индекс ингредиентов для автодополнения в памяти процесса.
+
+    Хранит отсортированный по имени массив для поиска по префиксу
+    и триграммный индекс для поиска по подстроке и опечаткам.
+    Перестраивается, когда меняется версия ингредиентов в кэше, а без
+    общего кэша - и по истечении LOCAL_INDEX_TTL.
+    """
+
+    def __init__(self):
+        self._state = None
+        self._lock = threading.Lock()
+
+    def _get_state(self):
+        version = local_version('ingredient')
+        state = self._state
+        if state is not None and state.version == version:
+            return state
+        with self._lock:
+            if self._state is None or self._state.version != version:
+                # Из основной базы: реплика может ещё не знать о новой
+                # версии, а индекс живёт до следующей.
+                rows = Ingredient.objects.using(
+                    DEFAULT_DB_ALIAS
+                ).order_by('id').values_list(
+                    'id', 'name', 'measurement_unit'
+                )
+                self._state = _IndexState(version, list(rows))
+            return self._state
+
+    def search(self, query, limit=None):
+        """Поиск: сначала префикс, затем подстрока, затем опечатки"""
+        state = self._get_state()
+        query = query.strip().lower()
+        if not query:
+            return state.items[:limit]
+        key = (query, limit)
+        try:
+            result = state.results[key]
+            state.results.move_to_end(key)
+        except KeyError:
+            result = self._search(state, query, limit)
+            state.results[key] = result
+            if len(state.results) > RESULTS_CACHE_SIZE:
+                state.results.popitem(last=False)
+        return result
+
+    def _search(self, state, query, limit):
+        start = bisect_left(state.names, query)
+        end = bisect_left(state.names, query + MAX_CHAR, lo=start)
+        positions = list(range(start, end))
+        found = set(positions)
+        if limit is None or len(positions) < limit:
+            positions.extend(self._substring(state, query, found))
+        if (limit is None or len(positions) < limit) and len(query) >= 3:
+            positions.extend(self._fuzzy(state, query, found))
+        return [state.sorted_items[position] for position in positions[:limit]]
+
+    @staticmethod
+    def _substring(state, query, found):
+        query_trigrams = trigrams(query)
+        if query_trigrams:
+            candidates = set.intersection(
+                *(state.trigrams.get(trigram, set())
+                  for trigram in query_trigrams)
+            )
+        else:
+            candidates = range(len(state.names))
+        matches = []
+        for position in candidates:
+            if position in found:
+                continue
+            index = state.names[position].find(query)
+            if index > 0:
+                matches.append((index, position))
+        matches.sort()
+        found.update(position for _, position in matches)
+        return [position for _, position in matches]
+
+    @staticmethod
+    def _fuzzy(state, query, found):
+        max_distance = 1 if len(query) <= 5 else 2
+        query_trigrams = trigrams(query, padded=True)
+        hits = Counter()
+        for trigram in query_trigrams:
+            hits.update(state.trigrams.get(trigram, ()))
+        min_hits = max(1, len(query_trigrams) - 3 * max_distance)
+        matches = []
+        for position, count in hits.most_common(
+            FUZZY_CANDIDATES + len(found)
+        ):
+            if count < min_hits:
+                break
+            if position in found:
+                continue
+            distance = prefix_distance(
+                query, state.names[position], max_distance
+            )
+            if distance is not None:
+                matches.append((distance, position))
+        matches.sort()
+        found.update(position for _, position in matches)
+        return [position for _, position in matches]
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,199 @@
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from recipes.counters import change_counter
+from recipes.feed import backfill_feed, prune_feed
+from recipes.models import Favorite, Recipe, Shopping_cart
+from recipes.shopping import add_recipes
+from users.models import Subscribe, User
+
+ADDED = 'added'
+EXISTS = 'exists'
+REMOVED = 'removed'
+ABSENT = 'absent'
+NOT_FOUND = 'not_found'
+SELF = 'self'
+
+
+def _returning(connection):
+    """Поддерживает ли СУБД INSERT/DELETE ... RETURNING"""
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version_info >= (3, 35)
+    return False
+
+
+def _lock_user(user_id):
+    """Блокировка строки пользователя до конца транзакции.
+
+    Для СУБД без RETURNING: пакетные операции одного пользователя
+    выполняются по очереди, и проверка связей не устаревает до записи.
+    """
+    list(User.objects.select_for_update().filter(pk=user_id).values('pk'))
+
+
+def _columns(model, connection, user_field, target_field):
+    quote = connection.ops.quote_name
+    return (
+        quote(model._meta.db_table),
+        quote(model._meta.get_field(user_field).column),
+        quote(model._meta.get_field(target_field).column),
+    )
+
+
+def link(model, user_field, target_field, user_id, target_ids):
+    """Создание связей, возвращает id целей, связь с которыми создана.
+
+    Один INSERT ... ON CONFLICT DO NOTHING RETURNING: связи, уже
+    созданные параллельным запросом, в результат не попадают.
+    Сигналы не отправляются, побочные эффекты применяет вызывающий код.
+    """
+    target_ids = list(dict.fromkeys(target_ids))
+    if not target_ids:
+        return []
+    connection = connections[router.db_for_write(model)]
+    if not _returning(connection):
+        _lock_user(user_id)
+        existing = set(model.objects.filter(**{
+            user_field: user_id, f'{target_field}__in': target_ids,
+        }).values_list(target_field, flat=True))
+        created = [pk for pk in target_ids if pk not in existing]
+        model.objects.bulk_create([
+            model(**{user_field: user_id, target_field: pk})
+            for pk in created
+        ])
+        return created
+    table, user_column, target_column = _columns(
+        model, connection, user_field, target_field
+    )
+    values = ', '.join(['(%s, %s)'] * len(target_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({user_column}, {target_column}) '
+            f'VALUES {values} ON CONFLICT DO NOTHING '
+            f'RETURNING {target_column}',
+            [value for pk in target_ids for value in (user_id, pk)],
+        )
+        created = {pk for pk, in cursor.fetchall()}
+    return [pk for pk in target_ids if pk in created]
+
+
+def unlink(model, user_field, target_field, user_id, target_ids):
+    """Удаление связей, возвращает id целей, связь с которыми удалена.
+
+    Один DELETE ... RETURNING: связь, удалённая параллельным запросом,
+    в результат не попадает. Сигналы не отправляются, побочные эффекты
+    применяет вызывающий код.
+    """
+    target_ids = list(dict.fromkeys(target_ids))
+    if not target_ids:
+        return []
+    connection = connections[router.db_for_write(model)]
+    table, user_column, target_column = _columns(
+        model, connection, user_field, target_field
+    )
+    placeholders = ', '.join(['%s'] * len(target_ids))
+    sql = (
+        f'DELETE FROM {table} WHERE {user_column} = %s '
+        f'AND {target_column} IN ({placeholders})'
+    )
+    with connection.cursor() as cursor:
+        if _returning(connection):
+            cursor.execute(
+                f'{sql} RETURNING {target_column}', [user_id, *target_ids]
+            )
+            removed = {pk for pk, in cursor.fetchall()}
+        else:
+            _lock_user(user_id)
+            removed = set(model.objects.filter(**{
+                user_field: user_id, f'{target_field}__in': target_ids,
+            }).values_list(target_field, flat=True))
+            cursor.execute(sql, [user_id, *target_ids])
+    return [pk for pk in target_ids if pk in removed]
+
+
+def _results(target_ids, changed, found=None, skipped=(), add=True):
+    """Итог по каждому id в порядке запроса"""
+    changed = set(changed)
+    results = []
+    for pk in target_ids:
+        if found is not None and pk not in found:
+            status = NOT_FOUND
+        elif pk in skipped:
+            status = SELF
+        elif pk in changed:
+            status = ADDED if add else REMOVED
+        else:
+            status = EXISTS if add else ABSENT
+        results.append({'id': pk, 'status': status})
+    return results
+
+
+def _existing(model, ids):
+    return set(model.objects.filter(id__in=ids).values_list('id', flat=True))
+
+
+@transaction.atomic
+def bulk_favorite(user_id, recipe_ids, add=True):
+    """Добавление или удаление рецептов из избранного"""
+    found = _existing(Recipe, recipe_ids) if add else None
+    if add:
+        changed = link(
+            Favorite, 'user_id', 'favorite_id', user_id,
+            [pk for pk in recipe_ids if pk in found],
+        )
+    else:
+        changed = unlink(
+            Favorite, 'user_id', 'favorite_id', user_id, recipe_ids
+        )
+    change_counter(
+        Recipe, 'favorites_count', changed, 1 if add else -1,
+        interactions_changed_at=timezone.now(),
+    )
+    return _results(recipe_ids, changed, found, add=add)
+
+
+@transaction.atomic
+def bulk_shopping_cart(user_id, recipe_ids, add=True):
+    """Добавление или удаление рецептов из корзины"""
+    found = _existing(Recipe, recipe_ids) if add else None
+    if add:
+        changed = link(
+            Shopping_cart, 'user_id', 'purchase_id', user_id,
+            [pk for pk in recipe_ids if pk in found],
+        )
+    else:
+        changed = unlink(
+            Shopping_cart, 'user_id', 'purchase_id', user_id, recipe_ids
+        )
+    sign = 1 if add else -1
+    change_counter(
+        Recipe, 'carts_count', changed, sign,
+        interactions_changed_at=timezone.now(),
+    )
+    add_recipes(user_id, changed, sign)
+    return _results(recipe_ids, changed, found, add=add)
+
+
+@transaction.atomic
+def bulk_subscribe(user_id, author_ids, add=True):
+    """Подписка на авторов или отписка от них"""
+    found = _existing(User, author_ids) if add else None
+    if add:
+        changed = link(
+            Subscribe, 'subscriber_id', 'author_id', user_id,
+            [pk for pk in author_ids if pk in found and pk != user_id],
+        )
+        for author_id in changed:
+            backfill_feed(user_id, author_id)
+    else:
+        changed = unlink(
+            Subscribe, 'subscriber_id', 'author_id', user_id, author_ids
+        )
+        for author_id in changed:
+            prune_feed(user_id, author_id)
+    change_counter(User, 'subscribers_count', changed, 1 if add else -1)
+    return _results(
+        author_ids, changed, found, skipped={user_id} if add else (), add=add
+    )
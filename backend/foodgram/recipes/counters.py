@@ -0,0 +1,45 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.models import Favorite, Recipe, Shopping_cart
+from users.models import Subscribe, User
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'favorite'),
+    (Recipe, 'carts_count', Shopping_cart, 'purchase'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'subscribers_count', Subscribe, 'author'),
+)
+
+
+def change_counter(model, field, ids, delta, **fields):
+    """Атомарное изменение счётчика у строк ids одним UPDATE.
+
+    В fields можно передать другие поля, обновляемые тем же запросом.
+    """
+    if not ids or not delta:
+        return
+    model.objects.filter(pk__in=ids).update(
+        **{field: Greatest(F(field) + delta, 0)}, **fields
+    )
+
+
+def actual_count(source, lookup):
+    return Coalesce(
+        Subquery(
+            source.objects.filter(**{lookup: OuterRef('pk')}).order_by()
+            .values(lookup).annotate(count=Count('pk')).values('count')
+        ),
+        0,
+    )
+
+
+def reconcile_counters():
+    """Пересчёт разошедшихся счётчиков, возвращает число исправлений"""
+    fixed = {}
+    for model, field, source, lookup in COUNTERS:
+        actual = actual_count(source, lookup)
+        fixed[f'{model._meta.model_name}.{field}'] = model.objects.annotate(
+            actual=actual
+        ).exclude(**{field: F('actual')}).update(**{field: actual})
+    return fixed
@@ -0,0 +1,103 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import F, Q
+
+from recipes.models import FeedEntry, Recipe
+from users.models import Subscribe, User
+
+
+def is_fanned_out(author_id):
+    """Раздаётся ли автор по лентам при записи.
+
+    У авторов с очень большим числом подписчиков лента собирается
+    при чтении.
+    """
+    return User.objects.filter(
+        pk=author_id,
+        subscribers_count__lte=settings.FEED_FANOUT_LIMIT,
+    ).exists()
+
+
+def fan_out_recipe(recipe):
+    """Запись нового рецепта в ленты подписчиков автора"""
+    fan_out_recipes([recipe])
+
+
+def fan_out_recipes(recipes):
+    """Запись новых рецептов в ленты подписчиков их авторов"""
+    by_author = defaultdict(list)
+    for recipe in recipes:
+        by_author[recipe.author_id].append(recipe)
+    subscriptions = Subscribe.objects.filter(
+        author_id__in=User.objects.filter(
+            pk__in=by_author,
+            subscribers_count__lte=settings.FEED_FANOUT_LIMIT,
+        ).values('pk')
+    ).values_list('subscriber_id', 'author_id')
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(
+                subscriber_id=subscriber_id,
+                recipe_id=recipe.id,
+                author_id=author_id,
+                pub_date=recipe.pub_date,
+            )
+            for subscriber_id, author_id in subscriptions.iterator()
+            for recipe in by_author[author_id]
+        ),
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+def backfill_feed(subscriber_id, author_id):
+    """Последние рецепты автора в ленту нового подписчика"""
+    if not is_fanned_out(author_id):
+        return
+    recipes = Recipe.objects.filter(author_id=author_id).order_by(
+        '-pub_date', '-id'
+    ).values_list('id', 'pub_date')[:settings.FEED_BACKFILL_SIZE]
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(
+                subscriber_id=subscriber_id,
+                recipe_id=recipe_id,
+                author_id=author_id,
+                pub_date=pub_date,
+            )
+            for recipe_id, pub_date in recipes
+        ),
+        ignore_conflicts=True,
+    )
+
+
+def prune_feed(subscriber_id, author_id):
+    """Удаление рецептов автора из ленты после отписки"""
+    FeedEntry.objects.filter(
+        subscriber_id=subscriber_id, author_id=author_id
+    ).delete()
+
+
+def feed_queryset(user):
+    """Рецепты ленты пользователя с полем feed_pub_date для курсора.
+
+    Обычно это один проход по индексу ленты подписчика. Рецепты авторов,
+    которые не раздаются при записи, добавляются при чтении.
+    """
+    pulled_authors = list(
+        Subscribe.objects.filter(
+            subscriber=user,
+            author__subscribers_count__gt=settings.FEED_FANOUT_LIMIT,
+        ).values_list('author_id', flat=True)
+    )
+    if not pulled_authors:
+        return Recipe.objects.filter(
+            feed_entries__subscriber=user
+        ).annotate(feed_pub_date=F('feed_entries__pub_date'))
+    return Recipe.objects.filter(
+        Q(id__in=FeedEntry.objects.filter(
+            subscriber=user
+        ).values('recipe_id'))
+        | Q(author_id__in=pulled_authors)
+    ).annotate(feed_pub_date=F('pub_date'))
@@ -0,0 +1,14 @@
+from django.db import models
+
+
+class SearchVectorField(models.TextField):
+    """Колонка tsvector для полнотекстового поиска PostgreSQL.
+
+    В других СУБД это обычная текстовая колонка, которая остаётся
+    пустой: SQLite ищет по отдельной таблице FTS5.
+    """
+
+    def db_type(self, connection):
+        if connection.vendor == 'postgresql':
+            return 'tsvector'
+        return super().db_type(connection)
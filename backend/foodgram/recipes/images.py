@@ -0,0 +1,145 @@
+import io
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from recipes.models import Recipe
+from recipes.versions import bump_version
+
+logger = logging.getLogger(__name__)
+
+VARIANTS = {
+    'thumbnail': (320, 320),
+    'card': (640, 640),
+}
+
+FORMATS = {
+    'jpeg': ('jpg', {'quality': 85, 'optimize': True, 'progressive': True}),
+    'webp': ('webp', {'quality': 80, 'method': 4}),
+}
+
+VARIANTS_DIR = 'recipes/variants'
+
+_executor = None
+
+
+def variant_name(name, variant, image_format):
+    """Имя файла варианта картинки в хранилище.
+
+    Строится из полного пути оригинала вместе с расширением: загрузки
+    называются temp.<ext>, и temp.png с temp.jpeg не должны делить копии.
+    """
+    base, original_extension = os.path.splitext(name)
+    stem = base + original_extension.replace('.', '_')
+    extension = FORMATS[image_format][0]
+    return f'{VARIANTS_DIR}/{stem}_{variant}.{extension}'
+
+
+def variant_names(name):
+    return {
+        variant: {
+            image_format: variant_name(name, variant, image_format)
+            for image_format in FORMATS
+        }
+        for variant in VARIANTS
+    }
+
+
+def has_variants(name):
+    return all(
+        default_storage.exists(path)
+        for formats in variant_names(name).values()
+        for path in formats.values()
+    )
+
+
+def mark_variants_ready(name):
+    """Отметка рецептов с картинкой name: копии созданы, API их отдаёт.
+
+    Возвращает id отмеченных рецептов.
+    """
+    recipe_ids = list(Recipe.objects.filter(
+        image=name, image_variants_ready=False
+    ).values_list('pk', flat=True))
+    Recipe.objects.filter(pk__in=recipe_ids).update(image_variants_ready=True)
+    return recipe_ids
+
+
+def bump_recipe_versions(recipe_ids):
+    """Сброс кэша рецептов с готовыми копиями.
+
+    Вызывается в процессе веб-сервера, а не в пуле: кэш в памяти
+    дочернего процесса веб-серверу не виден.
+    """
+    for recipe_id in recipe_ids:
+        bump_version(f'recipe:{recipe_id}')
+
+
+def generate_variants(name, force=False):
+    """Уменьшенные копии картинки в JPEG и WebP.
+
+    Возвращает список созданных файлов и id рецептов, отмеченных
+    готовыми; их версии сбрасывает вызывающий процесс.
+    """
+    created = []
+    with default_storage.open(name, 'rb') as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image = image.convert('RGB')
+    for variant, size in VARIANTS.items():
+        resized = image.copy()
+        resized.thumbnail(size, Image.LANCZOS)
+        for image_format, (_, params) in FORMATS.items():
+            path = variant_name(name, variant, image_format)
+            if default_storage.exists(path):
+                if not force:
+                    continue
+                default_storage.delete(path)
+            buffer = io.BytesIO()
+            resized.save(buffer, format=image_format.upper(), **params)
+            created.append(
+                default_storage.save(path, ContentFile(buffer.getvalue()))
+            )
+    return created, mark_variants_ready(name)
+
+
+def _init_worker():
+    django.setup()
+
+
+def get_executor():
+    """Пул процессов для нарезки картинок, общий для процесса"""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.IMAGE_VARIANTS_WORKERS,
+            initializer=_init_worker,
+        )
+    return _executor
+
+
+def _variants_done(future):
+    if future.exception() is not None:
+        logger.error(
+            'Не удалось создать варианты картинки',
+            exc_info=future.exception(),
+        )
+        return
+    _, recipe_ids = future.result()
+    bump_recipe_versions(recipe_ids)
+
+
+def schedule_variants(name, force=False):
+    """Создание вариантов в пуле процессов, не блокируя запрос"""
+    if not settings.IMAGE_VARIANTS_ASYNC:
+        created, recipe_ids = generate_variants(name, force)
+        bump_recipe_versions(recipe_ids)
+        return created
+    future = get_executor().submit(generate_variants, name, force)
+    future.add_done_callback(_variants_done)
+    return future
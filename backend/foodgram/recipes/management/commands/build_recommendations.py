@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.recommendations import build_recommendations
+
+
+class Command(BaseCommand):
+    help = (
+        'Расчёт похожих рецептов по избранному и спискам покупок. '
+        'По умолчанию пересчитываются только изменившиеся рецепты.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Пересчитать все рецепты',
+        )
+        parser.add_argument(
+            '--neighbours', type=int, default=20,
+            help='Сколько похожих рецептов хранить для каждого',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help='Сколько рецептов считать за один проход',
+        )
+        parser.add_argument(
+            '--cart-weight', type=float, default=0.5,
+            help='Вес рецепта в списке покупок относительно избранного',
+        )
+
+    def handle(self, *args, **options):
+        if options['neighbours'] < 1 or options['chunk_size'] < 1:
+            raise CommandError(
+                '--neighbours и --chunk-size должны быть больше нуля.'
+            )
+        started = time.monotonic()
+        count = build_recommendations(
+            limit=options['neighbours'],
+            chunk_size=options['chunk_size'],
+            cart_weight=options['cart_weight'],
+            full=options['full'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано рецептов: {count} '
+            f'за {time.monotonic() - started:.1f} с'
+        ))
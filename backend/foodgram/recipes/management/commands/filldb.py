@@ -1,25 +1,357 @@
 import csv
+import json
+import os
+import time
+from collections import Counter
+from itertools import islice
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
-from recipes.models import Ingredient
+from recipes.counters import change_counter
+from recipes.feed import fan_out_recipes
+from recipes.models import Ingredient, IngredientInRecipe, Recipe, Tag
+from recipes.search import index_recipes
+from recipes.tagmask import refresh_tags_masks
+from recipes.versions import bump_version
+from users.models import User
 
 
-def fill_ingredient_data(path):
-    try:
-        with open(path, encoding="utf8") as f:
-            reader = csv.reader(f)
-            next(reader, None)
-            for row in reader:
-                Ingredient.objects.get_or_create(
-                    name=row[0],
-                    measurement_unit=row[1],
-                )
-    except IOError:
-        print("no category data")
+def read_csv(file, fields):
+    """Построчное чтение CSV без заголовка или с заголовком из fields"""
+    for row in csv.reader(file):
+        if not row or tuple(row) == fields:
+            continue
+        yield dict(zip(fields, row))
+
+
+def read_json(file):
+    """Чтение JSON-массива или JSON Lines (по объекту на строку)"""
+    head = file.read(1)
+    while head and head.isspace():
+        head = file.read(1)
+    if head == '[':
+        yield from json.loads(head + file.read())
+        return
+    line = head + file.readline()
+    while line:
+        if line.strip():
+            yield json.loads(line)
+        line = file.readline()
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
+
+
+class Importer:
+    """Пакетная загрузка записей одной модели.
+
+    unique_fields - группы полей с ограничением уникальности: записи,
+    совпадающие с уже загруженными по любой группе, пропускаются.
+    """
+    model = None
+    fields = ()
+    unique_fields = ()
+    version = None
+
+    def __init__(self, options):
+        self.options = options
+
+    def build(self, record):
+        raise NotImplementedError
+
+    def existing_keys(self, objects):
+        """Уже загруженные значения каждой группы unique_fields"""
+        existing = {}
+        for group in self.unique_fields:
+            lookup = {f'{group[0]}__in': {
+                getattr(obj, group[0]) for obj in objects
+            }}
+            existing[group] = set(
+                self.model.objects.filter(**lookup).values_list(*group)
+            )
+        return existing
+
+    def save(self, objects):
+        """Запись пакета, возвращает число добавленных строк.
+
+        Число считается по ключам, которых не было в базе и пакете до
+        записи: bulk_create с ignore_conflicts не сообщает, какие строки
+        вставлены.
+        """
+        existing = self.existing_keys(objects)
+        new = []
+        for obj in objects:
+            keys = {
+                group: tuple(getattr(obj, name) for name in group)
+                for group in self.unique_fields
+            }
+            if any(key in existing[group] for group, key in keys.items()):
+                continue
+            for group, key in keys.items():
+                existing[group].add(key)
+            new.append(obj)
+        self.model.objects.bulk_create(new, ignore_conflicts=True)
+        return len(new)
+
+
+class IngredientImporter(Importer):
+    model = Ingredient
+    fields = ('name', 'measurement_unit')
+    unique_fields = (('name', 'measurement_unit'),)
+    version = 'ingredient'
+
+    def build(self, record):
+        return Ingredient(
+            name=record['name'].strip(),
+            measurement_unit=record['measurement_unit'].strip(),
+        )
+
+
+class TagImporter(Importer):
+    model = Tag
+    fields = ('name', 'color', 'slug')
+    unique_fields = (('name',), ('color',), ('slug',))
+    version = 'tag'
+
+    def build(self, record):
+        return Tag(
+            name=record['name'].strip(),
+            color=record['color'].strip(),
+            slug=record['slug'].strip(),
+        )
+
+
+class RecipeImporter(Importer):
+    """Загрузка примеров рецептов из JSON.
+
+    Запись: name, text, cooking_time, author (email), tags (slug)
+    и ingredients [{name, measurement_unit, amount}]. Рецепты пакета
+    записываются одним bulk_create; то, что для одного рецепта делают
+    сигналы post_save, выполняется один раз на пакет.
+    """
+    model = Recipe
+    fields = ('name', 'text', 'cooking_time', 'author')
+
+    def build(self, record):
+        author = record.get('author') or self.options['author']
+        if not author:
+            raise CommandError(
+                'Для рецептов без поля author укажите --author.'
+            )
+        return {
+            'name': record['name'],
+            'text': record['text'],
+            'cooking_time': int(record['cooking_time']),
+            'author': author,
+            'tags': record.get('tags', []),
+            'ingredients': [
+                (item['name'], item['measurement_unit'], int(item['amount']))
+                for item in record.get('ingredients', [])
+            ],
+        }
+
+    def save(self, objects):
+        authors = User.objects.in_bulk(
+            {item['author'] for item in objects}, field_name='email'
+        )
+        tags = Tag.objects.in_bulk(
+            {slug for item in objects for slug in item['tags']},
+            field_name='slug',
+        )
+        ingredients = {
+            (ingredient.name, ingredient.measurement_unit): ingredient
+            for ingredient in Ingredient.objects.filter(name__in={
+                name for item in objects
+                for name, _, _ in item['ingredients']
+            })
+        }
+        existing = set(Recipe.objects.filter(
+            author__in=authors.values(),
+            name__in={item['name'] for item in objects},
+        ).values_list('author__email', 'name'))
+        items = []
+        for item in objects:
+            key = (item['author'], item['name'])
+            if item['author'] in authors and key not in existing:
+                existing.add(key)
+                items.append(item)
+        if not items:
+            return 0
+        recipes = self.create_recipes(items, authors)
+        tag_links = [
+            Recipe.tags.through(recipe=recipe, tag=tags[slug])
+            for recipe, item in zip(recipes, items)
+            for slug in item['tags'] if slug in tags
+        ]
+        amounts = [
+            IngredientInRecipe(
+                recipe=recipe,
+                ingredient=ingredients[(name, unit)],
+                amount=amount,
+            )
+            for recipe, item in zip(recipes, items)
+            for name, unit, amount in item['ingredients']
+            if (name, unit) in ingredients
+        ]
+        Recipe.tags.through.objects.bulk_create(tag_links)
+        IngredientInRecipe.objects.bulk_create(amounts)
+        self.after_create(recipes)
+        return len(recipes)
+
+    @staticmethod
+    def create_recipes(items, authors):
+        """Рецепты одним bulk_create, с id и на базах без RETURNING"""
+        recipes = Recipe.objects.bulk_create([
+            Recipe(
+                name=item['name'],
+                text=item['text'],
+                cooking_time=item['cooking_time'],
+                author=authors[item['author']],
+            )
+            for item in items
+        ])
+        if any(recipe.pk is None for recipe in recipes):
+            ids = {
+                (author_id, name): pk
+                for author_id, name, pk in Recipe.objects.filter(
+                    author__in={recipe.author_id for recipe in recipes},
+                    name__in={recipe.name for recipe in recipes},
+                ).order_by('id').values_list('author_id', 'name', 'id')
+            }
+            for recipe in recipes:
+                recipe.pk = ids[(recipe.author_id, recipe.name)]
+        return recipes
+
+    @staticmethod
+    def after_create(recipes):
+        """Счётчики, ленты, маски тегов и поиск для пакета рецептов"""
+        per_author = Counter(recipe.author_id for recipe in recipes)
+        for delta in set(per_author.values()):
+            change_counter(User, 'recipes_count', [
+                author_id for author_id, count in per_author.items()
+                if count == delta
+            ], delta)
+        fan_out_recipes(recipes)
+        recipe_ids = [recipe.pk for recipe in recipes]
+        refresh_tags_masks(recipe_ids)
+        index_recipes(recipe_ids)
+
+
+IMPORTERS = {
+    'ingredients': IngredientImporter,
+    'tags': TagImporter,
+    'recipes': RecipeImporter,
+}
+
+DEFAULT_FORMATS = {
+    'ingredients': 'csv',
+    'tags': 'csv',
+    'recipes': 'json',
+}
 
 
 class Command(BaseCommand):
+    help = 'Пакетная загрузка ингредиентов, тегов и примеров рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--kind', choices=IMPORTERS, default='ingredients',
+            help='Что загружать',
+        )
+        parser.add_argument(
+            '--path',
+            help='Файл с данными, по умолчанию data/<kind>.<format>',
+        )
+        parser.add_argument(
+            '--format', choices=('csv', 'json'),
+            help='Формат файла, по умолчанию по расширению',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Размер пакета для bulk_create',
+        )
+        parser.add_argument(
+            '--author',
+            help='Email автора для рецептов без поля author',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только разобрать файл, ничего не записывая',
+        )
+
+    def get_source(self, options):
+        """Путь и формат файла с учётом значений по умолчанию"""
+        kind = options['kind']
+        file_format = options['format']
+        path = options['path']
+        if path is None:
+            file_format = file_format or DEFAULT_FORMATS[kind]
+            path = os.path.join(
+                settings.BASE_DIR, 'data', f'{kind}.{file_format}'
+            )
+        elif file_format is None:
+            file_format = 'json' if path.endswith(
+                ('.json', '.jsonl')
+            ) else 'csv'
+        if kind == 'recipes' and file_format != 'json':
+            raise CommandError('Рецепты загружаются только из JSON.')
+        return path, file_format
+
+    def load(self, importer, records, options):
+        """Загрузка записей пакетами, возвращает счётчики"""
+        rows = inserted = errors = 0
+        for batch in batches(records, options['batch_size']):
+            objects = []
+            for record in batch:
+                rows += 1
+                try:
+                    objects.append(importer.build(record))
+                except (KeyError, TypeError, ValueError) as error:
+                    errors += 1
+                    self.stderr.write(f'Запись {rows} пропущена: {error!r}')
+            if objects and not options['dry_run']:
+                with transaction.atomic():
+                    inserted += importer.save(objects)
+        return rows, inserted, errors
+
     def handle(self, *args, **options):
-        fill_ingredient_data("data/ingredients.csv")
-        print("fixtures added to DB")
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+        author = options['author']
+        if author and not User.objects.filter(email=author).exists():
+            raise CommandError(f'Пользователь {author} не найден.')
+        kind = options['kind']
+        importer = IMPORTERS[kind](options)
+        path, file_format = self.get_source(options)
+        try:
+            file = open(path, encoding='utf-8')
+        except OSError as error:
+            raise CommandError(f'Не удалось открыть {path}: {error}')
+
+        started = time.monotonic()
+        with file:
+            if file_format == 'csv':
+                records = read_csv(file, importer.fields)
+            else:
+                records = read_json(file)
+            try:
+                rows, inserted, errors = self.load(importer, records, options)
+            except (csv.Error, json.JSONDecodeError) as error:
+                raise CommandError(f'Ошибка чтения {path}: {error}')
+        if inserted and importer.version:
+            bump_version(importer.version)
+        elapsed = time.monotonic() - started
+        skipped = 0 if options['dry_run'] else rows - inserted - errors
+        self.stdout.write(self.style.SUCCESS(
+            f'{kind}: строк {rows}, добавлено {inserted}, '
+            f'пропущено {skipped}, ошибок {errors}, '
+            f'{rows / elapsed if elapsed else rows:.0f} строк/с'
+            + (' (dry run)' if options['dry_run'] else '')
+        ))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import (
+    bump_recipe_versions, generate_variants, get_executor,
+)
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Создание уменьшенных копий для уже загруженных картинок рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Пересоздать уже существующие варианты',
+        )
+
+    def handle(self, *args, **options):
+        names = Recipe.objects.exclude(image='').values_list(
+            'image', flat=True
+        ).iterator()
+        created = failed = 0
+        futures = {
+            get_executor().submit(generate_variants, name, options['force']):
+            name for name in names
+        }
+        for future, name in futures.items():
+            try:
+                files, recipe_ids = future.result()
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f'{name}: {error!r}')
+                continue
+            created += len(files)
+            bump_recipe_versions(recipe_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Картинок {len(futures)}, создано файлов {created}, '
+            f'ошибок {failed}'
+        ))
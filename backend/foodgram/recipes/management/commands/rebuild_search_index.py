@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.search import index_recipes
+
+
+class Command(BaseCommand):
+    help = 'Полная перестройка поискового индекса рецептов'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            index_recipes()
+        self.stdout.write(self.style.SUCCESS('Поисковый индекс перестроен'))
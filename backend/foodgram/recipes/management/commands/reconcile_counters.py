@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.counters import reconcile_counters
+from recipes.shopping import reconcile_shopping_lists
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчёт счётчиков избранного, корзин, рецептов и подписчиков '
+        'и списков покупок'
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            fixed = reconcile_counters()
+            fixed['shoppinglistitem.amount'] = reconcile_shopping_lists()
+        for counter, rows in fixed.items():
+            self.stdout.write(f'{counter}: исправлено {rows}')
+        self.stdout.write(self.style.SUCCESS('Счётчики сверены'))
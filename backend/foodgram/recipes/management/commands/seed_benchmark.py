@@ -0,0 +1,249 @@
+import random
+from collections import defaultdict
+from itertools import accumulate
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.counters import reconcile_counters
+from recipes.models import (Favorite, FeedEntry, Ingredient,
+                            IngredientInRecipe, Recipe, Shopping_cart, Tag)
+from recipes.recommendations import build_recommendations
+from recipes.search import index_recipes
+from recipes.shopping import reconcile_shopping_lists
+from recipes.tagmask import refresh_tags_masks
+from users.models import Subscribe, User
+
+EMAIL_DOMAIN = 'benchmark.foodgram'
+
+
+def power_law(population, exponent, rng):
+    """Накопленные веса Zipf для случайно перемешанной выборки.
+
+    Перемешивание нужно, чтобы популярные объекты не совпадали
+    с первыми по id.
+    """
+    population = list(population)
+    rng.shuffle(population)
+    weights = accumulate(
+        1 / (rank + 1) ** exponent for rank in range(len(population))
+    )
+    return population, list(weights)
+
+
+def draw(rng, population, cum_weights, count):
+    """Не более count различных объектов с учётом весов"""
+    count = min(count, len(population))
+    chosen = {}
+    attempts = count * 4
+    while len(chosen) < count and attempts:
+        for item in rng.choices(population, cum_weights=cum_weights, k=count):
+            chosen.setdefault(item, None)
+        attempts -= 1
+    return list(chosen)[:count]
+
+
+def heavy_tail(rng, mean, limit):
+    """Число связей пользователя с распределением Парето"""
+    alpha = 1.5
+    value = rng.paretovariate(alpha) * mean * (alpha - 1) / alpha
+    return min(int(value), limit)
+
+
+class Command(BaseCommand):
+    help = 'Детерминированный синтетический набор данных для бенчмарков'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--recipes', type=int, default=2000)
+        parser.add_argument(
+            '--favorites', type=float, default=20,
+            help='Среднее число избранных рецептов на пользователя',
+        )
+        parser.add_argument(
+            '--carts', type=float, default=6,
+            help='Среднее число рецептов в списке покупок',
+        )
+        parser.add_argument(
+            '--subscriptions', type=float, default=8,
+            help='Среднее число подписок на пользователя',
+        )
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--flush', action='store_true',
+            help='Удалить ранее созданный набор перед генерацией',
+        )
+
+    def ensure_reference_data(self):
+        """Ингредиенты и теги из data/, если база пустая"""
+        if not Ingredient.objects.exists():
+            call_command('filldb', kind='ingredients', stdout=self.stdout)
+        if not Tag.objects.exists():
+            call_command('filldb', kind='tags', stdout=self.stdout)
+
+    def create_users(self, count, batch_size):
+        password = make_password('benchmark')
+        User.objects.bulk_create(
+            (
+                User(
+                    username=f'bench{index}',
+                    email=f'bench{index}@{EMAIL_DOMAIN}',
+                    first_name='Бенчмарк',
+                    last_name=str(index),
+                    password=password,
+                )
+                for index in range(count)
+            ),
+            batch_size=batch_size,
+        )
+        return list(User.objects.filter(
+            email__endswith=f'@{EMAIL_DOMAIN}'
+        ).order_by('id').values_list('id', flat=True))
+
+    def create_recipes(self, rng, user_ids, count, batch_size):
+        authors, author_weights = power_law(user_ids, 1.0, rng)
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    name=f'Рецепт {index}',
+                    text=f'Описание рецепта {index}. ' * rng.randint(1, 20),
+                    cooking_time=rng.randint(5, 180),
+                    author_id=rng.choices(
+                        authors, cum_weights=author_weights
+                    )[0],
+                )
+                for index in range(count)
+            ),
+            batch_size=batch_size,
+        )
+        return list(Recipe.objects.filter(
+            author_id__in=user_ids
+        ).order_by('id').values_list('id', 'author_id', 'pub_date'))
+
+    def create_compositions(self, rng, recipe_ids, batch_size):
+        """Теги и ингредиенты рецептов"""
+        tag_ids = list(Tag.objects.order_by('id').values_list('id', flat=True))
+        ingredients, weights = power_law(
+            Ingredient.objects.order_by('id').values_list('id', flat=True),
+            0.8, rng,
+        )
+        links = []
+        amounts = []
+        for recipe_id in recipe_ids:
+            tag_count = rng.choices((1, 2, 3), weights=(6, 3, 1))[0]
+            links.extend(
+                Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+                for tag_id in rng.sample(
+                    tag_ids, min(tag_count, len(tag_ids))
+                )
+            )
+            size = max(2, min(20, round(rng.gauss(8, 3))))
+            amounts.extend(
+                IngredientInRecipe(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient_id,
+                    amount=rng.randint(1, 500),
+                )
+                for ingredient_id in draw(rng, ingredients, weights, size)
+            )
+        Recipe.tags.through.objects.bulk_create(links, batch_size=batch_size)
+        IngredientInRecipe.objects.bulk_create(amounts, batch_size=batch_size)
+        return len(amounts)
+
+    def create_links(self, rng, model, user_ids, targets, mean, build,
+                     batch_size, skip_self=False):
+        """Связи пользователей с целями по степенному закону"""
+        population, weights = power_law(targets, 1.1, rng)
+        objects = []
+        for user_id in user_ids:
+            count = heavy_tail(rng, mean, len(population) - 1)
+            objects.extend(
+                build(user_id, target)
+                for target in draw(rng, population, weights, count)
+                if not (skip_self and target == user_id)
+            )
+        model.objects.bulk_create(
+            objects, batch_size=batch_size, ignore_conflicts=True
+        )
+        return len(objects)
+
+    def create_feeds(self, recipes, batch_size):
+        """Ленты подписчиков, как их заполнили бы сигналы"""
+        by_author = defaultdict(list)
+        for recipe_id, author_id, pub_date in reversed(recipes):
+            if len(by_author[author_id]) < settings.FEED_BACKFILL_SIZE:
+                by_author[author_id].append((recipe_id, pub_date))
+        subscriptions = Subscribe.objects.filter(
+            author__subscribers_count__lte=settings.FEED_FANOUT_LIMIT,
+            author_id__in=by_author,
+        ).values_list('subscriber_id', 'author_id').iterator()
+        FeedEntry.objects.bulk_create(
+            (
+                FeedEntry(
+                    subscriber_id=subscriber_id,
+                    recipe_id=recipe_id,
+                    author_id=author_id,
+                    pub_date=pub_date,
+                )
+                for subscriber_id, author_id in subscriptions
+                for recipe_id, pub_date in by_author[author_id]
+            ),
+            batch_size=batch_size,
+            ignore_conflicts=True,
+        )
+
+    def handle(self, *args, **options):
+        generated = User.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}')
+        if generated.exists():
+            if not options['flush']:
+                raise CommandError(
+                    'Набор уже создан, для пересоздания укажите --flush.'
+                )
+            generated.delete()
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        self.ensure_reference_data()
+        with transaction.atomic():
+            user_ids = self.create_users(options['users'], batch_size)
+            recipes = self.create_recipes(
+                rng, user_ids, options['recipes'], batch_size
+            )
+            recipe_ids = [recipe[0] for recipe in recipes]
+            amounts = self.create_compositions(rng, recipe_ids, batch_size)
+            favorites = self.create_links(
+                rng, Favorite, user_ids, recipe_ids, options['favorites'],
+                lambda user, recipe: Favorite(
+                    user_id=user, favorite_id=recipe
+                ),
+                batch_size,
+            )
+            carts = self.create_links(
+                rng, Shopping_cart, user_ids, recipe_ids, options['carts'],
+                lambda user, recipe: Shopping_cart(
+                    user_id=user, purchase_id=recipe
+                ),
+                batch_size,
+            )
+            subscriptions = self.create_links(
+                rng, Subscribe, user_ids, user_ids, options['subscriptions'],
+                lambda user, author: Subscribe(
+                    subscriber_id=user, author_id=author
+                ),
+                batch_size,
+                skip_self=True,
+            )
+            reconcile_counters()
+            reconcile_shopping_lists()
+            self.create_feeds(recipes, batch_size)
+            refresh_tags_masks(recipe_ids)
+            index_recipes(recipe_ids)
+        build_recommendations(full=True)
+        self.stdout.write(self.style.SUCCESS(
+            f'Пользователей {len(user_ids)}, рецептов {len(recipe_ids)}, '
+            f'ингредиентов в рецептах {amounts}, избранного {favorites}, '
+            f'покупок {carts}, подписок {subscriptions}'
+        ))
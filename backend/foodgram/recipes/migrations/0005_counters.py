@@ -0,0 +1,47 @@
+# Generated by Django 3.2.15 on 2026-10-18 17:10
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('recipes', 'Recipe', 'favorites_count', 'recipes', 'Favorite', 'favorite'),
+    ('recipes', 'Recipe', 'carts_count', 'recipes', 'Shopping_cart', 'purchase'),
+    ('users', 'User', 'recipes_count', 'recipes', 'Recipe', 'author'),
+    ('users', 'User', 'subscribers_count', 'users', 'Subscribe', 'author'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for app, model_name, field, source_app, source_name, lookup in COUNTERS:
+        model = apps.get_model(app, model_name)
+        source = apps.get_model(source_app, source_name)
+        model.objects.update(**{field: Coalesce(
+            Subquery(
+                source.objects.filter(**{lookup: OuterRef('pk')}).order_by()
+                .values(lookup).annotate(count=Count('pk')).values('count')
+            ),
+            0,
+        )})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_feedentry'),
+        ('users', '0002_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='carts_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, verbose_name='Количество добавлений в список покупок'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, verbose_name='Количество добавлений в избранное'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 3.2.15 on 2026-10-18 18:40
+
+from django.db import migrations
+
+import recipes.fields
+
+# Индекс и заполнение - копия SQL из recipes/search.py на момент
+# миграции: последующие правки модуля её не меняют.
+INGREDIENT_NAMES = (
+    "SELECT {aggregate} FROM recipes_ingredientinrecipe amount "
+    "JOIN recipes_ingredient ingredient "
+    "ON ingredient.id = amount.ingredient_id "
+    "WHERE amount.recipe_id = recipes_recipe.id"
+)
+
+POSTGRES_FILL = (
+    "UPDATE recipes_recipe SET search_vector = "
+    "setweight(to_tsvector('russian', recipes_recipe.name), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(({}), '')), 'B') || "
+    "setweight(to_tsvector('russian', recipes_recipe.text), 'C')"
+).format(INGREDIENT_NAMES.format(
+    aggregate="string_agg(ingredient.name, ' ')"
+))
+
+SQLITE_FILL = (
+    "INSERT INTO recipes_recipe_fts (rowid, name, text, ingredients) "
+    "SELECT recipes_recipe.id, "
+    "replace(replace(recipes_recipe.name, 'ё', 'е'), 'Ё', 'Е'), "
+    "replace(replace(recipes_recipe.text, 'ё', 'е'), 'Ё', 'Е'), "
+    "replace(replace(coalesce(({}), ''), 'ё', 'е'), 'Ё', 'Е') "
+    "FROM recipes_recipe"
+).format(INGREDIENT_NAMES.format(
+    aggregate="group_concat(ingredient.name, ' ')"
+))
+
+# Для каждой СУБД: команды создания и заполнения поискового индекса
+# и команды его удаления. Колонку search_vector создаёт AddField.
+STATEMENTS = {
+    'postgresql': (
+        (
+            'CREATE INDEX recipe_search_vector_idx ON recipes_recipe '
+            'USING GIN (search_vector)',
+            POSTGRES_FILL,
+        ),
+        (
+            'DROP INDEX IF EXISTS recipe_search_vector_idx',
+        ),
+    ),
+    'sqlite': (
+        (
+            'CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5(name, text, '
+            "ingredients, tokenize = 'unicode61 remove_diacritics 2')",
+            SQLITE_FILL,
+        ),
+        (
+            'DROP TABLE IF EXISTS recipes_recipe_fts',
+        ),
+    ),
+}
+
+
+def create_search_index(apps, schema_editor):
+    forward, _ = STATEMENTS.get(schema_editor.connection.vendor, ((), ()))
+    for sql in forward:
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    _, backward = STATEMENTS.get(schema_editor.connection.vendor, ((), ()))
+    for sql in backward:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=recipes.fields.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
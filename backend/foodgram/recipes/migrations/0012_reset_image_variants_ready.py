@@ -0,0 +1,23 @@
+# Generated by Django 3.2.15 on 2026-10-18 21:05
+
+from django.db import migrations
+
+
+def reset_variants_ready(apps, schema_editor):
+    """Копии, созданные под прежними именами, не находятся по новым:
+    рецепты отдают оригинал до запуска make_image_variants."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.filter(image_variants_ready=True).update(
+        image_variants_ready=False
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_recipe_image_variants_ready'),
+    ]
+
+    operations = [
+        migrations.RunPython(reset_variants_ready, migrations.RunPython.noop),
+    ]
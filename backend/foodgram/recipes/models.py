@@ -1,7 +1,10 @@
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models import Exists, F, OuterRef, Prefetch, Value, Window
+from django.db.models.functions import RowNumber
 
-from users.models import User
+from recipes.fields import SearchVectorField
+from users.models import Subscribe, User
 
 
 class Ingredient(models.Model):
@@ -43,6 +46,100 @@ class Tag(models.Model):
         return self.name
 
 
+USER_FLAGS = ('is_favorited', 'is_in_shopping_cart', 'author_is_subscribed')
+
+# Значения признаков для анонимного пользователя, как в ответах API до
+# аннотаций: избранное и подписка - null, корзина - false.
+ANONYMOUS_FLAGS = {
+    'is_favorited': None,
+    'is_in_shopping_cart': False,
+    'author_is_subscribed': None,
+}
+
+
+class RecipeQuerySet(models.QuerySet):
+    def with_related(self, fields=None):
+        """Автор, теги и ингредиенты с количеством одним набором запросов.
+
+        fields - поля ответа: загружаются только нужные им объекты.
+        """
+        queryset = self
+        if fields is None or 'author' in fields:
+            queryset = queryset.select_related('author')
+        if fields is None or 'tags' in fields:
+            queryset = queryset.prefetch_related(
+                Prefetch('tags', queryset=Tag.objects.order_by('id'))
+            )
+        if fields is None or 'ingredients' in fields:
+            queryset = queryset.prefetch_related(Prefetch(
+                'amounts',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient'
+                ).order_by('id'),
+            ))
+        return queryset
+
+    def with_user_flags(self, user, flags=USER_FLAGS):
+        """Признаки избранного, корзины и подписки на автора"""
+        if not user.is_authenticated:
+            return self.annotate(**{
+                flag: Value(
+                    ANONYMOUS_FLAGS[flag], output_field=models.BooleanField()
+                )
+                for flag in flags
+            })
+        annotations = {
+            'is_favorited': Exists(Favorite.objects.filter(
+                user=user, favorite=OuterRef('pk')
+            )),
+            'is_in_shopping_cart': Exists(Shopping_cart.objects.filter(
+                user=user, purchase=OuterRef('pk')
+            )),
+            'author_is_subscribed': Exists(Subscribe.objects.filter(
+                subscriber=user, author=OuterRef('author')
+            )),
+        }
+        return self.annotate(**{flag: annotations[flag] for flag in flags})
+
+    def previews_by_author(self, author_ids, limit=None):
+        """Первые limit рецептов каждого автора одним запросом.
+
+        Ограничение на автора считается оконной функцией ROW_NUMBER().
+        Возвращает словарь {author_id: [рецепты]}.
+        """
+        if not author_ids:
+            return {}
+        queryset = self.filter(author_id__in=author_ids)
+        if limit is None:
+            recipes = queryset.order_by('author_id', 'id')
+        else:
+            ranked = queryset.annotate(preview_rank=Window(
+                expression=RowNumber(),
+                partition_by=[F('author_id')],
+                order_by=F('id').asc(),
+            )).values(
+                'id', 'name', 'image', 'image_variants_ready', 'cooking_time',
+                'author_id', 'preview_rank',
+            )
+            sql, params = ranked.query.sql_with_params()
+            recipes = self.model.objects.raw(
+                f'SELECT * FROM ({sql}) ranked '
+                f'WHERE preview_rank <= %s '
+                f'ORDER BY author_id, preview_rank',
+                (*params, limit),
+            )
+        previews = {author_id: [] for author_id in author_ids}
+        for recipe in recipes:
+            previews[recipe.author_id].append(recipe)
+        return previews
+
+
+class RecipeManager(models.Manager.from_queryset(RecipeQuerySet)):
+    def get_queryset(self):
+        """Поисковый вектор нужен только в SQL поиска и не загружается"""
+        return super().get_queryset().defer('search_vector')
+
+
 class Recipe(models.Model):
     name = models.CharField(
         max_length=200,
@@ -61,6 +158,11 @@ class Recipe(models.Model):
     pub_date = models.DateTimeField(
         verbose_name='Дата публикации',
         auto_now_add=True)
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+        db_index=True,
+    )
     image = models.ImageField(
         verbose_name='Картинка',
         upload_to='recipes/images/',
@@ -82,6 +184,47 @@ class Recipe(models.Model):
         through='IngredientInRecipe',
         related_name='recipes'
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Количество добавлений в избранное',
+        default=0,
+        db_index=True,
+    )
+    carts_count = models.PositiveIntegerField(
+        verbose_name='Количество добавлений в список покупок',
+        default=0,
+        db_index=True,
+    )
+    interactions_changed_at = models.DateTimeField(
+        verbose_name='Дата изменения избранного и покупок',
+        null=True,
+        blank=True,
+        editable=False,
+        db_index=True,
+    )
+    tags_mask = models.BigIntegerField(
+        verbose_name='Битовая маска тегов',
+        default=0,
+        editable=False,
+    )
+    image_variants_ready = models.BooleanField(
+        verbose_name='Уменьшенные копии картинки созданы',
+        default=False,
+        editable=False,
+    )
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False,
+    )
+
+    objects = RecipeManager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='recipe_pub_date_id_idx'
+            ),
+        ]
 
     def get_ingredients(self):
         return ",".join([str(i) for i in self.ingredient.all()])
@@ -157,3 +300,118 @@ class Shopping_cart(models.Model):
 
     def __str__(self):
         return f' Избранное {self.user}'
+
+
+class ShoppingListItem(models.Model):
+    """Сумма ингредиента по всем рецептам в корзине пользователя.
+
+    Обновляется разницами при изменении корзины и состава рецептов.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.PROTECT,
+        related_name='+',
+        verbose_name='Ингредиент',
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Количество',
+        default=0,
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient} для {self.user}'
+
+
+class FeedEntry(models.Model):
+    """Рецепт в ленте подписчика, записывается при публикации"""
+    subscriber = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Подписчик',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['subscriber', 'recipe'],
+                name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['subscriber', '-pub_date', '-recipe'],
+                name='feed_subscriber_pub_date_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f' Лента {self.subscriber}'
+
+
+class RecipeNeighbour(models.Model):
+    """Похожий рецепт: его часто сохраняют те же пользователи"""
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='neighbours',
+        verbose_name='Рецепт',
+    )
+    neighbour = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Похожий рецепт',
+    )
+    score = models.FloatField(
+        verbose_name='Косинусная близость',
+    )
+    computed_at = models.DateTimeField(
+        verbose_name='Дата расчёта',
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'neighbour'],
+                name='unique_recipe_neighbour'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['recipe', '-score'],
+                name='neighbour_recipe_score_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f' Похожий на {self.recipe_id}: {self.neighbour_id}'
@@ -0,0 +1,235 @@
+import copy
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+
+from recipes.models import IngredientInRecipe, Recipe
+
+# Запас по времени изменения: транзакция, начатая раньше последней
+# проверки, может зафиксироваться позже неё.
+CHANGES_OVERLAP = timedelta(minutes=1)
+
+# Доля изменённых рецептов, после которой индекс перестраивается целиком.
+MAX_OVERRIDES_SHARE = 0.05
+MIN_OVERRIDES = 1000
+
+
+def _rows(queryset):
+    """Пары (рецепт, ингредиент) в виде двух массивов"""
+    pairs = np.array(
+        list(queryset.values_list('recipe_id', 'ingredient_id')),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    return pairs[:, 0], pairs[:, 1]
+
+
+class _PantryState:
+    """Разреженная матрица рецепт x ингредиент и обратный индекс.
+
+    Строки матрицы хранятся в формате CSR: ингредиенты рецепта в позиции p
+    лежат в ingredients[indptr[p]:indptr[p + 1]]. Изменённые после сборки
+    рецепты исключаются маской alive и хранятся отдельно в overrides.
+    """
+
+    def __init__(self, recipes, ingredients, watermark):
+        order = np.lexsort((ingredients, recipes))
+        recipes, ingredients = recipes[order], ingredients[order]
+        self.recipe_ids, starts = np.unique(recipes, return_index=True)
+        self.indptr = np.append(starts, len(recipes))
+        self.ingredients = ingredients
+        self.sizes = np.diff(self.indptr)
+        self.positions = {
+            recipe_id: position
+            for position, recipe_id in enumerate(self.recipe_ids.tolist())
+        }
+        rows = np.repeat(np.arange(len(self.recipe_ids)), self.sizes)
+        by_ingredient = np.argsort(ingredients, kind='stable')
+        keys, key_starts = np.unique(
+            ingredients[by_ingredient], return_index=True
+        )
+        self.postings = dict(zip(
+            keys.tolist(), np.split(rows[by_ingredient], key_starts[1:])
+        ))
+        self.alive = np.ones(len(self.recipe_ids), dtype=bool)
+        self.overrides = {}
+        self._pack_overrides()
+        self.watermark = watermark
+        self.built = self.checked = time.monotonic()
+
+    def with_changes(self, changes, watermark):
+        """Копия состояния с новыми составами рецептов.
+
+        Большие массивы общие, копируются только маска и overrides.
+        """
+        state = copy.copy(self)
+        state.alive = self.alive.copy()
+        state.overrides = dict(self.overrides)
+        for recipe_id, ingredients in changes.items():
+            position = self.positions.get(recipe_id)
+            if position is not None:
+                state.alive[position] = False
+            state.overrides[recipe_id] = ingredients
+        state._pack_overrides()
+        state.watermark = watermark
+        state.checked = time.monotonic()
+        return state
+
+    def _pack_overrides(self):
+        """overrides одним массивом для векторного подсчёта совпадений"""
+        self.override_ids = np.fromiter(
+            self.overrides, dtype=np.int64, count=len(self.overrides)
+        )
+        self.override_sizes = np.array(
+            [len(ingredients) for ingredients in self.overrides.values()],
+            dtype=np.int64,
+        )
+        self.override_rows = np.repeat(
+            np.arange(len(self.override_ids)), self.override_sizes
+        )
+        self.override_ingredients = np.concatenate(
+            [np.zeros(0, dtype=np.int64), *self.overrides.values()]
+        )
+
+    def recipe_ingredients(self, recipe_id):
+        if recipe_id in self.overrides:
+            return self.overrides[recipe_id]
+        position = self.positions[recipe_id]
+        start, end = self.indptr[position], self.indptr[position + 1]
+        return self.ingredients[start:end]
+
+    def score(self, pantry):
+        """id рецептов, число найденных ингредиентов и размер рецепта"""
+        lists = [self.postings[pk] for pk in pantry if pk in self.postings]
+        if lists:
+            hits = np.bincount(
+                np.concatenate(lists), minlength=len(self.recipe_ids)
+            )
+            hits[~self.alive] = 0
+            positions = np.flatnonzero(hits)
+        else:
+            hits = positions = np.zeros(0, dtype=np.int64)
+        recipe_ids = self.recipe_ids[positions]
+        matched = hits[positions]
+        sizes = self.sizes[positions]
+        if self.overrides:
+            found = np.isin(
+                self.override_ingredients, np.fromiter(pantry, dtype=np.int64)
+            )
+            extra_hits = np.bincount(
+                self.override_rows[found], minlength=len(self.override_ids)
+            )
+            extra = np.flatnonzero(extra_hits)
+            recipe_ids = np.concatenate(
+                (recipe_ids, self.override_ids[extra])
+            )
+            matched = np.concatenate((matched, extra_hits[extra]))
+            sizes = np.concatenate((sizes, self.override_sizes[extra]))
+        return recipe_ids, matched, sizes
+
+
+class PantryIndex:
+    """Подбор рецептов по имеющимся продуктам в памяти процесса.
+
+    Рецепты ранжируются по доле имеющихся ингредиентов, затем по числу
+    недостающих и совпавших. Изменённые рецепты подгружаются по
+    Recipe.updated_at не чаще раза в PANTRY_REFRESH_SECONDS, полная
+    перестройка идёт раз в PANTRY_REBUILD_SECONDS или когда изменений
+    накопилось много.
+    """
+
+    def __init__(self):
+        self._state = None
+        self._lock = threading.Lock()
+
+    # Индекс и отметка времени читаются из основной базы: с отстающей
+    # реплики изменения до отметки потерялись бы навсегда.
+    @staticmethod
+    def _build():
+        watermark = timezone.now()
+        recipes, ingredients = _rows(
+            IngredientInRecipe.objects.using(DEFAULT_DB_ALIAS)
+        )
+        return _PantryState(recipes, ingredients, watermark)
+
+    @staticmethod
+    def _refresh(state):
+        changed = dict(Recipe.objects.using(DEFAULT_DB_ALIAS).filter(
+            updated_at__gt=state.watermark - CHANGES_OVERLAP
+        ).values_list('id', 'updated_at'))
+        if not changed:
+            state.checked = time.monotonic()
+            return state
+        recipes, ingredients = _rows(
+            IngredientInRecipe.objects.using(DEFAULT_DB_ALIAS).filter(
+                recipe_id__in=changed
+            )
+        )
+        changes = {
+            recipe_id: ingredients[recipes == recipe_id]
+            for recipe_id in changed
+        }
+        return state.with_changes(
+            changes, max(state.watermark, max(changed.values()))
+        )
+
+    def _is_stale(self, state):
+        now = time.monotonic()
+        limit = max(MIN_OVERRIDES, MAX_OVERRIDES_SHARE * len(state.alive))
+        return (
+            now - state.built > settings.PANTRY_REBUILD_SECONDS
+            or len(state.overrides) > limit
+        )
+
+    def _get_state(self):
+        state = self._state
+        if state is not None and (
+            time.monotonic() - state.checked < settings.PANTRY_REFRESH_SECONDS
+        ):
+            return state
+        with self._lock:
+            state = self._state
+            if state is None or self._is_stale(state):
+                self._state = self._build()
+            elif (
+                time.monotonic() - state.checked
+                >= settings.PANTRY_REFRESH_SECONDS
+            ):
+                self._state = self._refresh(state)
+            return self._state
+
+    def match(self, pantry, limit=20):
+        """Лучшие рецепты для набора ингредиентов.
+
+        Возвращает список (id рецепта, найдено, всего, id недостающих).
+        """
+        pantry = set(pantry)
+        if not pantry:
+            return []
+        state = self._get_state()
+        recipe_ids, matched, sizes = state.score(pantry)
+        coverage = matched / np.maximum(sizes, 1)
+        order = np.lexsort(
+            (-recipe_ids, -matched, sizes - matched, -coverage)
+        )[:limit]
+        pantry_array = np.fromiter(pantry, dtype=np.int64)
+        return [
+            (
+                recipe_id,
+                int(matched[position]),
+                int(sizes[position]),
+                np.setdiff1d(
+                    state.recipe_ingredients(recipe_id), pantry_array
+                ).tolist(),
+            )
+            for position, recipe_id in zip(
+                order.tolist(), recipe_ids[order].tolist()
+            )
+        ]
+
+
+pantry_index = PantryIndex()
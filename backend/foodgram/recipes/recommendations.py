@@ -0,0 +1,187 @@
+from datetime import timedelta
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Max, Sum
+from django.utils import timezone
+from scipy import sparse
+
+from recipes.models import Favorite, Recipe, RecipeNeighbour, Shopping_cart
+
+# Запас по времени: избранное, добавленное во время прошлого расчёта,
+# могло не попасть в матрицу.
+CHANGES_OVERLAP = timedelta(minutes=5)
+
+
+def _interactions(model, recipe_field, weight):
+    pairs = np.array(
+        list(model.objects.values_list('user_id', recipe_field)),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    return pairs[:, 0], pairs[:, 1], np.full(len(pairs), weight)
+
+
+def build_matrix(cart_weight):
+    """Матрица пользователь x рецепт с нормированными столбцами.
+
+    Избранное весит 1, список покупок - cart_weight. Возвращает матрицу
+    в формате CSC и id рецептов, соответствующие её столбцам.
+    """
+    users, recipes, weights = (
+        np.concatenate(parts) for parts in zip(
+            _interactions(Favorite, 'favorite_id', 1.0),
+            _interactions(Shopping_cart, 'purchase_id', cart_weight),
+        )
+    )
+    user_ids, rows = np.unique(users, return_inverse=True)
+    recipe_ids, columns = np.unique(recipes, return_inverse=True)
+    matrix = sparse.csc_matrix(
+        (weights, (rows, columns)),
+        shape=(len(user_ids), len(recipe_ids)),
+    )
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0))).ravel()
+    norms[norms == 0] = 1
+    return matrix @ sparse.diags(1 / norms), recipe_ids
+
+
+def top_neighbours(matrix, recipe_ids, columns, limit):
+    """Косинусная близость рецептов columns ко всем остальным.
+
+    Возвращает для каждого столбца список (id соседа, близость)
+    из limit лучших.
+    """
+    similarity = (matrix[:, columns].T @ matrix).tocsr()
+    result = []
+    for row, column in enumerate(columns):
+        start, end = similarity.indptr[row], similarity.indptr[row + 1]
+        neighbours = similarity.indices[start:end]
+        scores = similarity.data[start:end]
+        keep = neighbours != column
+        neighbours, scores = neighbours[keep], scores[keep]
+        if len(scores) > limit:
+            best = np.argpartition(-scores, limit)[:limit]
+            neighbours, scores = neighbours[best], scores[best]
+        order = np.argsort(-scores, kind='stable')
+        result.append([
+            (recipe_id, score)
+            for recipe_id, score in zip(
+                recipe_ids[neighbours[order]].tolist(),
+                scores[order].tolist(),
+            )
+        ])
+    return result
+
+
+def changed_recipes(since):
+    return Recipe.objects.filter(
+        interactions_changed_at__gt=since - CHANGES_OVERLAP
+    ).values_list('id', flat=True)
+
+
+def affected_recipes(matrix, recipe_ids, changed):
+    """Рецепты, чьи списки похожих зависят от изменившихся changed.
+
+    Близость симметрична: изменение рецепта меняет его близость ко всем
+    рецептам с общими пользователями, а из списков, где он стоит сейчас,
+    он может выпасть. Возвращает отсортированные id из recipe_ids.
+    """
+    present = changed[np.isin(changed, recipe_ids)]
+    users = np.unique(
+        matrix[:, np.searchsorted(recipe_ids, present)].nonzero()[0]
+    )
+    related = recipe_ids[np.unique(matrix.tocsr()[users].nonzero()[1])]
+    listing = np.fromiter(
+        RecipeNeighbour.objects.filter(
+            neighbour_id__in=changed.tolist()
+        ).values_list('recipe_id', flat=True).distinct(),
+        dtype=np.int64,
+    )
+    targets = np.union1d(np.union1d(present, related), listing)
+    return targets[np.isin(targets, recipe_ids)]
+
+
+def last_build():
+    return RecipeNeighbour.objects.aggregate(
+        last=Max('computed_at')
+    )['last']
+
+
+def build_recommendations(limit=20, chunk_size=500, cart_weight=0.5,
+                          full=False):
+    """Пересчёт таблицы похожих рецептов.
+
+    Без full пересчитываются рецепты, у которых избранное или списки
+    покупок менялись после прошлого расчёта, и рецепты, на близость
+    к которым это влияет. Возвращает число пересчитанных рецептов.
+    """
+    started = timezone.now()
+    since = None if full else last_build()
+    matrix, recipe_ids = build_matrix(cart_weight)
+    if since is None:
+        targets = recipe_ids
+    else:
+        changed = np.array(sorted(changed_recipes(since)), dtype=np.int64)
+        without_interactions = changed[~np.isin(changed, recipe_ids)]
+        targets = affected_recipes(matrix, recipe_ids, changed)
+        RecipeNeighbour.objects.filter(
+            recipe_id__in=without_interactions.tolist()
+        ).delete()
+    columns = np.searchsorted(recipe_ids, targets)
+    for start in range(0, len(targets), chunk_size):
+        chunk = targets[start:start + chunk_size].tolist()
+        neighbours = top_neighbours(
+            matrix, recipe_ids, columns[start:start + chunk_size], limit
+        )
+        with transaction.atomic():
+            RecipeNeighbour.objects.filter(recipe_id__in=chunk).delete()
+            RecipeNeighbour.objects.bulk_create(
+                (
+                    RecipeNeighbour(
+                        recipe_id=recipe_id,
+                        neighbour_id=neighbour_id,
+                        score=score,
+                        computed_at=started,
+                    )
+                    for recipe_id, rows in zip(chunk, neighbours)
+                    for neighbour_id, score in rows
+                ),
+                batch_size=1000,
+            )
+    if since is None:
+        RecipeNeighbour.objects.filter(computed_at__lt=started).delete()
+    return len(targets)
+
+
+def similar_recipes(recipe_id, limit):
+    """id похожих рецептов по убыванию близости"""
+    return list(RecipeNeighbour.objects.filter(
+        recipe_id=recipe_id
+    ).order_by('-score', 'neighbour_id').values_list(
+        'neighbour_id', flat=True
+    )[:limit])
+
+
+def recommended_recipes(user, limit):
+    """id рецептов, близких к избранному и списку покупок пользователя.
+
+    Близости к разным рецептам пользователя складываются, уже отмеченные
+    рецепты не предлагаются. Без истории - самые популярные рецепты.
+    """
+    seeds = Favorite.objects.filter(user=user).values('favorite_id').union(
+        Shopping_cart.objects.filter(user=user).values('purchase_id')
+    )
+    seeds = [seed['favorite_id'] for seed in seeds]
+    ids = list(RecipeNeighbour.objects.filter(
+        recipe_id__in=seeds
+    ).exclude(neighbour_id__in=seeds).values('neighbour_id').annotate(
+        total=Sum('score')
+    ).order_by('-total', 'neighbour_id').values_list(
+        'neighbour_id', flat=True
+    )[:limit])
+    if len(ids) < limit:
+        ids += Recipe.objects.exclude(
+            id__in=seeds + ids
+        ).order_by('-favorites_count', 'id').values_list(
+            'id', flat=True
+        )[:limit - len(ids)]
+    return ids
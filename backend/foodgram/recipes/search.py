@@ -0,0 +1,157 @@
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Value
+from django.db.models.expressions import RawSQL
+
+POSTGRES_CONFIG = 'russian'
+
+SQLITE_TABLE = 'recipes_recipe_fts'
+
+# Вес совпадений в названии, описании и ингредиентах для bm25.
+SQLITE_WEIGHTS = (10.0, 1.0, 5.0)
+
+CHUNK_SIZE = 500
+
+_WORD = re.compile(r'\w+')
+
+# Документ рецепта: название, описание и названия ингредиентов.
+_INGREDIENT_NAMES = (
+    "SELECT {aggregate} FROM recipes_ingredientinrecipe amount "
+    "JOIN recipes_ingredient ingredient "
+    "ON ingredient.id = amount.ingredient_id "
+    "WHERE amount.recipe_id = recipes_recipe.id"
+)
+
+
+def _weighted(expression, weight):
+    return (
+        f"setweight(to_tsvector(%(config)s::regconfig, {expression}), "
+        f"'{weight}')"
+    )
+
+
+_POSTGRES_UPDATE = 'UPDATE recipes_recipe SET search_vector = ' + ' || '.join((
+    _weighted('recipes_recipe.name', 'A'),
+    _weighted("coalesce(({}), '')".format(_INGREDIENT_NAMES.format(
+        aggregate="string_agg(ingredient.name, ' ')"
+    )), 'B'),
+    _weighted('recipes_recipe.text', 'C'),
+))
+
+
+def _without_yo(expression):
+    """Замена ё на е: токенизатор unicode61 их не отождествляет"""
+    return f"replace(replace({expression}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+_SQLITE_INSERT = (
+    "INSERT INTO {table} (rowid, name, text, ingredients) "
+    "SELECT recipes_recipe.id, {name}, {text}, {ingredients} "
+    "FROM recipes_recipe"
+).format(
+    table=SQLITE_TABLE,
+    name=_without_yo('recipes_recipe.name'),
+    text=_without_yo('recipes_recipe.text'),
+    ingredients=_without_yo("coalesce(({}), '')".format(
+        _INGREDIENT_NAMES.format(
+            aggregate="group_concat(ingredient.name, ' ')"
+        )
+    )),
+)
+
+
+def _chunks(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), CHUNK_SIZE):
+        yield ids[start:start + CHUNK_SIZE]
+
+
+def index_recipes(recipe_ids=None):
+    """Обновление поискового индекса рецептов.
+
+    Без recipe_ids индекс перестраивается целиком.
+    """
+    vendor = connection.vendor
+    with connection.cursor() as cursor:
+        if recipe_ids is None:
+            if vendor == 'postgresql':
+                cursor.execute(_POSTGRES_UPDATE, {'config': POSTGRES_CONFIG})
+            elif vendor == 'sqlite':
+                cursor.execute(f'DELETE FROM {SQLITE_TABLE}')
+                cursor.execute(_SQLITE_INSERT)
+            return
+        for chunk in _chunks(recipe_ids):
+            if vendor == 'postgresql':
+                cursor.execute(
+                    f'{_POSTGRES_UPDATE} '
+                    f'WHERE recipes_recipe.id = ANY(%(ids)s)',
+                    {'config': POSTGRES_CONFIG, 'ids': chunk},
+                )
+            elif vendor == 'sqlite':
+                placeholders = ', '.join(['%s'] * len(chunk))
+                cursor.execute(
+                    f'DELETE FROM {SQLITE_TABLE} '
+                    f'WHERE rowid IN ({placeholders})',
+                    chunk,
+                )
+                cursor.execute(
+                    f'{_SQLITE_INSERT} '
+                    f'WHERE recipes_recipe.id IN ({placeholders})',
+                    chunk,
+                )
+
+
+def unindex_recipe(recipe_id):
+    """Удаление рецепта из индекса SQLite.
+
+    В PostgreSQL вектор хранится в строке рецепта и удаляется с ней.
+    """
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {SQLITE_TABLE} WHERE rowid = %s', (recipe_id,)
+            )
+
+
+def _fts5_query(text):
+    """Запрос FTS5 из слов пользователя: все слова, каждое как префикс"""
+    words = _WORD.findall(text.lower().replace('ё', 'е'))
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_recipes(queryset, text):
+    """Рецепты, подходящие под запрос, с релевантностью search_rank"""
+    vendor = connection.vendor
+    if vendor == 'postgresql':
+        query = 'plainto_tsquery(%s::regconfig, %s)'
+        params = (POSTGRES_CONFIG, text)
+        return queryset.filter(RawSQL(
+            f'recipes_recipe.search_vector @@ {query}', params,
+            output_field=BooleanField(),
+        )).annotate(search_rank=RawSQL(
+            f'ts_rank(recipes_recipe.search_vector, {query})', params,
+            output_field=FloatField(),
+        ))
+    if vendor == 'sqlite':
+        query = _fts5_query(text)
+        if not query:
+            return queryset.annotate(
+                search_rank=Value(0.0, output_field=FloatField())
+            ).none()
+        weights = ', '.join(str(weight) for weight in SQLITE_WEIGHTS)
+        return queryset.filter(RawSQL(
+            f'recipes_recipe.id IN (SELECT rowid FROM {SQLITE_TABLE} '
+            f'WHERE {SQLITE_TABLE} MATCH %s)',
+            (query,),
+            output_field=BooleanField(),
+        )).annotate(search_rank=RawSQL(
+            f'(SELECT -bm25({SQLITE_TABLE}, {weights}) FROM {SQLITE_TABLE} '
+            f'WHERE {SQLITE_TABLE} MATCH %s '
+            f'AND rowid = recipes_recipe.id)',
+            (query,),
+            output_field=FloatField(),
+        ))
+    return queryset.filter(name__icontains=text).annotate(
+        search_rank=Value(1.0, output_field=FloatField())
+    )
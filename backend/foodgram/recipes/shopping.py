@@ -0,0 +1,158 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Greatest
+
+from recipes.models import IngredientInRecipe, Shopping_cart, ShoppingListItem
+from recipes.versions import bump_on_commit
+
+CHUNK_SIZE = 500
+
+
+def list_version(user_id):
+    return f'shopping_list:{user_id}'
+
+
+def recipes_amounts(recipe_ids):
+    """Суммарный состав рецептов {id ингредиента: количество}"""
+    return dict(IngredientInRecipe.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('ingredient_id').annotate(
+        total=Sum('amount')
+    ).order_by())
+
+
+@transaction.atomic
+def apply_deltas(user_ids, deltas):
+    """Изменение списков покупок пользователей на deltas.
+
+    deltas - словарь {id ингредиента: изменение количества}. Три запроса
+    независимо от числа ингредиентов.
+    """
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not user_ids or not deltas:
+        return
+    ShoppingListItem.objects.bulk_create(
+        [
+            ShoppingListItem(user_id=user_id, ingredient_id=pk)
+            for user_id in user_ids
+            for pk, delta in deltas.items() if delta > 0
+        ],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+    items = ShoppingListItem.objects.filter(
+        user_id__in=user_ids, ingredient_id__in=deltas
+    )
+    items.update(amount=Greatest(
+        F('amount') + Case(
+            *(When(ingredient_id=pk, then=Value(delta))
+              for pk, delta in deltas.items()),
+            output_field=IntegerField(),
+        ),
+        0,
+    ))
+    items.filter(amount=0).delete()
+
+
+def add_recipes(user_id, recipe_ids, sign=1):
+    """Рецепты добавлены в корзину (sign=1) или убраны из неё (sign=-1)"""
+    if not recipe_ids:
+        return
+    apply_deltas([user_id], {
+        pk: sign * amount
+        for pk, amount in recipes_amounts(recipe_ids).items()
+    })
+    bump_on_commit(list_version(user_id))
+
+
+def change_recipe(recipe_id, old_amounts, new_amounts):
+    """Изменение состава рецепта во всех корзинах, где он лежит"""
+    deltas = Counter(new_amounts)
+    deltas.subtract(old_amounts)
+    if not any(deltas.values()):
+        return
+    user_ids = list(Shopping_cart.objects.filter(
+        purchase_id=recipe_id
+    ).values_list('user_id', flat=True))
+    for start in range(0, len(user_ids), CHUNK_SIZE):
+        apply_deltas(user_ids[start:start + CHUNK_SIZE], deltas)
+    if user_ids:
+        bump_on_commit(*(list_version(user_id) for user_id in user_ids))
+
+
+def shopping_list(user):
+    """Строки списка покупок: название, единица и количество"""
+    return ShoppingListItem.objects.filter(user=user).values(
+        'ingredient_id', 'amount',
+        name=F('ingredient__name'),
+        measurement_unit=F('ingredient__measurement_unit'),
+    ).order_by('ingredient__name', 'ingredient__measurement_unit')
+
+
+def _actual_totals(user_ids):
+    return {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total in Shopping_cart.objects.filter(
+            user_id__in=user_ids,
+            purchase__amounts__isnull=False,
+        ).values_list(
+            'user_id', 'purchase__amounts__ingredient_id',
+        ).annotate(
+            total=Sum('purchase__amounts__amount'),
+        ).order_by()
+    }
+
+
+def _fix_chunk(user_ids):
+    """Исправление списков пользователей user_ids, возвращает число строк"""
+    actual = _actual_totals(user_ids)
+    stored = {
+        (user_id, ingredient_id): (pk, amount)
+        for pk, user_id, ingredient_id, amount in
+        ShoppingListItem.objects.filter(user_id__in=user_ids).values_list(
+            'id', 'user_id', 'ingredient_id', 'amount'
+        )
+    }
+    stale = [key for key in stored if key not in actual]
+    changed = [
+        key for key, total in actual.items()
+        if key not in stored or stored[key][1] != total
+    ]
+    ShoppingListItem.objects.filter(
+        id__in=[stored[key][0] for key in stale]
+    ).delete()
+    ShoppingListItem.objects.bulk_update(
+        [
+            ShoppingListItem(pk=stored[key][0], amount=actual[key])
+            for key in changed if key in stored
+        ],
+        ['amount'],
+        batch_size=500,
+    )
+    ShoppingListItem.objects.bulk_create(
+        [
+            ShoppingListItem(
+                user_id=user_id, ingredient_id=pk, amount=actual[user_id, pk]
+            )
+            for user_id, pk in changed if (user_id, pk) not in stored
+        ],
+        batch_size=1000,
+    )
+    fixed_users = {user_id for user_id, _ in stale + changed}
+    if fixed_users:
+        bump_on_commit(*(list_version(user_id) for user_id in fixed_users))
+    return len(stale) + len(changed)
+
+
+def reconcile_shopping_lists():
+    """Пересчёт списков покупок по корзинам, возвращает число исправлений"""
+    user_ids = sorted(
+        set(Shopping_cart.objects.values_list('user_id', flat=True))
+        | set(ShoppingListItem.objects.values_list('user_id', flat=True))
+    )
+    fixed = 0
+    for start in range(0, len(user_ids), CHUNK_SIZE):
+        fixed += _fix_chunk(user_ids[start:start + CHUNK_SIZE])
+    return fixed
@@ -0,0 +1,186 @@
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from recipes.counters import change_counter
+from recipes.feed import backfill_feed, fan_out_recipe, prune_feed
+from recipes.images import has_variants, schedule_variants
+from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                            Shopping_cart, Tag)
+from recipes.search import index_recipes, unindex_recipe
+from recipes.shopping import add_recipes
+from recipes.tagmask import drop_tag_bit, refresh_tags_masks
+from recipes.versions import bump_on_commit
+from users.models import Subscribe, User
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    bump_on_commit('ingredient')
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tag_changed(sender, **kwargs):
+    bump_on_commit('tag')
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_saved(sender, instance, **kwargs):
+    name = instance.image.name
+    if not name:
+        return
+    ready = has_variants(name)
+    if ready != instance.image_variants_ready:
+        Recipe.objects.filter(pk=instance.pk).update(
+            image_variants_ready=ready
+        )
+        instance.image_variants_ready = ready
+    if not ready:
+        transaction.on_commit(lambda: schedule_variants(name))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_published(sender, instance, created, **kwargs):
+    if created:
+        fan_out_recipe(instance)
+
+
+@receiver(post_save, sender=Subscribe)
+def subscription_added(sender, instance, created, **kwargs):
+    if created:
+        backfill_feed(instance.subscriber_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Subscribe)
+def subscription_removed(sender, instance, **kwargs):
+    prune_feed(instance.subscriber_id, instance.author_id)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    bump_on_commit(f'recipe:{instance.pk}')
+
+
+@receiver((post_save, post_delete), sender=IngredientInRecipe)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    bump_on_commit(f'recipe:{instance.recipe_id}')
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        bump_on_commit(f'recipe:{instance.pk}')
+    elif pk_set:
+        bump_on_commit(*(f'recipe:{pk}' for pk in pk_set))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_masked(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        refresh_tags_masks([instance.pk])
+    elif action == 'post_clear':
+        drop_tag_bit(instance.pk)
+    elif pk_set:
+        refresh_tags_masks(pk_set)
+
+
+@receiver(post_delete, sender=Tag)
+def tag_unmasked(sender, instance, **kwargs):
+    drop_tag_bit(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, created, update_fields, **kwargs):
+    if created or update_fields == frozenset(('last_login',)):
+        return
+    recipe_ids = Recipe.objects.filter(author=instance).values_list(
+        'id', flat=True
+    )
+    if recipe_ids:
+        bump_on_commit(*(f'recipe:{pk}' for pk in recipe_ids))
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+def favorite_counted(sender, instance, created=False, **kwargs):
+    if kwargs['signal'] is post_delete or created:
+        change_counter(
+            Recipe, 'favorites_count', [instance.favorite_id],
+            1 if created else -1,
+            interactions_changed_at=timezone.now(),
+        )
+
+
+@receiver((post_save, post_delete), sender=Shopping_cart)
+def cart_counted(sender, instance, created=False, **kwargs):
+    if kwargs['signal'] is post_delete or created:
+        change_counter(
+            Recipe, 'carts_count', [instance.purchase_id],
+            1 if created else -1,
+            interactions_changed_at=timezone.now(),
+        )
+
+
+@receiver(post_save, sender=Shopping_cart)
+def cart_item_listed(sender, instance, created, **kwargs):
+    if created:
+        add_recipes(instance.user_id, [instance.purchase_id])
+
+
+@receiver(pre_delete, sender=Shopping_cart)
+def cart_item_unlisted(sender, instance, **kwargs):
+    # До удаления: при удалении рецепта его ингредиенты удаляются вместе
+    # с корзинами, и после них разницу было бы не посчитать.
+    add_recipes(instance.user_id, [instance.purchase_id], -1)
+
+
+@receiver((post_save, post_delete), sender=Subscribe)
+def subscriber_counted(sender, instance, created=False, **kwargs):
+    if kwargs['signal'] is post_delete or created:
+        change_counter(
+            User, 'subscribers_count', [instance.author_id],
+            1 if created else -1,
+        )
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_counted(sender, instance, created=False, **kwargs):
+    if kwargs['signal'] is post_delete or created:
+        change_counter(
+            User, 'recipes_count', [instance.author_id],
+            1 if created else -1,
+        )
+
+
+def index_on_commit(recipe_ids):
+    recipe_ids = list(recipe_ids)
+    if recipe_ids:
+        transaction.on_commit(lambda: index_recipes(recipe_ids))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_indexed(sender, instance, **kwargs):
+    index_on_commit([instance.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_unindexed(sender, instance, **kwargs):
+    unindex_recipe(instance.pk)
+
+
+@receiver((post_save, post_delete), sender=IngredientInRecipe)
+def recipe_ingredient_indexed(sender, instance, **kwargs):
+    index_on_commit([instance.recipe_id])
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_indexed(sender, instance, created, **kwargs):
+    if not created:
+        index_on_commit(
+            instance.amounts.values_list('recipe_id', flat=True)
+        )
@@ -0,0 +1,116 @@
+import threading
+from collections import defaultdict
+
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import F
+
+from recipes.models import Recipe, Tag
+from recipes.versions import local_version
+
+# Бит тега равен id - 1, старший бит BigIntegerField не используется.
+MAX_TAG_ID = 63
+
+TAGS_MODES = ('any', 'all')
+
+
+def tag_bit(tag_id):
+    """Бит тега в маске или 0, если тег в маску не помещается"""
+    if 0 < tag_id <= MAX_TAG_ID:
+        return 1 << (tag_id - 1)
+    return 0
+
+
+def tags_mask(tag_ids):
+    mask = 0
+    for tag_id in tag_ids:
+        mask |= tag_bit(tag_id)
+    return mask
+
+
+def refresh_tags_masks(recipe_ids):
+    """Пересчёт масок рецептов по таблице связей с тегами"""
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    tags = defaultdict(list)
+    for recipe_id, tag_id in Recipe.tags.through.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('recipe_id', 'tag_id'):
+        tags[recipe_id].append(tag_id)
+    Recipe.objects.bulk_update(
+        [
+            Recipe(pk=recipe_id, tags_mask=tags_mask(tags[recipe_id]))
+            for recipe_id in recipe_ids
+        ],
+        ['tags_mask'],
+        batch_size=500,
+    )
+
+
+def drop_tag_bit(tag_id):
+    """Снятие бита тега со всех рецептов, например при удалении тега"""
+    bit = tag_bit(tag_id)
+    if bit:
+        Recipe.objects.alias(
+            tag_match=F('tags_mask').bitand(bit)
+        ).filter(tag_match__gt=0).update(
+            tags_mask=F('tags_mask').bitand(~bit)
+        )
+
+
+class TagSlugMap:
+    """Соответствие slug -> id тегов в памяти процесса.
+
+    Перечитывается из основной базы, когда меняется версия набора тегов
+    (без общего кэша - и по истечении LOCAL_INDEX_TTL): реплика может
+    ещё не знать об изменении.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = (None, {})
+
+    def resolve(self, slugs):
+        """id известных тегов из списка slug"""
+        version = local_version('tag')
+        current, ids = self._state
+        if current != version:
+            with self._lock:
+                current, ids = self._state
+                if current != version:
+                    ids = dict(Tag.objects.using(
+                        DEFAULT_DB_ALIAS
+                    ).values_list('slug', 'id'))
+                    self._state = (version, ids)
+        return [ids[slug] for slug in slugs if slug in ids]
+
+
+tag_slugs = TagSlugMap()
+
+
+def _filter_by_links(queryset, tag_ids, mode):
+    """Запасной путь через таблицу связей для тегов вне маски"""
+    links = Recipe.tags.through.objects.values('recipe_id')
+    if mode == 'all':
+        for tag_id in tag_ids:
+            queryset = queryset.filter(id__in=links.filter(tag_id=tag_id))
+        return queryset
+    return queryset.filter(id__in=links.filter(tag_id__in=tag_ids))
+
+
+def filter_by_tags(queryset, slugs, mode='any'):
+    """Рецепты с любым (any) или со всеми (all) тегами из списка.
+
+    Проверяется маска рецепта, без соединения с таблицей тегов и DISTINCT.
+    """
+    slugs = set(slugs)
+    tag_ids = tag_slugs.resolve(slugs)
+    if not tag_ids or (mode == 'all' and len(tag_ids) < len(slugs)):
+        return queryset.none()
+    if not all(tag_bit(tag_id) for tag_id in tag_ids):
+        return _filter_by_links(queryset, tag_ids, mode)
+    mask = tags_mask(tag_ids)
+    queryset = queryset.alias(tag_match=F('tags_mask').bitand(mask))
+    if mode == 'all':
+        return queryset.filter(tag_match=mask)
+    return queryset.filter(tag_match__gt=0)
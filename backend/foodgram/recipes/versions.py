@@ -0,0 +1,92 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+def _version_key(name):
+    return f'version:{name}'
+
+
+def _modified_key(name):
+    return f'modified:{name}'
+
+
+def _initial_version():
+    """Начальное значение счётчика.
+
+    Берётся от текущего времени, чтобы после потери ключа в кэше
+    версия не повторила уже выданную ранее.
+    """
+    return int(time.time() * 1000)
+
+
+def get_version(name):
+    """Текущая версия набора данных"""
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def local_version(name):
+    """Версия для индексов в памяти процесса.
+
+    Кэш в памяти процесса не узнаёт о сменах версий в других воркерах,
+    поэтому без общего кэша к версии добавляется номер интервала
+    LOCAL_INDEX_TTL: индекс перечитывается не реже раза за интервал.
+    """
+    version = get_version(name)
+    if settings.SHARED_CACHE:
+        return version
+    return version, int(time.time() // settings.LOCAL_INDEX_TTL)
+
+
+def get_versions(names):
+    """Версии и время изменения нескольких наборов одним запросом к кэшу.
+
+    Возвращает словарь {имя: (версия, время изменения)}.
+    """
+    keys = {}
+    for name in names:
+        keys[name] = (_version_key(name), _modified_key(name))
+    values = cache.get_many(
+        [key for pair in keys.values() for key in pair]
+    )
+    versions = {}
+    for name, (version_key, modified_key) in keys.items():
+        version = values.get(version_key)
+        modified = values.get(modified_key)
+        if version is None:
+            version = get_version(name)
+        if modified is None:
+            modified = time.time()
+            cache.add(modified_key, modified, None)
+        versions[name] = (version, modified)
+    return versions
+
+
+def bump_version(name):
+    """Увеличение версии набора данных после изменения"""
+    key = _version_key(name)
+    cache.set(_modified_key(name), time.time(), None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, _initial_version(), None)
+        return cache.incr(key)
+
+
+def bump_on_commit(*names):
+    """Увеличение версий после фиксации транзакции.
+
+    Иначе параллельный запрос успеет закэшировать старые данные
+    под новой версией.
+    """
+    def bump():
+        for name in names:
+            bump_version(name)
+    transaction.on_commit(bump)
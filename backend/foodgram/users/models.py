@@ -42,6 +42,14 @@ class User(AbstractUser):
     email = models.EmailField(
         unique=True
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Количество рецептов',
+        default=0,
+    )
+    subscribers_count = models.PositiveIntegerField(
+        verbose_name='Количество подписчиков',
+        default=0,
+    )
 
     USERNAME_FIELD = 'email'
 